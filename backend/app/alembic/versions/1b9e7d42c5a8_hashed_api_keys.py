@@ -0,0 +1,61 @@
+"""store api keys as HMAC-SHA256 hashes with a display prefix
+
+Revision ID: 1b9e7d42c5a8
+Revises: f0a6d3b95e17
+Create Date: 2026-10-19 16:48:03.527719
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+from app.core.security import api_key_prefix, hash_api_key
+
+
+# revision identifiers, used by Alembic.
+revision = "1b9e7d42c5a8"
+down_revision = "f0a6d3b95e17"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "user",
+        sa.Column("api_key_hash", sqlmodel.sql.sqltypes.AutoString(length=64), nullable=True),
+    )
+    op.add_column(
+        "user",
+        sa.Column("api_key_prefix", sqlmodel.sql.sqltypes.AutoString(length=16), nullable=True),
+    )
+
+    # hash existing keys so they keep working, then drop the plaintext
+    conn = op.get_bind()
+    rows = conn.execute(
+        sa.text('SELECT id, api_key FROM "user" WHERE api_key IS NOT NULL')
+    ).all()
+    for user_id, api_key in rows:
+        conn.execute(
+            sa.text(
+                'UPDATE "user" SET api_key_hash = :hash, api_key_prefix = :prefix '
+                "WHERE id = :id"
+            ),
+            {"hash": hash_api_key(api_key), "prefix": api_key_prefix(api_key), "id": user_id},
+        )
+
+    op.create_index(op.f("ix_user_api_key_hash"), "user", ["api_key_hash"], unique=True)
+    op.drop_index(op.f("ix_user_api_key"), table_name="user")
+    op.drop_column("user", "api_key")
+
+
+def downgrade():
+    # plaintext keys cannot be recovered from their hashes; users must issue new keys
+    op.add_column(
+        "user",
+        sa.Column("api_key", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    )
+    op.create_index(op.f("ix_user_api_key"), "user", ["api_key"], unique=True)
+    op.drop_index(op.f("ix_user_api_key_hash"), table_name="user")
+    op.drop_column("user", "api_key_prefix")
+    op.drop_column("user", "api_key_hash")
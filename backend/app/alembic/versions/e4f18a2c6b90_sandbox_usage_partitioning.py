@@ -0,0 +1,109 @@
+"""partition sandboxusage by month on executed_at
+
+Revision ID: e4f18a2c6b90
+Revises: c7b2e5d8f413
+Create Date: 2026-10-19 14:02:11.318540
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel.sql.sqltypes
+
+
+# revision identifiers, used by Alembic.
+revision = "e4f18a2c6b90"
+down_revision = "c7b2e5d8f413"
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+
+def _columns():
+    return [
+        sa.Column("duration_seconds", sa.Float(), nullable=False),
+        sa.Column("user_id", sa.Uuid(), nullable=False),
+        sa.Column("api_key_used", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("session_id", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("cpu_user_seconds", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("cpu_system_seconds", sa.Float(), nullable=False, server_default="0"),
+        sa.Column("peak_rss_bytes", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("output_bytes", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("executed_at", sa.DateTime(), server_default=sa.text("now()"), nullable=False),
+        sa.Column("cost_units", sa.Float(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["user.id"]),
+    ]
+
+
+COPY_COLUMNS = (
+    "duration_seconds, user_id, api_key_used, session_id, cpu_user_seconds, "
+    "cpu_system_seconds, peak_rss_bytes, output_bytes, id, executed_at, cost_units"
+)
+
+
+def upgrade():
+    op.drop_index("ix_sandboxusage_user_id", table_name="sandboxusage")
+    op.drop_index("ix_sandboxusage_id", table_name="sandboxusage")
+    op.rename_table("sandboxusage", "sandboxusage_old")
+    op.execute("ALTER TABLE sandboxusage_old RENAME CONSTRAINT sandboxusage_pkey TO sandboxusage_old_pkey")
+
+    op.create_table(
+        "sandboxusage",
+        *_columns(),
+        sa.PrimaryKeyConstraint("id", "executed_at"),
+        postgresql_partition_by="RANGE (executed_at)",
+    )
+    op.create_index(
+        "ix_sandboxusage_user_id_executed_at",
+        "sandboxusage",
+        ["user_id", "executed_at"],
+        unique=False,
+    )
+
+    # monthly partitions covering existing rows up to MONTHS_AHEAD months from now
+    op.execute(
+        f"""
+        DO $$
+        DECLARE
+            m timestamp;
+        BEGIN
+            SELECT date_trunc('month', coalesce(min(executed_at), now()))
+              INTO m FROM sandboxusage_old;
+            WHILE m <= date_trunc('month', now()) + interval '{MONTHS_AHEAD} months' LOOP
+                EXECUTE format(
+                    'CREATE TABLE %I PARTITION OF sandboxusage FOR VALUES FROM (%L) TO (%L)',
+                    'sandboxusage_y' || to_char(m, 'YYYY') || 'm' || to_char(m, 'MM'),
+                    m, m + interval '1 month'
+                );
+                m := m + interval '1 month';
+            END LOOP;
+        END $$;
+        """
+    )
+    op.execute("CREATE TABLE sandboxusage_default PARTITION OF sandboxusage DEFAULT")
+
+    op.execute(
+        f"INSERT INTO sandboxusage ({COPY_COLUMNS}) "
+        f"SELECT {COPY_COLUMNS} FROM sandboxusage_old"
+    )
+    op.drop_table("sandboxusage_old")
+
+
+def downgrade():
+    op.rename_table("sandboxusage", "sandboxusage_partitioned")
+    op.execute("ALTER TABLE sandboxusage_partitioned RENAME CONSTRAINT sandboxusage_pkey TO sandboxusage_partitioned_pkey")
+    op.create_table(
+        "sandboxusage",
+        *_columns(),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.execute(
+        f"INSERT INTO sandboxusage ({COPY_COLUMNS}) "
+        f"SELECT {COPY_COLUMNS} FROM sandboxusage_partitioned"
+    )
+    # dropping the partitioned parent drops its partitions and their indexes
+    op.drop_table("sandboxusage_partitioned")
+    op.create_index(op.f("ix_sandboxusage_id"), "sandboxusage", ["id"], unique=False)
+    op.create_index(op.f("ix_sandboxusage_user_id"), "sandboxusage", ["user_id"], unique=False)
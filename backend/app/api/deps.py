@@ -1,17 +1,22 @@
-from collections.abc import Generator
-from typing import Annotated, Union, Optional
-from fastapi.security import APIKeyHeader
+import time
+import uuid
+from collections.abc import AsyncGenerator, Generator
+from typing import Annotated
+
 import jwt
 from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
 from jwt.exceptions import InvalidTokenError
 from pydantic import ValidationError
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core import security
+from app.core.cache import TTLCache
 from app.core.config import settings
-from app.core.db import engine
-from app.models import TokenPayload, User
+from app.core.db import async_engine, engine
+from app.models import TokenPayload, User, UserPrincipal
+from app.token_revocation import revocation_list
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/login/access-token",
@@ -24,25 +29,81 @@ def get_db() -> Generator[Session, None, None]:
         yield session
 
 
+async def get_async_db() -> AsyncGenerator[AsyncSession, None]:
+    """async def 路由使用，查询不阻塞事件循环"""
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
 # 新增API Key认证方案
 api_key_scheme = APIKeyHeader(name="x-api-key", auto_error=False)
 
 
 SessionDep = Annotated[Session, Depends(get_db)]
-TokenDep = Annotated[Optional[str], Depends(reusable_oauth2)]
-ApiKeyDep = Annotated[Optional[str], Depends(api_key_scheme)]
+AsyncSessionDep = Annotated[AsyncSession, Depends(get_async_db)]
+TokenDep = Annotated[str | None, Depends(reusable_oauth2)]
+ApiKeyDep = Annotated[str | None, Depends(api_key_scheme)]
+
+# api_key_hash -> (用户身份, 缓存时刻)；只缓存有效且启用的用户。
+# 失效只能清掉本进程的缓存，其它 worker 靠吊销表得知，所以命中时仍要对照吊销表
+api_key_cache: TTLCache[str, tuple[UserPrincipal, float]] = TTLCache(
+    maxsize=settings.API_KEY_CACHE_SIZE, ttl=settings.API_KEY_CACHE_TTL
+)
+
+
+def invalidate_api_key(
+    session: Session, user_id: uuid.UUID, api_key_hash: str | None
+) -> None:
+    """
+    key 被轮换或吊销时调用。写入吊销记录，其它进程缓存的旧 key 在下次刷新吊销表后失效；
+    该用户此前签发的身份 token 也一并吊销，需要重新获取。
+    """
+    if not api_key_hash:
+        return
+    api_key_cache.pop(api_key_hash)
+    revocation_list.revoke(session, user_id)
+
+
+def invalidate_user(session: Session, user_id: uuid.UUID) -> None:
+    """用户被停用、修改权限/套餐或删除时调用，同时吊销携带旧身份声明的 token"""
+    api_key_cache.discard_where(lambda p: p.id == user_id)
+    revocation_list.revoke(session, user_id)
+
+
+def _principal_of(user: User) -> UserPrincipal:
+    return UserPrincipal(
+        id=user.id,
+        is_active=user.is_active,
+        is_superuser=user.is_superuser,
+        plan=user.plan,
+    )
+
+
+def _decode_token(token: str) -> TokenPayload:
+    try:
+        payload = jwt.decode(
+            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
+        )
+        return TokenPayload(**payload)
+    except (InvalidTokenError, ValidationError):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+        )
 
 
 def get_current_user(
     session: SessionDep,
     token: TokenDep = None,  # 改为可选
-    api_key: ApiKeyDep = None  # 新增API Key参数
+    api_key: ApiKeyDep = None,  # 新增API Key参数
 ) -> User:
     # 优先检查API Key认证
     if api_key:
-        user = session.exec(select(User).where(
-            User.api_key == api_key)).first()
-        if not user:
+        api_key_hash = security.hash_api_key(api_key)
+        user = session.exec(
+            select(User).where(User.api_key_hash == api_key_hash)
+        ).first()
+        if not user or not security.verify_api_key(api_key, user.api_key_hash):
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Invalid API Key",
@@ -61,16 +122,7 @@ def get_current_user(
             detail="Not authenticated",
         )
 
-    try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[security.ALGORITHM]
-        )
-        token_data = TokenPayload(**payload)
-    except (InvalidTokenError, ValidationError):
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Could not validate credentials",
-        )
+    token_data = _decode_token(token)
     user = session.get(User, token_data.sub)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -82,6 +134,56 @@ def get_current_user(
 CurrentUser = Annotated[User, Depends(get_current_user)]
 
 
+def get_current_principal(
+    session: SessionDep,
+    token: TokenDep = None,
+    api_key: ApiKeyDep = None,
+) -> UserPrincipal:
+    """
+    只需要用户身份的路由（沙箱执行等热路径）使用。
+    API Key 认证命中缓存时、或 token 自带身份声明时不访问数据库。
+    """
+    if api_key:
+        digest = security.hash_api_key(api_key)
+        cached = api_key_cache.get(digest)
+        if cached is not None:
+            principal, cached_at = cached
+            if not revocation_list.is_revoked(principal.id, cached_at):
+                return principal
+            # 缓存之后用户被停用或 key 被轮换（可能发生在其它进程），回库重新校验
+            api_key_cache.pop(digest)
+        cached_at = time.time()
+        principal = _principal_of(get_current_user(session, api_key=api_key))
+        api_key_cache.set(digest, (principal, cached_at))
+        return principal
+    if token:
+        token_data = _decode_token(token)
+        if token_data.prn is not None:
+            return _principal_from_claims(token_data)
+    return _principal_of(get_current_user(session, token=token))
+
+
+def _principal_from_claims(token_data: TokenPayload) -> UserPrincipal:
+    try:
+        principal = UserPrincipal(id=token_data.sub, **token_data.prn)
+    except (TypeError, ValidationError):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Could not validate credentials",
+        )
+    if revocation_list.is_revoked(principal.id, token_data.iat):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Token has been revoked",
+        )
+    if not principal.is_active:
+        raise HTTPException(status_code=400, detail="Inactive user")
+    return principal
+
+
+CurrentPrincipal = Annotated[UserPrincipal, Depends(get_current_principal)]
+
+
 def get_current_active_superuser(current_user: CurrentUser) -> User:
     if not current_user.is_superuser:
         raise HTTPException(
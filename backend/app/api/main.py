@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from app.api.routes import login, private, users, utils, sessions
+from app.api.routes import login, private, sessions, usages, users, utils
 from app.core.config import settings
 
 api_router = APIRouter()
@@ -8,6 +8,7 @@ api_router.include_router(login.router)
 api_router.include_router(users.router)
 api_router.include_router(utils.router)
 api_router.include_router(sessions.router)
+api_router.include_router(usages.router)
 
 
 if settings.ENVIRONMENT == "local":
@@ -43,6 +43,25 @@ def login_access_token(
     )
 
 
+@router.post("/login/principal-token")
+def principal_token(current_user: CurrentUser) -> Token:
+    """
+    Exchange credentials for a short-lived token carrying the user's principal
+    claims. Routes that only need the principal accept it without a DB lookup.
+    """
+    return Token(
+        access_token=security.create_access_token(
+            current_user.id,
+            expires_delta=timedelta(minutes=settings.PRINCIPAL_TOKEN_EXPIRE_MINUTES),
+            principal={
+                "is_active": current_user.is_active,
+                "is_superuser": current_user.is_superuser,
+                "plan": current_user.plan,
+            },
+        )
+    )
+
+
 @router.post("/login/test-token", response_model=UserPublic)
 def test_token(current_user: CurrentUser) -> Any:
     """
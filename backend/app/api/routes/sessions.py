@@ -1,35 +1,164 @@
+import base64
+import logging
+import math
+import re
+import uuid
+from collections.abc import AsyncIterator
 from contextlib import asynccontextmanager
-from typing import Any
-
-from fastapi import APIRouter, FastAPI, HTTPException, status, Response
+from datetime import datetime, timedelta, timezone
+from typing import Any, Literal
+
+from fastapi import (
+    APIRouter,
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from app.services.boxed_service import BoxedService
 from app.api.deps import (
-    CurrentUser,
-    SessionDep,
+    AsyncSessionDep,
+    CurrentPrincipal,
+    get_current_active_superuser,
 )
-from app.crud import (
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.db import async_engine
+from app.core.plans import Plan, get_plan
+from app.core.rate_limit import TokenBucketLimiter, UsageCounter
+from app.crud_user_session import (
+    count_active_sessions,
     create_user_session,
     deactivate_user_session,
     get_user_session,
     get_user_sessions,
+    lock_user_sessions,
+    renew_user_session,
+    set_user_session_node,
+    stop_orphaned_sessions,
+)
+from app.models import (
+    SandboxUsageCreate,
+    SessionStatus,
+    UserPrincipal,
+    UserSessionCreate,
+    UserSessionPublic,
 )
-from app.models import UserSession, UserSessionCreate, UserSessionPublic
+from app.services.boxed_client import BoxedClient
+from app.services.boxed_cluster import BoxedCluster, parse_nodes
+from app.services.boxed_rpc import RpcConnectionError
+from app.services.boxed_service import BoxedService
+from app.usage_buffer import usage_buffer
+from app.utils import decode_cursor, encode_cursor
 
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/sessions", tags=["Boxed"])
-boxed_service = BoxedService(prewarm_count=2)
+# 多节点时按容量放置并路由；单个宿主进程时所有 worker 共享同一组沙箱；
+# 都未配置时由本进程直接管理
+boxed_service: BoxedService | BoxedClient | BoxedCluster
+if settings.BOXED_NODES:
+    boxed_service = BoxedCluster(parse_nodes(settings.BOXED_NODES))
+elif settings.BOXED_HOST_SOCKET:
+    boxed_service = BoxedClient(settings.BOXED_HOST_SOCKET)
+else:
+    boxed_service = BoxedService(prewarm_count=2)
+
+
+def _node_of(session_id: str) -> str | None:
+    if isinstance(boxed_service, BoxedCluster):
+        return boxed_service.node_of(session_id)
+    return None
+
+
+def _require_cluster() -> BoxedCluster:
+    if not isinstance(boxed_service, BoxedCluster):
+        raise HTTPException(
+            status_code=400, detail="Migration requires multiple sandbox nodes"
+        )
+    return boxed_service
+
+
+# session_id -> user_id；归属不会变化，销毁时移除，未命中再查库
+session_owners: TTLCache[str, uuid.UUID] = TTLCache(
+    maxsize=settings.SESSION_OWNER_CACHE_SIZE, ttl=settings.SESSION_OWNER_CACHE_TTL
+)
+
+# 每用户的执行/创建速率（令牌桶）和运行中的沙箱数，都在内存中判断，热路径不查库
+rate_limiter: TokenBucketLimiter[tuple[uuid.UUID, str]] = TokenBucketLimiter()
+active_boxes: UsageCounter[uuid.UUID] = UsageCounter(
+    resync=settings.BOX_QUOTA_RESYNC_SECONDS
+)
+
+
+def _too_many(detail: str, retry_after: float) -> HTTPException:
+    return HTTPException(
+        status_code=429,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def _check_rate(user: UserPrincipal, op: str, rate: float, burst: float) -> None:
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    wait = rate_limiter.acquire((user.id, op), rate, burst)
+    if wait > 0:
+        raise _too_many(f"Too many {op} requests, retry later", wait)
+
+
+async def _reserve_box(session: AsyncSession, user: UserPrincipal, plan: Plan) -> None:
+    """
+    占用一个运行中沙箱的名额；之后创建失败时调用方需归还（active_boxes.add(-1)）。
+    计数在该用户的 advisory lock 内从数据库读取，锁持有到调用方写入会话记录并提交为止，
+    调用方在此之间不能提交 session。内存中的计数只用于不查库就拒绝已满的用户。
+    """
+    if not settings.RATE_LIMIT_ENABLED:
+        return
+    cached = active_boxes.get(user.id)
+    if cached is None or cached < plan.max_boxes:
+        await lock_user_sessions(session=session, user_id=user.id)
+        cached = await count_active_sessions(session=session, user_id=user.id)
+        active_boxes.set(user.id, cached)
+    if cached >= plan.max_boxes:
+        raise _too_many(
+            f"The {plan.name} plan allows {plan.max_boxes} running sessions",
+            settings.BOX_QUOTA_RESYNC_SECONDS,
+        )
+    active_boxes.add(user.id, 1)
 
 
 @asynccontextmanager
-async def service_lifespan(app: FastAPI):
+async def service_lifespan(_app: FastAPI):
     """
     FastAPI app lifespan event to initialize and close the BoxedService.
     """
     await boxed_service.init()
+    await _reconcile_sessions()
     yield
-    # await boxed_service.close()
+    await boxed_service.close()
+
+
+async def _reconcile_sessions() -> None:
+    """沙箱宿主重启后没能恢复的沙箱，其会话记录仍是 STARTED，启动时统一标记为 STOPPED"""
+    started = datetime.now(timezone.utc)
+    try:
+        live = set(await boxed_service.boxes(include_hibernated=True))
+    except RpcConnectionError as e:
+        logger.warning("Skipping session reconcile, sandbox host unavailable: %s", e)
+        return
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        stopped = await stop_orphaned_sessions(
+            session=session, live=live, created_before=started
+        )
+    if stopped:
+        logger.info("Marked %d sessions without a live box as stopped", stopped)
 
 
 # ==========================
@@ -37,6 +166,14 @@ async def service_lifespan(app: FastAPI):
 # ==========================
 
 
+class SessionCreateRequest(BaseModel):
+    ttl_seconds: int | None = Field(
+        None,
+        gt=0,
+        description="会话有效期（秒），到期后沙箱被休眠或销毁；默认按套餐，不能超过套餐上限",
+    )
+
+
 class CodeExecRequest(BaseModel):
     code: str = Field(..., description="Python 代码")
 
@@ -44,6 +181,12 @@ class CodeExecRequest(BaseModel):
 class CodeExecResponse(BaseModel):
     stdout: str
     stderr: str
+    truncated: bool = Field(
+        False, description="输出超过内联上限，stdout/stderr 只是开头部分"
+    )
+    output_id: str | None = Field(
+        None, description="截断时完整输出的引用，通过 /output/{output_id}/{stream} 下载"
+    )
 
 
 class PackageInstallRequest(BaseModel):
@@ -60,6 +203,27 @@ class SnapshotRestoreRequest(BaseModel):
 
 class SessionResponse(BaseModel):
     session_id: str
+    expires_at: datetime | None = None
+
+
+class MigrateRequest(BaseModel):
+    target: str | None = Field(
+        None, description="目标节点，留空时选择剩余容量最大的节点"
+    )
+
+
+class MigrateResponse(BaseModel):
+    session_id: str
+    source: str
+    target: str
+    bytes: int = Field(..., description="传输的检查点和工作目录大小")
+    pause_seconds: float = Field(..., description="沙箱从停止到在目标节点恢复的时间")
+
+
+class SessionEvent(BaseModel):
+    kind: str = Field(..., description="exited / restored / restarted / failed")
+    detail: str
+    at: datetime
 
 
 # ==========================
@@ -68,66 +232,130 @@ class SessionResponse(BaseModel):
 
 
 @router.post("", response_model=SessionResponse)
-async def create_session(session: SessionDep, current_user: CurrentUser) -> Any:
+async def create_session(
+    session: AsyncSessionDep,
+    current_user: CurrentPrincipal,
+    request: SessionCreateRequest | None = None,
+) -> Any:
     """
     Create a new sandbox session and return the session ID.
+    The session expires after `ttl_seconds` (the plan default when omitted).
     """
-    session_id = await boxed_service.create_session()
+    plan = get_plan(current_user.plan)
+    ttl = (request and request.ttl_seconds) or plan.default_ttl
+    if ttl > plan.max_ttl:
+        raise HTTPException(
+            status_code=400,
+            detail=f"ttl_seconds exceeds the {plan.name} plan limit of {plan.max_ttl}",
+        )
+    _check_rate(current_user, "create", plan.create_rate, plan.create_burst)
+    await _reserve_box(session, current_user, plan)
+    try:
+        session_id = await boxed_service.create_session(
+            limits=plan.box_limits(), ttl=ttl
+        )
+    except RuntimeError as e:
+        active_boxes.add(current_user.id, -1)
+        # 所有节点都没有剩余容量
+        raise HTTPException(status_code=503, detail=str(e))
+    except BaseException:
+        active_boxes.add(current_user.id, -1)
+        raise
+    expires_at = datetime.now(timezone.utc) + timedelta(seconds=ttl)
 
     # 创建用户会话记录
-    session_create = UserSessionCreate(session_id=session_id, user_id=current_user.id)
-    create_user_session(session=session, session_create=session_create)
+    session_create = UserSessionCreate(
+        session_id=session_id,
+        user_id=current_user.id,
+        node=_node_of(session_id),
+        expires_at=expires_at,
+    )
+    await create_user_session(session=session, session_create=session_create)
+    session_owners.set(session_id, current_user.id)
 
-    return SessionResponse(session_id=session_id)
+    return SessionResponse(session_id=session_id, expires_at=expires_at)
 
 
 # boxed.py
 
 
 @router.get("", response_model=list[UserSessionPublic])
-def get_my_sessions(
-    session: SessionDep,
-    current_user: CurrentUser,
+async def get_my_sessions(
+    session: AsyncSessionDep,
+    current_user: CurrentPrincipal,
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
 ) -> Any:
     """
     Get all sessions for the current user, ordered by creation time (descending).
+    Pass the `X-Next-Cursor` response header back as `cursor` to get the next page.
     """
-    return get_user_sessions(
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    sessions = await get_user_sessions(
         session=session,
         user_id=current_user.id,
         skip=skip,
-        limit=limit,
+        limit=limit + 1,
+        after=after,
     )
+    if len(sessions) > limit:
+        sessions = sessions[:limit]
+        last = sessions[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
+    return sessions
 
 
-def _check_user_session(
-    session: SessionDep, session_id: str, current_user: CurrentUser
-) -> UserSession:
+async def _check_user_session(
+    session: AsyncSessionDep, session_id: str, current_user: CurrentPrincipal
+) -> None:
     """
     Check if the session belongs to the current user.
+    The owner is served from memory when known, so most execs skip this query.
     """
-    user_session = get_user_session(
+    owner = session_owners.get(session_id)
+    if owner is not None:
+        if owner != current_user.id:
+            raise HTTPException(status_code=404, detail="Session not found")
+        return
+    user_session = await get_user_session(
         session=session, session_id=session_id, user_id=current_user.id
     )
     if user_session is None:
         raise HTTPException(status_code=404, detail="Session not found")
-    return user_session
+    session_owners.set(session_id, user_session.user_id)
+    # 路由表里没有时（如 API 重启后）按记录的节点转发，免去向所有节点询问
+    if (
+        isinstance(boxed_service, BoxedCluster)
+        and user_session.node in boxed_service.nodes
+        and boxed_service.node_of(session_id) is None
+    ):
+        boxed_service.assign(session_id, user_session.node)
 
 
 @router.delete("/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def destroy_session(
-    session_id: str, session: SessionDep, current_user: CurrentUser
+    session_id: str, session: AsyncSessionDep, current_user: CurrentPrincipal
 ) -> Response:
     """
-    Destroy the sandbox session and remove the user session record.
+    Destroy the sandbox session and mark the user session record as destroyed.
+    The box is torn down in the background.
     """
-    _check_user_session(session, session_id, current_user)
+    await _check_user_session(session, session_id, current_user)
     try:
-        deactivate_user_session(
-            session=session, session_id=session_id, user_id=current_user.id
+        was_running = await deactivate_user_session(
+            session=session,
+            session_id=session_id,
+            user_id=current_user.id,
+            status=SessionStatus.DESTROYED,
         )
+        session_owners.pop(session_id)
+        if was_running:
+            active_boxes.add(current_user.id, -1)
         await boxed_service.destroy(session_id)
     except KeyError:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -143,18 +371,114 @@ async def destroy_session(
 async def exec_code(
     session_id: str,
     request: CodeExecRequest,
-    session: SessionDep,
-    current_user: CurrentUser,
+    session: AsyncSessionDep,
+    current_user: CurrentPrincipal,
 ) -> Any:
     """
     Execute code in the sandbox session.
     """
-    _check_user_session(session, session_id, current_user)
+    plan = get_plan(current_user.plan)
+    _check_rate(current_user, "exec", plan.exec_rate, plan.exec_burst)
+    await _check_user_session(session, session_id, current_user)
     try:
-        stdout, stderr = await boxed_service.exec_code(session_id, request.code)
-        return CodeExecResponse(stdout=stdout, stderr=stderr)
-    except (KeyError, RuntimeError) as e:
-        raise HTTPException(status_code=404, detail=str(e))
+        result = await boxed_service.exec_code(
+            session_id,
+            request.code,
+            tenant=str(current_user.id),
+            weight=plan.exec_weight,
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Session not found")
+    except RuntimeError as e:
+        # 沙箱正在重启或节点执行失败，会话本身仍然存在
+        raise HTTPException(status_code=503, detail=str(e))
+    # 先记入本地缓冲，由后台批量写库，执行延迟不包含计费写入
+    usage_buffer.add(
+        SandboxUsageCreate(
+            user_id=current_user.id,
+            session_id=session_id,
+            duration_seconds=result.wall_seconds,
+            cpu_user_seconds=result.cpu_user_seconds,
+            cpu_system_seconds=result.cpu_system_seconds,
+            peak_rss_bytes=result.peak_rss_bytes,
+            output_bytes=result.output_bytes,
+        )
+    )
+    return CodeExecResponse(
+        stdout=result.stdout,
+        stderr=result.stderr,
+        truncated=result.truncated,
+        output_id=result.output_id,
+    )
+
+
+# 下载溢出输出时每次向节点读取的字节数
+OUTPUT_CHUNK = 1024 * 1024
+
+
+def _parse_range(header: str | None, size: int) -> tuple[int, int] | None:
+    """解析单个 bytes 区间，返回 [start, end)；没有或无法识别时返回 None 表示整个文件"""
+    match = re.fullmatch(r"bytes=(\d*)-(\d*)", (header or "").strip())
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last) + 1, size) if last else size
+    else:
+        start, end = max(0, size - int(last)), size
+    if start >= size or start >= end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+@router.get("/{session_id}/output/{output_id}/{stream}")
+async def download_output(
+    session_id: str,
+    output_id: str,
+    stream: Literal["stdout", "stderr"],
+    session: AsyncSessionDep,
+    current_user: CurrentPrincipal,
+    range_header: str | None = Header(None, alias="Range"),
+) -> Any:
+    """
+    Download the full output of an exec whose response was truncated.
+    A single `Range: bytes=start-end` is honoured with a 206 partial response.
+    """
+    await _check_user_session(session, session_id, current_user)
+    try:
+        first = await boxed_service.read_output(session_id, output_id, stream, 0, 0)
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=404, detail="Output not found")
+    size = first["size"]
+    byte_range = _parse_range(range_header, size)
+    start, end = byte_range or (0, size)
+
+    async def body() -> AsyncIterator[bytes]:
+        offset = start
+        while offset < end:
+            chunk = await boxed_service.read_output(
+                session_id, output_id, stream, offset, min(OUTPUT_CHUNK, end - offset)
+            )
+            data = base64.b64decode(chunk["data"])
+            if not data:
+                break
+            offset += len(data)
+            yield data
+
+    headers = {"Accept-Ranges": "bytes", "Content-Length": str(end - start)}
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end - 1}/{size}"
+    return StreamingResponse(
+        body(),
+        status_code=206 if byte_range else 200,
+        media_type="text/plain; charset=utf-8",
+        headers=headers,
+    )
 
 
 # ==========================
@@ -166,13 +490,15 @@ async def exec_code(
 async def install_packages(
     session_id: str,
     request: PackageInstallRequest,
-    session: SessionDep,
-    current_user: CurrentUser,
+    session: AsyncSessionDep,
+    current_user: CurrentPrincipal,
 ) -> Response:
     """
     install packages in the sandbox session.
     """
-    _check_user_session(session, session_id, current_user)
+    plan = get_plan(current_user.plan)
+    _check_rate(current_user, "exec", plan.exec_rate, plan.exec_burst)
+    await _check_user_session(session, session_id, current_user)
     try:
         await boxed_service.install_packages(session_id, request.packages)
     except KeyError:
@@ -187,17 +513,29 @@ async def install_packages(
 
 @router.post("/{session_id}/hibernate", response_model=SnapshotResponse)
 async def hibernate_session(
-    session_id: str, session: SessionDep, current_user: CurrentUser
+    session_id: str, session: AsyncSessionDep, current_user: CurrentPrincipal
 ) -> Any:
     """
     Hibernate the session and return a snapshot ID.
     """
-    _check_user_session(session, session_id, current_user)
+    await _check_user_session(session, session_id, current_user)
     try:
         snapshot_id = await boxed_service.snapshot(session_id)
-        return SnapshotResponse(snapshot_id=snapshot_id)
     except KeyError:
         raise HTTPException(status_code=404, detail="Session not found")
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    was_running = await deactivate_user_session(
+        session=session,
+        session_id=session_id,
+        user_id=current_user.id,
+        status=SessionStatus.HIBERNATED,
+    )
+    if was_running:
+        active_boxes.add(current_user.id, -1)
+    return SnapshotResponse(snapshot_id=snapshot_id)
 
 
 # ==========================
@@ -209,15 +547,120 @@ async def hibernate_session(
 async def restore_session(
     session_id: str,
     request: SnapshotRestoreRequest,
-    session: SessionDep,
-    current_user: CurrentUser,
+    session: AsyncSessionDep,
+    current_user: CurrentPrincipal,
 ) -> Response:
     """
     Restore the session from a snapshot.
+    A session hibernated on expiry is restored with snapshot ID `expired`.
+    The restored session expires after the plan's default TTL.
     """
-    _check_user_session(session, session_id, current_user)
+    await _check_user_session(session, session_id, current_user)
+    plan = get_plan(current_user.plan)
+    user_session = await get_user_session(
+        session=session, session_id=session_id, user_id=current_user.id
+    )
+    # 仍在运行的会话已经占着名额，恢复不再重复计数
+    reserved = user_session is None or user_session.status != SessionStatus.STARTED
+    if reserved:
+        await _reserve_box(session, current_user, plan)
     try:
-        await boxed_service.restore(session_id, request.snapshot_id)
+        await boxed_service.restore(
+            session_id,
+            request.snapshot_id,
+            limits=plan.box_limits(),
+            ttl=plan.default_ttl,
+        )
+    except (KeyError, ValueError) as e:
+        if reserved:
+            active_boxes.add(current_user.id, -1)
+        detail = "Session not found" if isinstance(e, KeyError) else str(e)
+        raise HTTPException(status_code=404, detail=detail)
+    except BaseException:
+        if reserved:
+            active_boxes.add(current_user.id, -1)
+        raise
+    await renew_user_session(
+        session=session,
+        session_id=session_id,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=plan.default_ttl),
+    )
+    session_owners.set(session_id, current_user.id)
+    return Response(status_code=204)
+
+
+# ==========================
+# Lifecycle Events
+# ==========================
+
+
+@router.get("/{session_id}/events", response_model=list[SessionEvent])
+async def get_session_events(
+    session_id: str, session: AsyncSessionDep, current_user: CurrentPrincipal
+) -> Any:
+    """
+    Get lifecycle events of the session, e.g. crashes and automatic restarts.
+    """
+    await _check_user_session(session, session_id, current_user)
+    try:
+        events = await boxed_service.events(session_id)
     except KeyError:
         raise HTTPException(status_code=404, detail="Session not found")
-    return Response(status_code=204)
+    return [
+        SessionEvent(
+            kind=e.kind, detail=e.detail, at=datetime.fromtimestamp(e.at, timezone.utc)
+        )
+        for e in events
+    ]
+
+
+# ==========================
+# Live Migration (admin)
+# ==========================
+
+
+@router.post(
+    "/{session_id}/migrate",
+    response_model=MigrateResponse,
+    dependencies=[Depends(get_current_active_superuser)],
+)
+async def migrate_session(
+    session_id: str, request: MigrateRequest, session: AsyncSessionDep
+) -> Any:
+    """
+    Move a running session to another sandbox node.
+    The box is only paused between the checkpoint and the restore on the target.
+    """
+    cluster = _require_cluster()
+    try:
+        moved = await cluster.migrate_box(session_id, request.target)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Session not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    await set_user_session_node(
+        session=session, session_id=session_id, node=moved["target"]
+    )
+    return MigrateResponse(session_id=session_id, **moved)
+
+
+@router.post(
+    "/rebalance",
+    response_model=list[MigrateResponse],
+    dependencies=[Depends(get_current_active_superuser)],
+)
+async def rebalance_nodes(
+    session: AsyncSessionDep, max_moves: int = Query(1, ge=1, le=100)
+) -> Any:
+    """
+    Move sessions from the most to the least loaded node until memory pressure is even.
+    Meant to be called periodically, e.g. from a cron job.
+    """
+    moves = await _require_cluster().rebalance(max_moves=max_moves)
+    for moved in moves:
+        await set_user_session_node(
+            session=session, session_id=moved["box_id"], node=moved["target"]
+        )
+    return [MigrateResponse(session_id=m["box_id"], **m) for m in moves]
@@ -1,23 +1,29 @@
 from datetime import datetime
-from typing import Optional
+
+from fastapi import APIRouter, HTTPException, Query
 
 from app import crud_sandbox_usage
-from app.api.deps import CurrentUser, SessionDep
-from app.models import SandboxUsage
+from app.api.deps import CurrentPrincipal, SessionDep
 from app.schemas import PaginatedUsagesOut
-from fastapi import APIRouter, HTTPException, Query
-from sqlmodel import func, select
+from app.utils import decode_cursor, encode_cursor
 
 router = APIRouter(prefix="/usages", tags=["usages"])
 
 
 @router.get("", response_model=PaginatedUsagesOut)
 def get_usage_history(
-    session: SessionDep, current_user: CurrentUser, skip: int = 0, limit: int = 100,
-    time_range: Optional[str] = Query(
+    session: SessionDep,
+    current_user: CurrentPrincipal,
+    page: int = Query(1, ge=1),
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = Query(
+        None, description="上一页返回的 next_cursor，传入时忽略 page"
+    ),
+    with_stats: bool = Query(True, description="是否返回总数和汇总统计"),
+    time_range: str | None = Query(
         None,
         description="时间范围格式: 2023-01-01T00:00:00,2023-01-31T23:59:59",
-        example="2023-01-01T00:00:00,2023-01-31T23:59:59"
+        example="2023-01-01T00:00:00,2023-01-31T23:59:59",
     ),
 ):
     # 解析时间范围
@@ -25,47 +31,50 @@ def get_usage_history(
     if time_range:
         try:
             start_str, end_str = time_range.split(",")
-            parsed_time_range = (datetime.fromisoformat(
-                start_str), datetime.fromisoformat(end_str))
+            parsed_time_range = (
+                datetime.fromisoformat(start_str),
+                datetime.fromisoformat(end_str),
+            )
         except ValueError:
             raise HTTPException(
                 status_code=400,
-                detail="Invalid time range format. Expected 'start,end' in ISO format"
+                detail="Invalid time range format. Expected 'start,end' in ISO format",
             )
 
-    # 计算分页偏移量
-    skip = (page - 1) * limit
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
-    # 获取数据
+    # 有游标时走 keyset 分页，否则退回按页偏移
+    skip = 0 if after else (page - 1) * limit
+
+    # 多取一条用来判断是否还有下一页
     usages = crud_sandbox_usage.get_by_user(
-        db,
+        session,
         user_id=current_user.id,
         skip=skip,
-        limit=limit,
-        time_range=parsed_time_range
+        limit=limit + 1,
+        time_range=parsed_time_range,
+        after=after,
     )
+    next_cursor = None
+    if len(usages) > limit:
+        usages = usages[:limit]
+        next_cursor = encode_cursor(usages[-1].executed_at, usages[-1].id)
 
-    # 获取总数
-    total_query = select(func.count(SandboxUsage.id)).where(
-        SandboxUsage.user_id == current_user.id
-    )
-    if parsed_time_range:
-        total_query = total_query.where(
-            SandboxUsage.executed_at.between(*parsed_time_range)
+    # 统计信息来自预聚合表，总数即统计中的记录数，无需再扫描原始记录
+    stats = None
+    if with_stats:
+        stats = crud_sandbox_usage.get_usage_stats(
+            session, user_id=current_user.id, time_range=parsed_time_range
         )
-    total = db.exec(total_query).scalar()
-
-    # 获取统计信息
-    stats = crud_sandbox_usage.get_usage_stats(
-        db,
-        user_id=current_user.id,
-        time_range=parsed_time_range
-    )
 
     return {
         "items": usages,
-        "total": total,
+        "total": stats.usage_count if stats else None,
         "page": page,
         "limit": limit,
-        "stats": stats
+        "stats": stats,
+        "next_cursor": next_cursor,
     }
@@ -1,7 +1,10 @@
+import secrets
+import string
 import uuid
-from typing import Any
+from typing import Any, Literal
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy import text, tuple_
 from sqlmodel import col, delete, func, select
 
 from app import crud
@@ -9,9 +12,16 @@ from app.api.deps import (
     CurrentUser,
     SessionDep,
     get_current_active_superuser,
+    invalidate_api_key,
+    invalidate_user,
 )
 from app.core.config import settings
-from app.core.security import get_password_hash, verify_password
+from app.core.security import (
+    api_key_prefix,
+    get_password_hash,
+    hash_api_key,
+    verify_password,
+)
 from app.models import (
     Item,
     Message,
@@ -24,10 +34,13 @@ from app.models import (
     UserUpdate,
     UserUpdateMe,
 )
-from app.utils import generate_new_account_email, send_email
 from app.schemas import APIKeyOut
-import secrets
-import string
+from app.utils import (
+    decode_cursor,
+    encode_cursor,
+    generate_new_account_email,
+    send_email,
+)
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -42,8 +55,7 @@ def generate_api_key(length: int = 32) -> str:
         raise ValueError("API key length too short after prefix")
 
     alphabet = string.ascii_letters + string.digits
-    random_part = ''.join(secrets.choice(alphabet)
-                          for _ in range(random_part_length))
+    random_part = "".join(secrets.choice(alphabet) for _ in range(random_part_length))
     return prefix + random_part
 
 
@@ -52,18 +64,51 @@ def generate_api_key(length: int = 32) -> str:
     dependencies=[Depends(get_current_active_superuser)],
     response_model=UsersPublic,
 )
-def read_users(session: SessionDep, skip: int = 0, limit: int = 100) -> Any:
+def read_users(
+    session: SessionDep,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: str | None = None,
+    count: Literal["exact", "estimated", "none"] = "exact",
+) -> Any:
     """
-    Retrieve users.
+    Retrieve users, newest first.
+    Pass `next_cursor` back as `cursor` to page without an offset scan.
+    `count=estimated` reads the planner's row estimate instead of counting.
     """
-
-    count_statement = select(func.count()).select_from(User)
-    count = session.exec(count_statement).one()
-
-    statement = select(User).offset(skip).limit(limit)
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    total = None
+    if count == "exact":
+        total = session.exec(select(func.count()).select_from(User)).one()
+    elif count == "estimated":
+        # reltuples 为 -1 表示尚未 ANALYZE
+        estimate = session.execute(
+            text(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = 'public.user'::regclass"
+            )
+        ).scalar_one()
+        total = max(estimate, 0)
+
+    statement = select(User)
+    if after is not None:
+        statement = statement.where(tuple_(User.created_at, User.id) < tuple_(*after))
+    statement = (
+        statement.order_by(col(User.created_at).desc(), col(User.id).desc())
+        .offset(skip)
+        .limit(limit + 1)
+    )
     users = session.exec(statement).all()
 
-    return UsersPublic(data=users, count=count)
+    next_cursor = None
+    if len(users) > limit:
+        users = users[:limit]
+        next_cursor = encode_cursor(users[-1].created_at, users[-1].id)
+
+    return UsersPublic(data=users, count=total, next_cursor=next_cursor)
 
 
 @router.post(
@@ -102,8 +147,7 @@ def update_user_me(
     """
 
     if user_in.email:
-        existing_user = crud.get_user_by_email(
-            session=session, email=user_in.email)
+        existing_user = crud.get_user_by_email(session=session, email=user_in.email)
         if existing_user and existing_user.id != current_user.id:
             raise HTTPException(
                 status_code=409, detail="User with this email already exists"
@@ -155,6 +199,7 @@ def delete_user_me(session: SessionDep, current_user: CurrentUser) -> Any:
         )
     session.delete(current_user)
     session.commit()
+    invalidate_user(session, current_user.id)
     return Message(message="User deleted successfully")
 
 
@@ -213,15 +258,14 @@ def update_user(
             detail="The user with this id does not exist in the system",
         )
     if user_in.email:
-        existing_user = crud.get_user_by_email(
-            session=session, email=user_in.email)
+        existing_user = crud.get_user_by_email(session=session, email=user_in.email)
         if existing_user and existing_user.id != user_id:
             raise HTTPException(
                 status_code=409, detail="User with this email already exists"
             )
 
-    db_user = crud.update_user(
-        session=session, db_user=db_user, user_in=user_in)
+    db_user = crud.update_user(session=session, db_user=db_user, user_in=user_in)
+    invalidate_user(session, user_id)
     return db_user
 
 
@@ -243,53 +287,52 @@ def delete_user(
     session.exec(statement)  # type: ignore
     session.delete(user)
     session.commit()
+    invalidate_user(session, user_id)
     return Message(message="User deleted successfully")
 
 
 @router.get("/me/api-key", response_model=APIKeyOut)
-def get_api_key(
-    current_user: CurrentUser
-) -> Any:
+def get_api_key(current_user: CurrentUser) -> Any:
     """
-    Get current user's API key.
+    Get current user's API key, masked. The full key is only shown when created.
     """
-    if not current_user.api_key:
+    if not current_user.api_key_hash:
         raise HTTPException(
-            status_code=404,
-            detail="API key not found. Please generate one first."
+            status_code=404, detail="API key not found. Please generate one first."
         )
-    return APIKeyOut(api_key=current_user.api_key)
+    prefix = current_user.api_key_prefix or ""
+    return APIKeyOut(api_key=f"{prefix}...", prefix=prefix)
 
 
 @router.post("/me/api-key", response_model=APIKeyOut)
-def create_api_key(
-    session: SessionDep,
-    current_user: CurrentUser
-) -> Any:
+def create_api_key(session: SessionDep, current_user: CurrentUser) -> Any:
     """
     Create new API key for current user (replaces any existing key).
     """
     # 生成新的API Key
     new_api_key = generate_api_key()
 
-    # 更新用户记录
-    current_user.api_key = new_api_key
+    # 更新用户记录（只存摘要），旧 key 立即失效
+    old_api_key_hash = current_user.api_key_hash
+    current_user.api_key_hash = hash_api_key(new_api_key)
+    current_user.api_key_prefix = api_key_prefix(new_api_key)
     session.add(current_user)
     session.commit()
     session.refresh(current_user)
+    invalidate_api_key(session, current_user.id, old_api_key_hash)
 
-    return APIKeyOut(api_key=new_api_key)
+    return APIKeyOut(api_key=new_api_key, prefix=current_user.api_key_prefix)
 
 
 @router.delete("/me/api-key")
-def delete_api_key(
-    session: SessionDep,
-    current_user: CurrentUser
-) -> Any:
+def delete_api_key(session: SessionDep, current_user: CurrentUser) -> Any:
     """
     Delete current user's API key.
     """
-    current_user.api_key = None
+    old_api_key_hash = current_user.api_key_hash
+    current_user.api_key_hash = None
+    current_user.api_key_prefix = None
     session.add(current_user)
     session.commit()
+    invalidate_api_key(session, current_user.id, old_api_key_hash)
     return {"message": "API key revoked successfully"}
@@ -2,6 +2,7 @@ import secrets
 import warnings
 from typing import Annotated, Any, Literal
 
+from dotenv import load_dotenv
 from pydantic import (
     AnyUrl,
     BeforeValidator,
@@ -14,8 +15,6 @@ from pydantic import (
 from pydantic_core import MultiHostUrl
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing_extensions import Self
-from dotenv import load_dotenv
-
 
 _env_file = "./.env"
 load_dotenv(_env_file)
@@ -40,12 +39,15 @@ class Settings(BaseSettings):
     SECRET_KEY: str = secrets.token_urlsafe(32)
     # 60 minutes * 24 hours * 8 days = 8 days
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 8
+    # 携带身份声明、认证时不查库的短期 token；吊销表的刷新间隔（秒）
+    PRINCIPAL_TOKEN_EXPIRE_MINUTES: int = 15
+    TOKEN_REVOCATION_REFRESH_SECONDS: float = 30.0
     FRONTEND_HOST: str = "http://localhost:5173"
     ENVIRONMENT: Literal["local", "staging", "production"] = "local"
 
-    BACKEND_CORS_ORIGINS: Annotated[list[AnyUrl] | str, BeforeValidator(parse_cors)] = (
-        []
-    )
+    BACKEND_CORS_ORIGINS: Annotated[
+        list[AnyUrl] | str, BeforeValidator(parse_cors)
+    ] = []
 
     @computed_field  # type: ignore[prop-decorator]
     @property
@@ -74,6 +76,13 @@ class Settings(BaseSettings):
             path=self.POSTGRES_DB,
         )
 
+    # 连接池：同步、异步引擎各自一套，pre-ping 丢弃被数据库端断开的连接
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_TIMEOUT: float = 30.0
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+
     SMTP_TLS: bool = True
     SMTP_SSL: bool = False
     SMTP_PORT: int = 587
@@ -96,6 +105,36 @@ class Settings(BaseSettings):
     def emails_enabled(self) -> bool:
         return bool(self.SMTP_HOST and self.EMAILS_FROM_EMAIL)
 
+    # 用量记录批量写库：达到条数或间隔（秒）即写入，未写库的记录暂存在 spill 目录
+    USAGE_FLUSH_SIZE: int = 500
+    USAGE_FLUSH_INTERVAL: float = 2.0
+    USAGE_SPILL_DIR: str = "./usage-spill"
+    # spill 文件两次 fsync 的最小间隔（秒），掉电时最多丢失这段时间内的记录
+    USAGE_SPILL_FSYNC_INTERVAL: float = 1.0
+    # 用量原始记录按月分区：提前创建的月数，保留的月数（0 为永久保留）
+    USAGE_PARTITIONS_AHEAD: int = 3
+    USAGE_RETENTION_MONTHS: int = 13
+    # API Key 只保存 HMAC-SHA256 摘要；未设置时使用 SECRET_KEY，两者都必须在重启间保持不变
+    API_KEY_HMAC_SECRET: str | None = None
+    # API Key 认证结果的进程内缓存：有效期（秒，0 为关闭）和最大条目数
+    API_KEY_CACHE_TTL: float = 60.0
+    API_KEY_CACHE_SIZE: int = 10000
+    # 沙箱宿主进程的 Unix socket；设置后 API 通过它访问沙箱，可以运行多个 worker，
+    # 未设置时沙箱由 API 进程自己管理（只能单 worker）
+    BOXED_HOST_SOCKET: str | None = None
+    # 多节点部署：name=address 列表，如 "a=unix:/run/a.sock,b=tcp://10.0.0.2:7700"，
+    # 设置后优先于 BOXED_HOST_SOCKET，按节点剩余容量放置沙箱
+    BOXED_NODES: str | None = None
+    # 沙箱会话归属的进程内缓存
+    SESSION_OWNER_CACHE_TTL: float = 3600.0
+    SESSION_OWNER_CACHE_SIZE: int = 100000
+    # 沙箱到期由节点自行处理，API 按此间隔（秒）把已到期会话的记录标记为 STOPPED
+    SESSION_EXPIRY_SYNC_SECONDS: float = 60.0
+    # 按套餐限制每个用户的请求速率和运行中的沙箱数，计数在各进程内存中；
+    # 运行中的沙箱数每隔 BOX_QUOTA_RESYNC_SECONDS 秒从数据库重新读取一次
+    RATE_LIMIT_ENABLED: bool = True
+    BOX_QUOTA_RESYNC_SECONDS: float = 30.0
+
     EMAIL_TEST_USER: EmailStr = "test@example.com"
     FIRST_SUPERUSER: EmailStr
     FIRST_SUPERUSER_PASSWORD: str
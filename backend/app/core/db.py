@@ -1,10 +1,23 @@
+from sqlalchemy.ext.asyncio import create_async_engine
 from sqlmodel import Session, create_engine, select
 
-from app import crud
+from app import crud, crud_sandbox_usage
 from app.core.config import settings
 from app.models import User, UserCreate
 
-engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI))
+_pool_options = {
+    "pool_size": settings.DB_POOL_SIZE,
+    "max_overflow": settings.DB_MAX_OVERFLOW,
+    "pool_timeout": settings.DB_POOL_TIMEOUT,
+    "pool_recycle": settings.DB_POOL_RECYCLE,
+    "pool_pre_ping": settings.DB_POOL_PRE_PING,
+}
+
+engine = create_engine(str(settings.SQLALCHEMY_DATABASE_URI), **_pool_options)
+# 同一个 postgresql+psycopg URL，create_async_engine 会使用 psycopg 的异步驱动
+async_engine = create_async_engine(
+    str(settings.SQLALCHEMY_DATABASE_URI), **_pool_options
+)
 
 
 # make sure all SQLModel models are imported (app.models) before initializing DB
@@ -31,3 +44,7 @@ def init_db(session: Session) -> None:
             is_superuser=True,
         )
         user = crud.create_user(session=session, user_create=user_in)
+
+    crud_sandbox_usage.ensure_partitions(
+        session, months_ahead=settings.USAGE_PARTITIONS_AHEAD
+    )
@@ -0,0 +1,72 @@
+from dataclasses import dataclass
+
+from app.services.boxed_cgroup import BoxLimits
+
+MB = 1024 * 1024
+HOUR = 3600
+
+
+@dataclass(frozen=True)
+class Plan:
+    name: str
+    memory_max: int
+    cpu_max: float
+    pids_max: int
+    io_max: str | None = None
+    # 会话有效期（秒）：未指定时的默认值和允许的上限
+    default_ttl: int = 1800
+    max_ttl: int = 3600
+    # 每用户配额：执行和创建会话的速率（个/秒）与突发量，同时运行的沙箱数
+    exec_rate: float = 2.0
+    exec_burst: int = 10
+    create_rate: float = 0.2
+    create_burst: int = 5
+    max_boxes: int = 2
+    # 节点繁忙时执行排队的权重，越大越优先
+    exec_weight: float = 1.0
+
+    def box_limits(self) -> BoxLimits:
+        return BoxLimits(
+            memory_max=self.memory_max,
+            cpu_max=self.cpu_max,
+            pids_max=self.pids_max,
+            io_max=self.io_max,
+        )
+
+
+PLANS: dict[str, Plan] = {
+    "free": Plan(name="free", memory_max=512 * MB, cpu_max=0.5, pids_max=64),
+    "pro": Plan(
+        name="pro",
+        memory_max=2048 * MB,
+        cpu_max=2,
+        pids_max=256,
+        default_ttl=4 * HOUR,
+        max_ttl=24 * HOUR,
+        exec_rate=10.0,
+        exec_burst=50,
+        create_rate=1.0,
+        create_burst=20,
+        max_boxes=10,
+        exec_weight=2.0,
+    ),
+    "enterprise": Plan(
+        name="enterprise",
+        memory_max=8192 * MB,
+        cpu_max=4,
+        pids_max=1024,
+        default_ttl=8 * HOUR,
+        max_ttl=7 * 24 * HOUR,
+        exec_rate=50.0,
+        exec_burst=200,
+        create_rate=5.0,
+        create_burst=50,
+        max_boxes=50,
+        exec_weight=4.0,
+    ),
+}
+DEFAULT_PLAN = "free"
+
+
+def get_plan(name: str | None) -> Plan:
+    return PLANS.get(name or DEFAULT_PLAN, PLANS[DEFAULT_PLAN])
@@ -0,0 +1,83 @@
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Hashable
+from typing import Generic, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+
+
+class TokenBucketLimiter(Generic[K]):
+    """
+    进程内按键的令牌桶：每个键以 rate 个/秒补充令牌，最多积累 burst 个。
+    速率由调用方按套餐传入；桶按最近使用淘汰，被淘汰的键下次从满桶开始。
+    """
+
+    def __init__(self, maxsize: int = 100000):
+        self.maxsize = maxsize
+        # key -> (令牌数, 上次补充时间)
+        self._buckets: OrderedDict[K, tuple[float, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: K, rate: float, burst: float, cost: float = 1.0) -> float:
+        """取 cost 个令牌：成功返回 0，否则不扣减，返回还需等待的秒数"""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            if tokens >= cost:
+                tokens -= cost
+                wait = 0.0
+            else:
+                wait = (cost - tokens) / rate if rate > 0 else float("inf")
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class UsageCounter(Generic[K]):
+    """
+    按键的计数（如用户正在运行的沙箱数）。初值由调用方从数据库读取后 set，
+    之后本进程的增减直接累计在内存中；超过 resync 秒视为过期，
+    调用方重新读库，把其它进程的变化纳入进来。
+    """
+
+    def __init__(self, resync: float = 30.0, maxsize: int = 100000):
+        self.resync = resync
+        self.maxsize = maxsize
+        # key -> (计数, 读库时间)
+        self._counts: OrderedDict[K, tuple[int, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: K) -> int | None:
+        """未知或已过期时返回 None"""
+        with self._lock:
+            item = self._counts.get(key)
+            if item is None or time.monotonic() - item[1] >= self.resync:
+                return None
+            self._counts.move_to_end(key)
+            return item[0]
+
+    def set(self, key: K, value: int) -> None:
+        with self._lock:
+            self._counts[key] = (value, time.monotonic())
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.maxsize:
+                self._counts.popitem(last=False)
+
+    def add(self, key: K, delta: int) -> None:
+        """调整已知的计数，不刷新读库时间；未知的键忽略，下次读库即可"""
+        with self._lock:
+            item = self._counts.get(key)
+            if item is not None:
+                self._counts[key] = (max(0, item[0] + delta), item[1])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counts.clear()
@@ -1,3 +1,5 @@
+import hashlib
+import hmac
 from datetime import datetime, timedelta, timezone
 from typing import Any
 
@@ -11,10 +13,23 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 ALGORITHM = "HS256"
 
-
-def create_access_token(subject: str | Any, expires_delta: timedelta) -> str:
-    expire = datetime.now(timezone.utc) + expires_delta
-    to_encode = {"exp": expire, "sub": str(subject)}
+# "sk-sr-v1-" 加 4 位随机字符，足够辨认又不泄露 key
+API_KEY_PREFIX_LENGTH = 13
+
+
+def create_access_token(
+    subject: str | Any,
+    expires_delta: timedelta,
+    principal: dict[str, Any] | None = None,
+) -> str:
+    now = datetime.now(timezone.utc)
+    to_encode: dict[str, Any] = {
+        "exp": now + expires_delta,
+        "iat": now.timestamp(),
+        "sub": str(subject),
+    }
+    if principal is not None:
+        to_encode["prn"] = principal
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
@@ -25,3 +40,20 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+def hash_api_key(api_key: str) -> str:
+    """
+    API Key 本身是高熵随机串，用带密钥的 HMAC 即可防止从数据库导出中还原，
+    无需 bcrypt 这类慢哈希，认证仍是一次索引查询。
+    """
+    secret = settings.API_KEY_HMAC_SECRET or settings.SECRET_KEY
+    return hmac.new(secret.encode(), api_key.encode(), hashlib.sha256).hexdigest()
+
+
+def verify_api_key(api_key: str, api_key_hash: str) -> bool:
+    return hmac.compare_digest(hash_api_key(api_key), api_key_hash)
+
+
+def api_key_prefix(api_key: str) -> str:
+    return api_key[:API_KEY_PREFIX_LENGTH]
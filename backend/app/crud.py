@@ -1,16 +1,15 @@
 import uuid
-from typing import Any, Optional
+from typing import Any
 
 from sqlmodel import Session, select
 
 from app.core.security import get_password_hash, verify_password
-from app.models import Item, ItemCreate, SessionStatus, User, UserCreate, UserUpdate, UserSession, UserSessionCreate
+from app.models import Item, ItemCreate, User, UserCreate, UserUpdate
 
 
 def create_user(*, session: Session, user_create: UserCreate) -> User:
     db_obj = User.model_validate(
-        user_create, update={
-            "hashed_password": get_password_hash(user_create.password)}
+        user_create, update={"hashed_password": get_password_hash(user_create.password)}
     )
     session.add(db_obj)
     session.commit()
@@ -53,35 +52,3 @@ def create_item(*, session: Session, item_in: ItemCreate, owner_id: uuid.UUID) -
     session.commit()
     session.refresh(db_item)
     return db_item
-
-
-def create_user_session(*, session: Session, session_create: UserSessionCreate) -> UserSession:
-    db_obj = UserSession.model_validate(session_create)
-    session.add(db_obj)
-    session.commit()
-    session.refresh(db_obj)
-    return db_obj
-
-
-def get_user_session(*, session: Session, session_id: str, user_id: uuid.UUID) -> Optional[UserSession]:
-    statement = select(UserSession).where(
-        UserSession.session_id == session_id, UserSession.user_id == user_id)
-    return session.exec(statement).first()
-
-
-def deactivate_user_session(*, session: Session, session_id: str, user_id: uuid.UUID) -> Optional[UserSession]:
-    db_session = get_user_session(
-        session=session, session_id=session_id, user_id=user_id)
-    if db_session:
-        db_session.status = SessionStatus.STOPPED
-        session.add(db_session)
-        session.commit()
-        session.refresh(db_session)
-    return db_session
-
-
-def get_user_sessions(*, session: Session, user_id: uuid.UUID, skip: int = 0, limit: int = 100) -> list[UserSession]:
-    statement = select(UserSession).where(
-        UserSession.user_id == user_id,
-    ).order_by(UserSession.created_at.desc()).offset(skip).limit(limit)
-    return session.exec(statement).all()
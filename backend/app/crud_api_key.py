@@ -1,5 +1,9 @@
 import secrets
+
 from sqlmodel import Session
+
+from app.api.deps import invalidate_api_key
+from app.core.security import api_key_prefix, hash_api_key
 from app.models import User
 
 
@@ -13,6 +17,11 @@ def create_user_api_key(db: Session, user_id: int) -> str:
     if not user:
         raise ValueError("User not found")
 
-    user.api_key = generate_api_key()
+    # 只保存摘要，明文仅返回给调用方一次
+    api_key = generate_api_key()
+    old_api_key_hash = user.api_key_hash
+    user.api_key_hash = hash_api_key(api_key)
+    user.api_key_prefix = api_key_prefix(api_key)
     db.commit()
-    return user.api_key
+    invalidate_api_key(db, user.id, old_api_key_hash)
+    return api_key
@@ -1,48 +1,329 @@
-from sqlmodel import Session, select, col, func
-from app.models import SandboxUsage
-from app.schemas import SandboxUsageCreate
+import uuid
+from collections import defaultdict
+from collections.abc import Iterable
+from datetime import datetime, timedelta, timezone
+from typing import Any
 
-from datetime import datetime
+from sqlalchemy import text, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col, func, select
 
+from app.models import (
+    SandboxUsage,
+    SandboxUsageCreate,
+    SandboxUsageDaily,
+    SandboxUsageHourly,
+)
+from app.schemas import UsageStatsOut
 
-def create(db: Session, *, obj_in: SandboxUsageCreate) -> SandboxUsage:
+HOUR = timedelta(hours=1)
+DAY = timedelta(days=1)
+_ROLLUPS: tuple[tuple[type[SandboxUsageHourly | SandboxUsageDaily], timedelta], ...] = (
+    (SandboxUsageHourly, HOUR),
+    (SandboxUsageDaily, DAY),
+)
+DEFAULT_PARTITION = "sandboxusage_default"
+_ROLLUP_COLUMNS = (
+    "usage_count",
+    "total_duration",
+    "total_cost",
+    "total_cpu_seconds",
+    "total_output_bytes",
+)
+
+
+def cost_of(obj_in: SandboxUsageCreate) -> float:
     # 自动计算成本单位（示例：每秒0.01单位）
-    db_obj = SandboxUsage(
-        **obj_in.dict(),
-        cost_units=obj_in.duration_seconds * 0.01
-    )
+    return obj_in.duration_seconds * 0.01
+
+
+def create(db: Session, *, obj_in: SandboxUsageCreate) -> SandboxUsage:
+    db_obj = SandboxUsage.model_validate(obj_in, update={"cost_units": cost_of(obj_in)})
     db.add(db_obj)
+    db.flush()
+    _apply_rollups(db, [db_obj])
     db.commit()
     db.refresh(db_obj)
     return db_obj
 
 
+def create_many(db: Session, *, rows: list[dict[str, Any]]) -> int:
+    """
+    批量写入（多行 INSERT），已存在的 id 跳过，便于崩溃后重放。
+    只对真正插入的行更新预聚合表，与原始记录在同一事务中提交。
+    """
+    statement = (
+        insert(SandboxUsage)
+        .on_conflict_do_nothing(index_elements=["id", "executed_at"])
+        .returning(
+            SandboxUsage.user_id,
+            SandboxUsage.executed_at,
+            SandboxUsage.duration_seconds,
+            SandboxUsage.cost_units,
+            SandboxUsage.cpu_user_seconds,
+            SandboxUsage.cpu_system_seconds,
+            SandboxUsage.output_bytes,
+        )
+    )
+    inserted = db.execute(statement, rows).all()
+    _apply_rollups(db, inserted)
+    db.commit()
+    return len(inserted)
+
+
+def _apply_rollups(db: Session, records: Iterable[Any]) -> None:
+    """按小时、按天累加到预聚合表（INSERT ... ON CONFLICT DO UPDATE）"""
+    records = list(records)
+    if not records:
+        return
+    for model, step in _ROLLUPS:
+        buckets: dict[tuple[Any, datetime], list[float]] = defaultdict(
+            lambda: [0, 0.0, 0.0, 0.0, 0]
+        )
+        for r in records:
+            totals = buckets[(r.user_id, _floor(_utc_naive(r.executed_at), step))]
+            totals[0] += 1
+            totals[1] += r.duration_seconds
+            totals[2] += r.cost_units
+            totals[3] += r.cpu_user_seconds + r.cpu_system_seconds
+            totals[4] += r.output_bytes
+        statement = insert(model).values(
+            [
+                {
+                    "user_id": user_id,
+                    "bucket": bucket,
+                    **dict(zip(_ROLLUP_COLUMNS, totals, strict=True)),
+                }
+                for (user_id, bucket), totals in buckets.items()
+            ]
+        )
+        statement = statement.on_conflict_do_update(
+            index_elements=["user_id", "bucket"],
+            set_={
+                c: getattr(model, c) + getattr(statement.excluded, c)
+                for c in _ROLLUP_COLUMNS
+            },
+        )
+        db.execute(statement)
+
+
 def get_by_user(
     db: Session,
     user_id: int,
     *,
     skip: int = 0,
     limit: int = 100,
-    time_range: tuple[datetime, datetime] | None = None
+    time_range: tuple[datetime, datetime] | None = None,
+    after: tuple[datetime, uuid.UUID] | None = None,
 ) -> list[SandboxUsage]:
-    query = select(SandboxUsage).where(
-        SandboxUsage.user_id == user_id
-    )
+    """按 (executed_at, id) 倒序；after 为上一页最后一条的排序键（keyset 分页）"""
+    query = select(SandboxUsage).where(SandboxUsage.user_id == user_id)
     if time_range:
+        start, end = (_utc_naive(t) for t in time_range)
+        query = query.where(col(SandboxUsage.executed_at).between(start, end))
+    if after is not None:
+        at, id = after
         query = query.where(
-            col(SandboxUsage.executed_at).between(*time_range))
+            tuple_(SandboxUsage.executed_at, SandboxUsage.id)
+            < tuple_(_utc_naive(at), id)
+        )
+    query = query.order_by(
+        col(SandboxUsage.executed_at).desc(), col(SandboxUsage.id).desc()
+    )
     return db.exec(query.offset(skip).limit(limit)).all()
 
 
+def get_usage_stats(
+    db: Session, user_id: int, time_range: tuple[datetime, datetime] | None = None
+) -> UsageStatsOut:
+    """
+    汇总统计优先读预聚合表：整天读日表，整小时读小时表，
+    只有区间两端不足一小时的零头才扫描原始记录。
+    """
+    if time_range is None:
+        parts = [_rollup_totals(db, SandboxUsageDaily, user_id, None)]
+    else:
+        start, end = (_utc_naive(t) for t in time_range)
+        raw, hourly, daily = split_range(start, end)
+        parts = [_rollup_totals(db, SandboxUsageDaily, user_id, r) for r in daily]
+        parts += [_rollup_totals(db, SandboxUsageHourly, user_id, r) for r in hourly]
+        parts += [
+            _raw_totals(db, user_id, r, inclusive=i == len(raw) - 1)
+            for i, r in enumerate(raw)
+        ]
+    count = sum(p[0] for p in parts)
+    duration = sum(p[1] for p in parts)
+    cost = sum(p[2] for p in parts)
+    return UsageStatsOut(total_duration=duration, total_cost=cost, usage_count=count)
+
+
 def get_total_usage(
-    db: Session,
-    user_id: int,
-    time_range: tuple[datetime, datetime] | None = None
+    db: Session, user_id: int, time_range: tuple[datetime, datetime] | None = None
 ) -> float:
-    query = select(func.sum(SandboxUsage.cost_units)).where(
-        SandboxUsage.user_id == user_id
+    return get_usage_stats(db, user_id, time_range).total_cost
+
+
+def ensure_partitions(
+    db: Session, *, months_ahead: int = 3, now: datetime | None = None
+) -> list[str]:
+    """
+    创建当前月及之后 months_ahead 个月的分区（已存在则跳过），返回新建的分区名。
+    另有一个默认分区兜底，接收落在已建分区之外的记录（如补录的历史数据）。
+    """
+    month = _month_start(_utc_naive(now or datetime.now(timezone.utc)))
+    existing = set(_partitions(db))
+    created = []
+    if DEFAULT_PARTITION not in existing:
+        db.execute(
+            text(
+                f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF sandboxusage DEFAULT"
+            )
+        )
+        created.append(DEFAULT_PARTITION)
+    for _ in range(months_ahead + 1):
+        following = _next_month(month)
+        name = _partition_name(month)
+        if name not in existing:
+            db.execute(
+                text(
+                    f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF sandboxusage "
+                    f"FOR VALUES FROM ('{month.isoformat()}') TO ('{following.isoformat()}')"
+                )
+            )
+            created.append(name)
+        month = following
+    db.commit()
+    return created
+
+
+def drop_expired_partitions(
+    db: Session, *, retention_months: int, now: datetime | None = None
+) -> list[str]:
+    """
+    整个分区超出保留期后直接 DETACH + DROP，代替大范围 DELETE。
+    预聚合表不受影响，历史统计仍然可查。
+    """
+    if retention_months <= 0:
+        return []
+    cutoff = _month_start(_utc_naive(now or datetime.now(timezone.utc)))
+    for _ in range(retention_months):
+        cutoff = _month_start(cutoff - DAY)
+    dropped = []
+    for name in _partitions(db):
+        start = _partition_month(name)
+        if start is not None and _next_month(start) <= cutoff:
+            db.execute(text(f"ALTER TABLE sandboxusage DETACH PARTITION {name}"))
+            db.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    db.commit()
+    return dropped
+
+
+def _partitions(db: Session) -> list[str]:
+    rows = db.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = 'sandboxusage'"
+        )
     )
-    if time_range:
-        query = query.where(
-            col(SandboxUsage.executed_at).between(*time_range))
-    return db.scalar(query) or 0.0
+    return [r[0] for r in rows]
+
+
+def _partition_name(month: datetime) -> str:
+    return f"sandboxusage_y{month.year:04d}m{month.month:02d}"
+
+
+def _partition_month(name: str) -> datetime | None:
+    """sandboxusage_y2025m01 -> 2025-01-01，默认分区等返回 None"""
+    try:
+        year, month = name.removeprefix("sandboxusage_y").split("m")
+        return datetime(int(year), int(month), 1)
+    except ValueError:
+        return None
+
+
+def _month_start(dt: datetime) -> datetime:
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(month: datetime) -> datetime:
+    return _month_start(month + timedelta(days=32))
+
+
+def split_range(
+    start: datetime, end: datetime
+) -> tuple[
+    list[tuple[datetime, datetime]],
+    list[tuple[datetime, datetime]],
+    list[tuple[datetime, datetime]],
+]:
+    """
+    把 [start, end] 拆成 (原始零头, 整小时, 整天) 三组半开区间；
+    原始零头的最后一段包含 end。
+    """
+    h0, h1 = _ceil(start, HOUR), _floor(end, HOUR)
+    if h0 >= h1:
+        return [(start, end)], [], []
+    raw = [(start, h0), (h1, end)]
+    d0, d1 = _ceil(h0, DAY), _floor(h1, DAY)
+    if d0 < d1:
+        return raw, [(h0, d0), (d1, h1)], [(d0, d1)]
+    return raw, [(h0, h1)], []
+
+
+def _rollup_totals(
+    db: Session,
+    model: type[SandboxUsageHourly | SandboxUsageDaily],
+    user_id: int,
+    bucket_range: tuple[datetime, datetime] | None,
+) -> tuple[int, float, float]:
+    query = select(
+        func.coalesce(func.sum(model.usage_count), 0),
+        func.coalesce(func.sum(model.total_duration), 0.0),
+        func.coalesce(func.sum(model.total_cost), 0.0),
+    ).where(model.user_id == user_id)
+    if bucket_range:
+        lo, hi = bucket_range
+        if lo >= hi:
+            return 0, 0.0, 0.0
+        query = query.where(col(model.bucket) >= lo, col(model.bucket) < hi)
+    count, duration, cost = db.exec(query).one()
+    return int(count), float(duration), float(cost)
+
+
+def _raw_totals(
+    db: Session,
+    user_id: int,
+    time_range: tuple[datetime, datetime],
+    *,
+    inclusive: bool,
+) -> tuple[int, float, float]:
+    lo, hi = time_range
+    executed_at = col(SandboxUsage.executed_at)
+    upper = executed_at <= hi if inclusive else executed_at < hi
+    query = select(
+        func.count(),
+        func.coalesce(func.sum(SandboxUsage.duration_seconds), 0.0),
+        func.coalesce(func.sum(SandboxUsage.cost_units), 0.0),
+    ).where(SandboxUsage.user_id == user_id, executed_at >= lo, upper)
+    count, duration, cost = db.exec(query).one()
+    return int(count), float(duration), float(cost)
+
+
+def _utc_naive(dt: datetime) -> datetime:
+    """executed_at 列不带时区，统一按 UTC 比较"""
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def _floor(dt: datetime, step: timedelta) -> datetime:
+    dt = dt.replace(minute=0, second=0, microsecond=0)
+    return dt.replace(hour=0) if step == DAY else dt
+
+
+def _ceil(dt: datetime, step: timedelta) -> datetime:
+    floored = _floor(dt, step)
+    return floored if floored == dt else floored + step
@@ -0,0 +1,170 @@
+import uuid
+from datetime import datetime
+
+from sqlalchemy import text, tuple_, update
+from sqlmodel import col, func, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.models import SessionStatus, UserSession, UserSessionCreate
+
+# 沙箱会话路由运行在事件循环上，数据库访问必须是异步的，
+# 否则慢查询会阻塞同一循环上所有沙箱的输出读取
+
+
+async def create_user_session(
+    *, session: AsyncSession, session_create: UserSessionCreate
+) -> UserSession:
+    db_obj = UserSession.model_validate(session_create)
+    session.add(db_obj)
+    await session.commit()
+    await session.refresh(db_obj)
+    return db_obj
+
+
+async def get_user_session(
+    *, session: AsyncSession, session_id: str, user_id: uuid.UUID
+) -> UserSession | None:
+    statement = select(UserSession).where(
+        UserSession.session_id == session_id, UserSession.user_id == user_id
+    )
+    return (await session.exec(statement)).first()
+
+
+async def deactivate_user_session(
+    *,
+    session: AsyncSession,
+    session_id: str,
+    user_id: uuid.UUID,
+    status: SessionStatus = SessionStatus.STOPPED,
+) -> bool:
+    """
+    把会话标记为 status，返回记录是否确实从 STARTED 变过来。
+    先做带 status 条件的更新，并发或重复的请求中只有一个会得到 True，调用方据此归还运行中沙箱的名额。
+    """
+    owned = (
+        col(UserSession.session_id) == session_id,
+        col(UserSession.user_id) == user_id,
+    )
+    moved = await session.execute(
+        update(UserSession)
+        .where(*owned, col(UserSession.status) == SessionStatus.STARTED)
+        .values(status=status)
+    )
+    if moved.rowcount == 0:
+        await session.execute(update(UserSession).where(*owned).values(status=status))
+    await session.commit()
+    return moved.rowcount > 0
+
+
+async def set_user_session_node(
+    *, session: AsyncSession, session_id: str, node: str
+) -> None:
+    """沙箱迁移到其它节点后更新记录，API 重启后按新节点路由"""
+    statement = (
+        update(UserSession)
+        .where(col(UserSession.session_id) == session_id)
+        .values(node=node)
+    )
+    await session.execute(statement)
+    await session.commit()
+
+
+async def count_active_sessions(*, session: AsyncSession, user_id: uuid.UUID) -> int:
+    statement = (
+        select(func.count())
+        .select_from(UserSession)
+        .where(
+            UserSession.user_id == user_id, UserSession.status == SessionStatus.STARTED
+        )
+    )
+    return (await session.exec(statement)).one()
+
+
+async def lock_user_sessions(*, session: AsyncSession, user_id: uuid.UUID) -> None:
+    """
+    对该用户加事务级 advisory lock，直到 session 提交或回滚才释放。
+    检查运行中沙箱数和写入会话记录都在锁内完成，多个 worker 并发创建时不会超出名额。
+    """
+    key = int.from_bytes(user_id.bytes[:8], "big", signed=True)
+    await session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": key})
+
+
+async def renew_user_session(
+    *, session: AsyncSession, session_id: str, expires_at: datetime
+) -> None:
+    """恢复后会话重新运行，按新的有效期计时"""
+    statement = (
+        update(UserSession)
+        .where(col(UserSession.session_id) == session_id)
+        .values(status=SessionStatus.STARTED, expires_at=expires_at)
+    )
+    await session.execute(statement)
+    await session.commit()
+
+
+async def stop_expired_sessions(*, session: AsyncSession, now: datetime) -> int:
+    """已到期的会话标记为 STOPPED（沙箱已被节点休眠或销毁），走 expires_at 的部分索引"""
+    statement = (
+        update(UserSession)
+        .where(
+            UserSession.status == SessionStatus.STARTED,
+            col(UserSession.expires_at) <= now,
+        )
+        .values(status=SessionStatus.STOPPED)
+    )
+    result = await session.execute(statement)
+    await session.commit()
+    return result.rowcount
+
+
+async def stop_orphaned_sessions(
+    *,
+    session: AsyncSession,
+    live: set[str],
+    created_before: datetime,
+    batch: int = 1000,
+) -> int:
+    """
+    把沙箱已不存在的 STARTED 会话标记为 STOPPED，返回更新数量。
+    只处理 created_before 之前创建的会话，避免误伤核对期间刚创建的沙箱。
+    """
+    statement = select(UserSession.session_id).where(
+        UserSession.status == SessionStatus.STARTED,
+        col(UserSession.created_at) < created_before,
+    )
+    orphaned = [s for s in (await session.exec(statement)).all() if s not in live]
+    for i in range(0, len(orphaned), batch):
+        await session.execute(
+            update(UserSession)
+            .where(col(UserSession.session_id).in_(orphaned[i : i + batch]))
+            .values(status=SessionStatus.STOPPED)
+        )
+    await session.commit()
+    return len(orphaned)
+
+
+async def get_user_sessions(
+    *,
+    session: AsyncSession,
+    user_id: uuid.UUID,
+    skip: int = 0,
+    limit: int = 100,
+    after: tuple[datetime, uuid.UUID] | None = None,
+) -> list[UserSession]:
+    """
+    按 (created_at, id) 倒序列出会话。传入 after（上一页最后一条的排序键）时
+    走 keyset 分页，只扫描索引中该位置之后的记录，不随翻页深度变慢。
+    """
+    statement = select(UserSession).where(UserSession.user_id == user_id)
+    if after is not None:
+        statement = statement.where(
+            tuple_(UserSession.created_at, UserSession.id) < tuple_(*after)
+        )
+    statement = (
+        statement.order_by(
+            col(UserSession.created_at).desc(), col(UserSession.id).desc()
+        )
+        .offset(skip)
+        .limit(limit)
+    )
+    return list((await session.exec(statement)).all())
@@ -1,11 +1,26 @@
-from app.api.routes.sessions import service_lifespan
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
 import sentry_sdk
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.routing import APIRoute
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
 from starlette.middleware.cors import CORSMiddleware
 
+from app import crud_sandbox_usage, crud_user_session
 from app.api.main import api_router
+from app.api.routes.sessions import service_lifespan
 from app.core.config import settings
+from app.core.db import async_engine, engine
+from app.services.boxed_rpc import RpcConnectionError
+from app.token_revocation import revocation_list
+from app.usage_buffer import usage_buffer
+
+logger = logging.getLogger(__name__)
 
 
 def custom_generate_unique_id(route: APIRoute) -> str:
@@ -15,18 +30,74 @@ def custom_generate_unique_id(route: APIRoute) -> str:
 if settings.SENTRY_DSN and settings.ENVIRONMENT != "local":
     sentry_sdk.init(dsn=str(settings.SENTRY_DSN), enable_tracing=True)
 
+
+def maintain_usage_partitions() -> None:
+    with Session(engine) as session:
+        created = crud_sandbox_usage.ensure_partitions(
+            session, months_ahead=settings.USAGE_PARTITIONS_AHEAD
+        )
+        dropped = crud_sandbox_usage.drop_expired_partitions(
+            session, retention_months=settings.USAGE_RETENTION_MONTHS
+        )
+    if created or dropped:
+        logger.info("Usage partitions created %s, dropped %s", created, dropped)
+
+
+async def usage_partition_loop(interval: float = 24 * 3600) -> None:
+    """每天维护一次用量分区：提前建好未来的分区，删除超出保留期的分区"""
+    loop = asyncio.get_event_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, maintain_usage_partitions)
+        except Exception as e:
+            logger.error("Usage partition maintenance failed", exc_info=e)
+        await asyncio.sleep(interval)
+
+
+async def session_expiry_loop(
+    interval: float = settings.SESSION_EXPIRY_SYNC_SECONDS,
+) -> None:
+    """到期的沙箱由所在节点休眠或销毁，这里只把会话记录同步为 STOPPED"""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with AsyncSession(async_engine, expire_on_commit=False) as session:
+                stopped = await crud_user_session.stop_expired_sessions(
+                    session=session, now=datetime.now(timezone.utc)
+                )
+            if stopped:
+                logger.info("Marked %d expired sessions as stopped", stopped)
+        except Exception as e:
+            logger.error("Session expiry sync failed", exc_info=e)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    async with service_lifespan(app):
+        await usage_buffer.start()
+        await revocation_list.start()
+        maintenance = asyncio.create_task(usage_partition_loop())
+        expiry = asyncio.create_task(session_expiry_loop())
+        yield
+        expiry.cancel()
+        maintenance.cancel()
+        await revocation_list.close()
+        await usage_buffer.close()
+        await async_engine.dispose()
+
+
 app = FastAPI(
     title=settings.PROJECT_NAME,
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     generate_unique_id_function=custom_generate_unique_id,
-    lifespan=service_lifespan,
+    lifespan=lifespan,
 )
 
 # Set all CORS enabled origins
 if settings.all_cors_origins:
     app.add_middleware(
         CORSMiddleware,
-        allow_origins=["*"], # settings.all_cors_origins,
+        allow_origins=["*"],  # settings.all_cors_origins,
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
@@ -38,4 +109,10 @@ if settings.all_cors_origins:
 #     print("Headers received:", dict(request.headers))
 #     return await call_next(request)
 
+
+@app.exception_handler(RpcConnectionError)
+async def sandbox_host_unavailable(_request: Request, exc: RpcConnectionError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+
 app.include_router(api_router, prefix=settings.API_V1_STR)
@@ -1,14 +1,11 @@
-from sqlmodel import Field, Index, SQLModel
-from datetime import datetime, timezone
 import uuid
-from sqlalchemy.dialects.postgresql import JSONB  # PostgreSQL 专用
+from datetime import datetime, timezone
 from enum import Enum
 
 # 或者对于通用数据库使用：from sqlalchemy import JSON
-
 from pydantic import EmailStr
-from sqlmodel import Field, Relationship, SQLModel
-from typing import Optional, List
+from sqlalchemy import BigInteger, text
+from sqlmodel import Field, Index, Relationship, SQLModel
 
 
 # Shared properties
@@ -17,6 +14,7 @@ class UserBase(SQLModel):
     is_active: bool = True
     is_superuser: bool = False
     full_name: str | None = Field(default=None, max_length=255)
+    plan: str = Field(default="free", max_length=32)
 
 
 # Properties to receive via API on creation
@@ -49,15 +47,29 @@ class UpdatePassword(SQLModel):
 # Database model, database table inferred from class name
 class User(UserBase, table=True):
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
-    created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
+    created_at: datetime = Field(
+        default_factory=lambda: datetime.now(timezone.utc), index=True
+    )
     hashed_password: str
-    api_key: str | None = Field(default=None, unique=True, index=True)
+    # 只保存 API Key 的 HMAC 摘要和用于辨认的前缀，明文只在生成时返回一次
+    api_key_hash: str | None = Field(
+        default=None, unique=True, index=True, max_length=64
+    )
+    api_key_prefix: str | None = Field(default=None, max_length=16)
     items: list["Item"] = Relationship(back_populates="owner", cascade_delete=True)
     sessions: list["UserSession"] = Relationship(
         back_populates="user", cascade_delete=True
     )
 
 
+# Minimal identity for authorization checks, safe to cache outside a DB session
+class UserPrincipal(SQLModel):
+    id: uuid.UUID
+    is_active: bool = True
+    is_superuser: bool = False
+    plan: str = "free"
+
+
 # Properties to return via API, id is always required
 class UserPublic(UserBase):
     id: uuid.UUID
@@ -65,7 +77,8 @@ class UserPublic(UserBase):
 
 class UsersPublic(SQLModel):
     data: list[UserPublic]
-    count: int
+    count: int | None = None
+    next_cursor: str | None = None
 
 
 # Shared properties
@@ -81,9 +94,7 @@ class ItemCreate(ItemBase):
 
 # Properties to receive on item update
 class ItemUpdate(ItemBase):
-    title: str | None = Field(
-        default=None, min_length=1, max_length=255
-    )  # type: ignore
+    title: str | None = Field(default=None, min_length=1, max_length=255)  # type: ignore
 
 
 # Database model, database table inferred from class name
@@ -121,6 +132,15 @@ class Token(SQLModel):
 # Contents of JWT token
 class TokenPayload(SQLModel):
     sub: str | None = None
+    iat: float | None = None
+    # principal claims (is_active / is_superuser / plan), only in short-lived tokens
+    prn: dict | None = None
+
+
+# Tokens issued to the user before revoked_at are rejected
+class TokenRevocation(SQLModel, table=True):
+    user_id: uuid.UUID = Field(primary_key=True)
+    revoked_at: datetime = Field(index=True)
 
 
 class NewPassword(SQLModel):
@@ -133,6 +153,13 @@ class SandboxUsageBase(SQLModel):
     duration_seconds: float = Field(..., description="沙盒执行耗时（秒）")
     cost_units: float = Field(0, ge=0, description="计算成本单位（用于计费）")
     api_key_used: str | None = Field(None, description="触发执行的API Key")
+    session_id: str | None = Field(None, description="执行所在的沙箱会话")
+    cpu_user_seconds: float = Field(0, ge=0, description="用户态 CPU 时间（秒）")
+    cpu_system_seconds: float = Field(0, ge=0, description="内核态 CPU 时间（秒）")
+    peak_rss_bytes: int = Field(
+        0, ge=0, sa_type=BigInteger, description="沙箱内存峰值（字节）"
+    )
+    output_bytes: int = Field(0, ge=0, sa_type=BigInteger, description="输出字节数")
     # metadata: dict = Field(
     #     default_factory=dict,
     #     sa_type=JSONB(none_as_null=True)  # PostgreSQL推荐使用JSONB
@@ -140,21 +167,47 @@ class SandboxUsageBase(SQLModel):
 
 
 class SandboxUsage(SandboxUsageBase, table=True):
+    # 按月范围分区，分区由 crud_sandbox_usage.ensure_partitions 维护
+    __table_args__ = (
+        Index("ix_sandboxusage_user_id_executed_at", "user_id", "executed_at"),
+        {"postgresql_partition_by": "RANGE (executed_at)"},
+    )
     id: uuid.UUID = Field(
         default_factory=uuid.uuid4,
         primary_key=True,
-        index=True,
         nullable=False,
         description="外部暴露的唯一ID",
     )
-    user_id: uuid.UUID = Field(foreign_key="user.id", index=True)
+    user_id: uuid.UUID = Field(foreign_key="user.id")
     # box_id: int = Field(foreign_key="box.id")
+    # 分区键必须包含在主键中
     executed_at: datetime = Field(
         default_factory=lambda: datetime.now(timezone.utc),  # 使用时区敏感的UTC时间
+        primary_key=True,
     )
     cost_units: float = Field(0, description="计算成本单位（用于计费）")
 
 
+class SandboxUsageRollupBase(SQLModel):
+    """按时间桶预聚合的用量，随原始记录写入增量维护"""
+
+    user_id: uuid.UUID = Field(foreign_key="user.id", primary_key=True)
+    bucket: datetime = Field(primary_key=True, description="桶起始时间（UTC）")
+    usage_count: int = Field(0, sa_type=BigInteger)
+    total_duration: float = 0
+    total_cost: float = 0
+    total_cpu_seconds: float = 0
+    total_output_bytes: int = Field(0, sa_type=BigInteger)
+
+
+class SandboxUsageHourly(SandboxUsageRollupBase, table=True):
+    pass
+
+
+class SandboxUsageDaily(SandboxUsageRollupBase, table=True):
+    pass
+
+
 class SandboxUsageCreate(SandboxUsageBase):
     """创建时自动生成id和executed_at"""
 
@@ -180,14 +233,26 @@ class UserSessionBase(SQLModel):
         default_factory=lambda: datetime.now(timezone.utc),
         index=True,
     )
-    expires_at: Optional[datetime] = Field(default=None)
+    expires_at: datetime | None = Field(default=None)
     status: SessionStatus = Field(default=SessionStatus.STARTED)
+    # 多节点部署时沙箱所在的节点
+    node: str | None = Field(default=None, max_length=64)
     # metadata: Optional[dict] = Field(default=None, sa_type=JSONB)
 
 
 class UserSession(UserSessionBase, table=True):
     __table_args__ = (
         Index("idx_created_at_brin", "created_at", postgresql_using="brin"),  # 复合索引
+        # 按用户列出会话的 keyset 分页
+        Index("ix_usersession_user_id_created_at_id", "user_id", "created_at", "id"),
+        # 校验会话归属
+        Index("ix_usersession_session_id_user_id", "session_id", "user_id"),
+        # 到期同步只扫描仍在运行的会话
+        Index(
+            "ix_usersession_expires_at_started",
+            "expires_at",
+            postgresql_where=text("status = 'STARTED'"),
+        ),
     )
     id: uuid.UUID = Field(default_factory=uuid.uuid4, primary_key=True)
     user_id: uuid.UUID = Field(foreign_key="user.id")
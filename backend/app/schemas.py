@@ -1,12 +1,12 @@
 from pydantic import BaseModel
-from datetime import datetime
-from typing import Optional
 
 from .models import SandboxUsageOut
 
 
 class APIKeyOut(BaseModel):
+    # 创建时为完整 key，查询时只返回打码后的前缀
     api_key: str
+    prefix: str
 
 
 # class UsageTimeRange(BaseModel):
@@ -22,7 +22,8 @@ class UsageStatsOut(BaseModel):
 
 class PaginatedUsagesOut(BaseModel):
     items: list[SandboxUsageOut]
-    total: int
+    total: int | None = None
     page: int
     limit: int
-    stats: UsageStatsOut
+    stats: UsageStatsOut | None = None
+    next_cursor: str | None = None
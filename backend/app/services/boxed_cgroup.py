@@ -0,0 +1,172 @@
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any
+
+CGROUP_ROOT = os.getenv("CGROUP_ROOT", "/sys/fs/cgroup")
+CGROUP_PARENT = os.getenv("CGROUP_PARENT", "steprun")
+CGROUP_CONTROLLERS = ("memory", "cpu", "pids", "io")
+CPU_PERIOD_US = 100_000
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str) -> int | None:
+    value = os.getenv(name)
+    return int(value) if value else None
+
+
+def _env_float(name: str) -> float | None:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+@dataclass(frozen=True)
+class BoxLimits:
+    """
+    单个沙箱的资源上限，None 表示不限制。
+    memory_max 单位字节，cpu_max 单位为核数（0.5 即半个核），io_max 为原样写入 io.max 的行，如 "8:0 wbps=10485760"。
+    """
+
+    memory_max: int | None = None
+    cpu_max: float | None = None
+    pids_max: int | None = None
+    io_max: str | None = None
+
+    @classmethod
+    def from_env(cls) -> "BoxLimits":
+        """预热沙箱使用的默认上限，分配给用户时再按套餐调整"""
+        return cls(
+            memory_max=_env_int("BOX_MEMORY_MAX"),
+            cpu_max=_env_float("BOX_CPU_MAX"),
+            pids_max=_env_int("BOX_PIDS_MAX"),
+            io_max=os.getenv("BOX_IO_MAX") or None,
+        )
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+class BoxCgroup:
+    """沙箱对应的 cgroup v2 子组：$CGROUP_ROOT/$CGROUP_PARENT/box_<id>"""
+
+    _enabled: bool | None = None
+
+    def __init__(self, box_id: str):
+        self.path = Path(CGROUP_ROOT) / CGROUP_PARENT / f"box_{box_id}"
+
+    @classmethod
+    def enabled(cls) -> bool:
+        """
+        检查 cgroup v2 是否可用，并在父组上打开所需控制器，只做一次。
+        父组的上级必须已经委派这些控制器，否则不启用资源限制。
+        """
+        if cls._enabled is None:
+            cls._enabled = cls._setup()
+        return cls._enabled
+
+    @classmethod
+    def _setup(cls) -> bool:
+        root = Path(CGROUP_ROOT)
+        if not (root / "cgroup.controllers").exists():
+            logger.warning("cgroup v2 not mounted at %s, box limits disabled", root)
+            return False
+        parent = root / CGROUP_PARENT
+        try:
+            parent.mkdir(exist_ok=True)
+            available = (parent / "cgroup.controllers").read_text().split()
+            wanted = [c for c in CGROUP_CONTROLLERS if c in available]
+            missing = set(CGROUP_CONTROLLERS) - set(wanted)
+            if missing:
+                logger.warning("cgroup controllers not delegated: %s", sorted(missing))
+            (parent / "cgroup.subtree_control").write_text(
+                " ".join(f"+{c}" for c in wanted)
+            )
+        except OSError as e:
+            logger.warning(
+                "Cannot prepare cgroup %s: %s, box limits disabled", parent, e
+            )
+            return False
+        return True
+
+    def apply(self, limits: BoxLimits) -> None:
+        """创建（如不存在）并写入资源上限，可对运行中的沙箱重复调用"""
+        self.path.mkdir(exist_ok=True)
+        self._write("memory.max", _or_max(limits.memory_max))
+        self._write("memory.swap.max", "0" if limits.memory_max else "max")
+        if limits.cpu_max:
+            self._write(
+                "cpu.max", f"{int(limits.cpu_max * CPU_PERIOD_US)} {CPU_PERIOD_US}"
+            )
+        else:
+            self._write("cpu.max", f"max {CPU_PERIOD_US}")
+        self._write("pids.max", _or_max(limits.pids_max))
+        if limits.io_max:
+            for line in limits.io_max.splitlines():
+                self._write("io.max", line)
+
+    def attach_self(self) -> None:
+        """把当前进程移入本组；在 preexec_fn 中调用，exec 前完成，不存在逃逸窗口"""
+        with open(self.path / "cgroup.procs", "w") as f:
+            f.write("0")
+
+    def usage(self) -> dict[str, int]:
+        """读取当前资源用量"""
+        usage: dict[str, int] = {}
+        for key, file in (
+            ("memory_current", "memory.current"),
+            ("memory_peak", "memory.peak"),
+            ("pids_current", "pids.current"),
+        ):
+            value = self._read(file)
+            if value and value.isdigit():
+                usage[key] = int(value)
+        for line in (self._read("cpu.stat") or "").splitlines():
+            key, _, value = line.partition(" ")
+            if key in ("usage_usec", "user_usec", "system_usec"):
+                usage[f"cpu_{key}"] = int(value)
+        read_bytes = write_bytes = 0
+        for line in (self._read("io.stat") or "").splitlines():
+            for field in line.split()[1:]:
+                key, _, value = field.partition("=")
+                if key == "rbytes":
+                    read_bytes += int(value)
+                elif key == "wbytes":
+                    write_bytes += int(value)
+        usage["io_read_bytes"] = read_bytes
+        usage["io_write_bytes"] = write_bytes
+        return usage
+
+    def destroy(self) -> None:
+        """杀掉组内残留进程并删除子组"""
+        if not self.path.exists():
+            return
+        if (self.path / "cgroup.kill").exists():
+            self._write("cgroup.kill", "1")
+        for _ in range(20):
+            try:
+                self.path.rmdir()
+                return
+            except FileNotFoundError:
+                return
+            except OSError:
+                time.sleep(0.05)  # 进程退出后组才能删除
+        logger.warning("cgroup %s still busy, left behind", self.path)
+
+    def _write(self, name: str, value: str) -> None:
+        try:
+            (self.path / name).write_text(value)
+        except OSError as e:
+            logger.warning("Cannot write %s=%s to %s: %s", name, value, self.path, e)
+
+    def _read(self, name: str) -> str | None:
+        try:
+            return (self.path / name).read_text().strip()
+        except OSError:
+            return None
+
+
+def _or_max(value: int | None) -> str:
+    return str(value) if value else "max"
@@ -0,0 +1,211 @@
+import asyncio
+import itertools
+import logging
+from typing import Any
+
+from .boxed_cgroup import BoxLimits
+from .boxed_process import BoxEvent, ExecResult
+from .boxed_rpc import (
+    BOXED_HOST_SOCKET,
+    BOXED_HOST_TOKEN,
+    RpcConnectionError,
+    decode_error,
+    open_connection,
+    read_message,
+    write_message,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class BoxedClient:
+    """
+    与 BoxedService 接口相同，但通过 Unix socket（或 tcp://host:port）调用沙箱宿主进程（boxed_host）。
+    每个 API worker 持有一个连接，请求按 id 复用同一连接，断开后下次调用时重连。
+    """
+
+    def __init__(
+        self, address: str = BOXED_HOST_SOCKET, token: str | None = BOXED_HOST_TOKEN
+    ):
+        self.address = address
+        self.token = token
+        self._reader: asyncio.StreamReader | None = None
+        self._writer: asyncio.StreamWriter | None = None
+        self._read_task: asyncio.Task | None = None
+        self._write_lock = asyncio.Lock()
+        self._connect_lock = asyncio.Lock()
+        self._pending: dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+
+    async def init(self):
+        try:
+            await self._connect()
+        except RpcConnectionError as e:
+            # 宿主进程可能还在启动，第一次调用时再连
+            logger.warning("%s, will retry on first request", e)
+        return self
+
+    async def close(self) -> None:
+        if self._read_task:
+            self._read_task.cancel()
+            await asyncio.gather(self._read_task, return_exceptions=True)
+            self._read_task = None
+        if self._writer:
+            self._writer.close()
+            self._writer = None
+        self._fail_pending(RpcConnectionError("Sandbox host connection closed"))
+
+    async def create_session(
+        self, limits: BoxLimits | None = None, ttl: float | None = None
+    ) -> str:
+        return await self._call("create_session", limits=limits, ttl=ttl)
+
+    async def exec_code(
+        self,
+        box_id: str,
+        code: str,
+        tenant: str | None = None,
+        weight: float = 1.0,
+    ) -> ExecResult:
+        result = await self._call(
+            "exec_code", box_id=box_id, code=code, tenant=tenant, weight=weight
+        )
+        return ExecResult(**result)
+
+    async def events(self, box_id: str) -> list[BoxEvent]:
+        return [BoxEvent(**e) for e in await self._call("events", box_id=box_id)]
+
+    async def install_packages(self, box_id: str, packages: list[str]) -> None:
+        await self._call("install_packages", box_id=box_id, packages=packages)
+
+    async def snapshot(self, box_id: str) -> str:
+        return await self._call("snapshot", box_id=box_id)
+
+    async def restore(
+        self,
+        box_id: str,
+        snapshot_id: str,
+        limits: BoxLimits | None = None,
+        ttl: float | None = None,
+    ) -> None:
+        await self._call(
+            "restore", box_id=box_id, snapshot_id=snapshot_id, limits=limits, ttl=ttl
+        )
+
+    async def usage(self, box_id: str) -> dict[str, int]:
+        return await self._call("usage", box_id=box_id)
+
+    async def destroy(self, box_id: str) -> None:
+        await self._call("destroy", box_id=box_id)
+
+    async def stats(self) -> dict[str, Any]:
+        return await self._call("stats")
+
+    async def has_box(self, box_id: str) -> bool:
+        return await self._call("has_box", box_id=box_id)
+
+    async def boxes(self, include_hibernated: bool = False) -> list[str]:
+        return await self._call("boxes", include_hibernated=include_hibernated)
+
+    async def export_box(self, box_id: str) -> dict[str, Any]:
+        export = await self._call("export_box", box_id=box_id)
+        if export.get("limits") is not None:
+            export["limits"] = BoxLimits(**export["limits"])
+        return export
+
+    async def read_output(
+        self, box_id: str, output_id: str, stream: str, offset: int, size: int
+    ) -> dict[str, Any]:
+        return await self._call(
+            "read_output",
+            box_id=box_id,
+            output_id=output_id,
+            stream=stream,
+            offset=offset,
+            size=size,
+        )
+
+    async def read_export(self, box_id: str, offset: int, size: int) -> str:
+        return await self._call("read_export", box_id=box_id, offset=offset, size=size)
+
+    async def finish_export(self, box_id: str, moved: bool) -> None:
+        await self._call("finish_export", box_id=box_id, moved=moved)
+
+    async def begin_import(self, box_id: str) -> None:
+        await self._call("begin_import", box_id=box_id)
+
+    async def write_import(self, box_id: str, offset: int, data: str) -> int:
+        return await self._call("write_import", box_id=box_id, offset=offset, data=data)
+
+    async def finish_import(
+        self,
+        box_id: str,
+        snapshot_id: str,
+        limits: BoxLimits | None = None,
+        expires_at: float | None = None,
+    ) -> None:
+        await self._call(
+            "finish_import",
+            box_id=box_id,
+            snapshot_id=snapshot_id,
+            limits=limits,
+            expires_at=expires_at,
+        )
+
+    async def abort_import(self, box_id: str) -> None:
+        await self._call("abort_import", box_id=box_id)
+
+    async def _call(self, method: str, **params: Any) -> Any:
+        await self._connect()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        message = {"id": request_id, "method": method, "params": params}
+        if self.token:
+            message["token"] = self.token
+        try:
+            await write_message(self._writer, message, self._write_lock)
+            response = await future
+        except ConnectionError as e:
+            raise RpcConnectionError(f"Sandbox host unavailable: {e}") from e
+        finally:
+            self._pending.pop(request_id, None)
+        if "error" in response:
+            raise decode_error(response["error"])
+        return response.get("result")
+
+    async def _connect(self) -> None:
+        if self._writer and not self._writer.is_closing():
+            return
+        async with self._connect_lock:
+            if self._writer and not self._writer.is_closing():
+                return
+            try:
+                self._reader, self._writer = await open_connection(self.address)
+            except OSError as e:
+                raise RpcConnectionError(f"Sandbox host unavailable: {e}") from e
+            self._read_task = asyncio.create_task(
+                self._read_loop(self._reader, self._writer)
+            )
+
+    async def _read_loop(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        try:
+            while True:
+                message = await read_message(reader)
+                if message is None:
+                    break
+                future = self._pending.get(message.get("id"))
+                if future and not future.done():
+                    future.set_result(message)
+        except (ConnectionError, ValueError) as e:
+            logger.warning("Sandbox host connection lost: %s", e)
+        finally:
+            writer.close()
+            self._fail_pending(RpcConnectionError("Sandbox host connection lost"))
+
+    def _fail_pending(self, error: Exception) -> None:
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
@@ -0,0 +1,361 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from .boxed_cgroup import BoxLimits
+from .boxed_client import BoxedClient
+from .boxed_process import BoxEvent, ExecResult
+from .boxed_rpc import BOXED_HOST_TOKEN, RpcConnectionError
+
+# 节点容量的刷新间隔（秒）
+BOX_NODE_REFRESH = float(os.getenv("BOX_NODE_REFRESH", "5"))
+# 未设置内存上限的沙箱，放置时按这个大小估算
+BOX_PLACEMENT_MEMORY = int(os.getenv("BOX_PLACEMENT_MEMORY", str(256 * 1024 * 1024)))
+# 查询节点状态的超时（秒），超时的节点暂不参与放置
+BOX_NODE_TIMEOUT = float(os.getenv("BOX_NODE_TIMEOUT", "2"))
+# 迁移时每次传输的数据块大小，base64 后须小于 RPC 单条消息上限
+MIGRATE_CHUNK = int(os.getenv("BOX_MIGRATE_CHUNK", str(4 * 1024 * 1024)))
+# 最满与最空节点的内存占用率相差超过该值时，rebalance 才会迁移沙箱
+BOX_REBALANCE_THRESHOLD = float(os.getenv("BOX_REBALANCE_THRESHOLD", "0.2"))
+
+logger = logging.getLogger(__name__)
+
+
+def parse_nodes(spec: str) -> dict[str, str]:
+    """ "a=unix:/run/a.sock,b=tcp://10.0.0.2:7700" -> {"a": ..., "b": ...}"""
+    nodes = {}
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        name, sep, address = item.partition("=")
+        if not sep or not name.strip() or not address.strip():
+            raise ValueError(f"Invalid node spec {item!r}, expected name=address")
+        nodes[name.strip()] = address.strip()
+    return nodes
+
+
+@dataclass
+class BoxNode:
+    name: str
+    client: BoxedClient
+    stats: dict[str, Any] = field(default_factory=dict)
+    healthy: bool = False
+    refreshed_at: float = 0.0
+
+    def headroom(self, limits: BoxLimits | None) -> float:
+        """按内存、CPU、沙箱数估算还能放下几个这样的沙箱，取最紧的一项"""
+        if not self.healthy or not self.stats:
+            return 0
+        s = self.stats
+        memory = (limits and limits.memory_max) or BOX_PLACEMENT_MEMORY
+        slots = s.get("memory_available", 0) / memory
+        cpu = limits and limits.cpu_max
+        if cpu:
+            busy = max(s.get("load", 0.0), s.get("cpu_committed", 0.0))
+            slots = min(slots, (s.get("cpu_count", 1) - busy) / cpu)
+        if s.get("max_boxes"):
+            slots = min(slots, s["max_boxes"] - s.get("boxes", 0))
+        return slots
+
+    @property
+    def pressure(self) -> float:
+        """内存占用率，rebalance 据此判断冷热"""
+        total = self.stats.get("memory_total", 0)
+        if not total:
+            return 0.0
+        return 1 - self.stats.get("memory_available", 0) / total
+
+    def reserve(self, limits: BoxLimits | None) -> None:
+        """放置后先在本地扣减，避免两次刷新之间的请求都落到同一个节点"""
+        self.stats["boxes"] = self.stats.get("boxes", 0) + 1
+        self.stats["memory_available"] = self.stats.get("memory_available", 0) - (
+            (limits and limits.memory_max) or BOX_PLACEMENT_MEMORY
+        )
+        self.stats["cpu_committed"] = self.stats.get("cpu_committed", 0.0) + (
+            (limits and limits.cpu_max) or 0
+        )
+
+
+class BoxedCluster:
+    """
+    与 BoxedService 接口相同，沙箱分布在多个节点（各自运行 boxed_host）上。
+    创建时按剩余容量选择节点，之后的请求按 box_id -> 节点 的路由表转发；
+    路由表缺失（如 API 重启）时向所有节点询问并记住结果。
+    """
+
+    def __init__(
+        self,
+        nodes: dict[str, str],
+        refresh_interval: float = BOX_NODE_REFRESH,
+        token: str | None = BOXED_HOST_TOKEN,
+    ):
+        if not nodes:
+            raise ValueError("At least one sandbox node is required")
+        self.nodes = {
+            name: BoxNode(name, BoxedClient(address, token=token))
+            for name, address in nodes.items()
+        }
+        self._refresh_interval = refresh_interval
+        self._locate: dict[str, str] = {}
+        self._refresh_task: asyncio.Task | None = None
+
+    async def init(self):
+        for node in self.nodes.values():
+            await node.client.init()
+        await self.refresh()
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+        return self
+
+    async def close(self) -> None:
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            await asyncio.gather(self._refresh_task, return_exceptions=True)
+            self._refresh_task = None
+        for node in self.nodes.values():
+            await node.client.close()
+
+    async def refresh(self) -> None:
+        await asyncio.gather(*(self._refresh_node(n) for n in self.nodes.values()))
+
+    async def _refresh_node(self, node: BoxNode) -> None:
+        try:
+            node.stats = await asyncio.wait_for(node.client.stats(), BOX_NODE_TIMEOUT)
+            node.healthy = True
+            node.refreshed_at = time.time()
+        except (RpcConnectionError, asyncio.TimeoutError) as e:
+            if node.healthy:
+                logger.warning("Sandbox node %s unavailable: %s", node.name, e)
+            node.healthy = False
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._refresh_interval)
+            await self.refresh()
+
+    def node_of(self, box_id: str) -> str | None:
+        return self._locate.get(box_id)
+
+    def assign(self, box_id: str, node: str) -> None:
+        if node not in self.nodes:
+            raise ValueError(f"Unknown sandbox node {node}")
+        self._locate[box_id] = node
+
+    def place(self, limits: BoxLimits | None = None) -> list[BoxNode]:
+        """能放下该沙箱的节点，剩余容量大的在前"""
+        candidates = [n for n in self.nodes.values() if n.headroom(limits) >= 1]
+        return sorted(
+            candidates,
+            key=lambda n: (n.headroom(limits), -n.stats.get("boxes", 0)),
+            reverse=True,
+        )
+
+    async def create_session(
+        self, limits: BoxLimits | None = None, ttl: float | None = None
+    ) -> str:
+        for node in self.place(limits):
+            try:
+                box_id = await node.client.create_session(limits, ttl)
+            except RpcConnectionError as e:
+                logger.warning("Sandbox node %s unavailable: %s", node.name, e)
+                node.healthy = False
+                continue
+            node.reserve(limits)
+            self._locate[box_id] = node.name
+            return box_id
+        raise RuntimeError("No sandbox node has capacity for a new box")
+
+    async def exec_code(
+        self,
+        box_id: str,
+        code: str,
+        tenant: str | None = None,
+        weight: float = 1.0,
+    ) -> ExecResult:
+        return await self._invoke(box_id, "exec_code", code, tenant, weight)
+
+    async def events(self, box_id: str) -> list[BoxEvent]:
+        return await self._invoke(box_id, "events")
+
+    async def install_packages(self, box_id: str, packages: list[str]) -> None:
+        await self._invoke(box_id, "install_packages", packages)
+
+    async def snapshot(self, box_id: str) -> str:
+        return await self._invoke(box_id, "snapshot")
+
+    async def restore(
+        self,
+        box_id: str,
+        snapshot_id: str,
+        limits: BoxLimits | None = None,
+        ttl: float | None = None,
+    ) -> None:
+        await self._invoke(box_id, "restore", snapshot_id, limits, ttl)
+
+    async def read_output(
+        self, box_id: str, output_id: str, stream: str, offset: int, size: int
+    ) -> dict[str, Any]:
+        return await self._invoke(
+            box_id, "read_output", output_id, stream, offset, size
+        )
+
+    async def usage(self, box_id: str) -> dict[str, int]:
+        return await self._invoke(box_id, "usage")
+
+    async def destroy(self, box_id: str) -> None:
+        await self._invoke(box_id, "destroy")
+        self._locate.pop(box_id, None)
+
+    async def stats(self) -> dict[str, Any]:
+        return {
+            name: {**node.stats, "healthy": node.healthy}
+            for name, node in self.nodes.items()
+        }
+
+    async def boxes(self, include_hibernated: bool = False) -> list[str]:
+        """所有节点上已分配的沙箱；任一节点不可达时抛出 RpcConnectionError，避免误判沙箱已丢失"""
+        found = await asyncio.gather(
+            *(n.client.boxes(include_hibernated) for n in self.nodes.values())
+        )
+        return [box_id for boxes in found for box_id in boxes]
+
+    async def has_box(self, box_id: str) -> bool:
+        try:
+            await self._route(box_id)
+        except KeyError:
+            return False
+        return True
+
+    async def migrate_box(
+        self, box_id: str, target: str | None = None
+    ) -> dict[str, Any]:
+        """
+        在线迁移：源节点检查点并停止沙箱，把打包后的工作目录和镜像分块传给目标节点，
+        目标节点恢复后切换路由。沙箱从停止到恢复的时间记为 pause_seconds。
+        任何一步失败都会让源节点从迁移快照就地恢复。
+        """
+        source = self._locate.get(box_id) or await self._find(box_id)
+        if target is None:
+            candidates = [n for n in self.place() if n.name != source]
+            if not candidates:
+                raise RuntimeError("No sandbox node has capacity for the box")
+            target = candidates[0].name
+        elif target not in self.nodes:
+            raise ValueError(f"Unknown sandbox node {target}")
+        if target == source:
+            raise ValueError(f"Box {box_id} is already on node {target}")
+        src, dst = self.nodes[source].client, self.nodes[target].client
+
+        started = time.monotonic()
+        export = await src.export_box(box_id)
+        limits: BoxLimits | None = export.get("limits")
+        moved = False
+        try:
+            await dst.begin_import(box_id)
+            try:
+                offset = 0
+                while offset < export["size"]:
+                    data = await src.read_export(box_id, offset, MIGRATE_CHUNK)
+                    if not data:
+                        raise RuntimeError(f"Box {box_id} archive ended early")
+                    offset = await dst.write_import(box_id, offset, data)
+                await dst.finish_import(
+                    box_id, export["snapshot_id"], limits, export.get("expires_at")
+                )
+            except BaseException:
+                try:
+                    await dst.abort_import(box_id)
+                except Exception as e:
+                    logger.warning(
+                        "Abort import of %s on %s failed: %s", box_id, target, e
+                    )
+                raise
+            moved = True
+            pause = time.monotonic() - started
+            self._locate[box_id] = target
+            self.nodes[target].reserve(limits)
+        finally:
+            await src.finish_export(box_id, moved)
+        logger.info(
+            "Box %s migrated %s -> %s, %d bytes, paused %.3fs",
+            box_id,
+            source,
+            target,
+            export["size"],
+            pause,
+        )
+        return {
+            "box_id": box_id,
+            "source": source,
+            "target": target,
+            "bytes": export["size"],
+            "pause_seconds": pause,
+        }
+
+    async def rebalance(
+        self, threshold: float = BOX_REBALANCE_THRESHOLD, max_moves: int = 1
+    ) -> list[dict[str, Any]]:
+        """把最满节点上的沙箱迁往最空的节点，直到两者的内存占用率相差不超过 threshold"""
+        moves: list[dict[str, Any]] = []
+        for _ in range(max_moves):
+            await self.refresh()
+            nodes = [n for n in self.nodes.values() if n.healthy]
+            if len(nodes) < 2:
+                break
+            hot = max(nodes, key=lambda n: n.pressure)
+            cold = min(nodes, key=lambda n: n.pressure)
+            if hot.pressure - cold.pressure <= threshold:
+                break
+            boxes = await hot.client.boxes()
+            if not boxes:
+                break
+            try:
+                moves.append(await self.migrate_box(boxes[0], cold.name))
+            except (KeyError, ValueError, RuntimeError) as e:
+                # 已完成的迁移照常返回，调用方要据此更新会话记录
+                logger.warning("Rebalance %s -> %s stopped: %s", hot.name, cold.name, e)
+                break
+        return moves
+
+    async def _invoke(self, box_id: str, method: str, *args: Any) -> Any:
+        """
+        按路由表转发。沙箱可能已被迁走（其它 worker 做的迁移不会更新本进程的路由表），
+        节点上找不到时重新查找一次。
+        """
+        client = await self._route(box_id)
+        try:
+            return await getattr(client, method)(box_id, *args)
+        except (KeyError, ValueError, RuntimeError):
+            if await client.has_box(box_id):
+                raise
+            self._locate.pop(box_id, None)
+            moved = await self._route(box_id)
+            if moved is client:
+                raise
+        return await getattr(moved, method)(box_id, *args)
+
+    async def _route(self, box_id: str) -> BoxedClient:
+        name = self._locate.get(box_id)
+        if name is None:
+            name = await self._find(box_id)
+        return self.nodes[name].client
+
+    async def _find(self, box_id: str) -> str:
+        nodes = [n for n in self.nodes.values() if n.healthy]
+
+        async def probe(node: BoxNode) -> bool:
+            try:
+                return await asyncio.wait_for(
+                    node.client.has_box(box_id), BOX_NODE_TIMEOUT
+                )
+            except (RpcConnectionError, asyncio.TimeoutError):
+                return False
+
+        found = await asyncio.gather(*(probe(n) for n in nodes))
+        for node, has in zip(nodes, found, strict=True):
+            if has:
+                self._locate[box_id] = node.name
+                return node.name
+        raise KeyError(box_id)
@@ -0,0 +1,152 @@
+import asyncio
+import logging
+import os
+import time
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+from .boxed_process import SANDBOX_PREFIX
+from .boxed_reaper import BoxedReaper
+
+# 两轮扫描之间的间隔（秒），0 为关闭
+GC_INTERVAL = float(os.getenv("BOX_GC_INTERVAL", "300"))
+# 每轮最多检查的目录项数，限制单轮的 I/O
+GC_BATCH = int(os.getenv("BOX_GC_BATCH", "200"))
+# 修改时间在这之内的目录不处理，避开正在创建、还没登记的沙箱
+GC_MIN_AGE = float(os.getenv("BOX_GC_MIN_AGE", "600"))
+
+logger = logging.getLogger(__name__)
+
+
+class BoxedGC:
+    """
+    增量扫描 SANDBOX_ROOT，把不属于任何已知沙箱的目录（启动失败、崩溃、旧进程遗留）交给 reaper，
+    先移入回收站再删除。游标跨轮次推进，每轮只检查 batch 个目录项。
+    """
+
+    def __init__(
+        self,
+        is_known: Callable[[str], bool],
+        reaper: BoxedReaper,
+        snapshot_dir: str,
+        migrate_dir: str,
+        interval: float = GC_INTERVAL,
+        batch: int = GC_BATCH,
+        min_age: float = GC_MIN_AGE,
+    ):
+        self._is_known = is_known
+        self._reaper = reaper
+        self._snapshot_dir = snapshot_dir
+        self._migrate_dir = migrate_dir
+        self._interval = interval
+        self._batch = max(1, batch)
+        self._min_age = min_age
+        self._cursor: Iterator[tuple[Path, str]] | None = None
+        self._task: asyncio.Task | None = None
+        self.reclaimed_entries = 0
+        self.reclaimed_bytes = 0
+
+    def start(self) -> None:
+        if self._interval > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            try:
+                await self.collect()
+            except Exception as e:
+                logger.error("Sandbox GC cycle failed", exc_info=e)
+
+    async def collect(self) -> int:
+        """执行一轮：检查下一批目录项，回收孤儿，返回本轮回收的字节数"""
+        loop = asyncio.get_event_loop()
+        scanned = await loop.run_in_executor(None, self._scan_batch)
+        # 是否已知在事件循环里判断，与 manager 的状态变更不会交错
+        orphans = [
+            (path, box_id) for path, box_id in scanned if not self._is_known(box_id)
+        ]
+        reclaimed = count = 0
+        for path, box_id in orphans:
+            size = await loop.run_in_executor(None, _disk_usage, path)
+            if self._is_known(box_id):
+                continue  # 统计期间被登记了
+            self._reaper.submit(None, [path])
+            reclaimed += size
+            count += 1
+        if count:
+            self.reclaimed_entries += count
+            self.reclaimed_bytes += reclaimed
+            logger.info(
+                "Sandbox GC reclaimed %d orphaned entries, %d bytes", count, reclaimed
+            )
+        return reclaimed
+
+    def _scan_batch(self) -> list[tuple[Path, str]]:
+        """从游标处取下一批足够旧的候选，扫完一遍后下一轮从头开始"""
+        if self._cursor is None:
+            self._cursor = self._candidates()
+        batch = []
+        cutoff = time.time() - self._min_age
+        for _ in range(self._batch):
+            item = next(self._cursor, None)
+            if item is None:
+                self._cursor = None
+                break
+            path, box_id = item
+            try:
+                if path.lstat().st_mtime > cutoff:
+                    continue
+            except FileNotFoundError:
+                continue
+            batch.append((path, box_id))
+        return batch
+
+    def _candidates(self) -> Iterator[tuple[Path, str]]:
+        """沙箱目录、快照目录、迁移临时文件，逐个产出 (路径, box_id)"""
+        prefix = Path(SANDBOX_PREFIX)
+
+        def sandbox_id(name: str) -> str:
+            return name[len(prefix.name) :] if name.startswith(prefix.name) else ""
+
+        def plain_id(name: str) -> str:
+            # snapshots/<id>、.migrate/<id>.out.tar、.migrate/<id>.in.tar、.migrate/<id>.in
+            return name.split(".", 1)[0]
+
+        for directory, parse in (
+            (prefix.parent, sandbox_id),
+            (Path(self._snapshot_dir), plain_id),
+            (Path(self._migrate_dir), plain_id),
+        ):
+            try:
+                entries = os.scandir(directory)
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    box_id = parse(entry.name)
+                    if box_id:
+                        yield Path(entry.path), box_id
+
+
+def _disk_usage(path: Path) -> int:
+    """占用的磁盘字节数（按块计），不跟随符号链接"""
+    total = 0
+    try:
+        total += path.lstat().st_blocks * 512
+    except OSError:
+        return 0
+    if path.is_dir() and not path.is_symlink():
+        for root, dirs, files in os.walk(path):
+            for name in dirs + files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_blocks * 512
+                except OSError:
+                    pass
+    return total
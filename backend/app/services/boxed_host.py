@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import os
+import signal
+from pathlib import Path
+from typing import Any
+
+from .boxed_cgroup import BoxLimits
+from .boxed_rpc import (
+    BOXED_HOST_LISTEN,
+    BOXED_HOST_SOCKET,
+    BOXED_HOST_TOKEN,
+    RPC_MESSAGE_LIMIT,
+    check_token,
+    encode_error,
+    read_message,
+    write_message,
+)
+from .boxed_service import BoxedService
+
+BOX_PREWARM = int(os.getenv("BOX_PREWARM", "2"))
+
+logger = logging.getLogger(__name__)
+
+
+class BoxedHost:
+    """
+    沙箱宿主进程：独占 BoxedService（沙箱进程、注册表、检查点），
+    通过 Unix socket 为多个 API worker 提供服务，任意 worker 都能访问任意沙箱。
+    """
+
+    # 对外开放的 BoxedService 方法
+    METHODS = (
+        "create_session",
+        "exec_code",
+        "events",
+        "install_packages",
+        "snapshot",
+        "restore",
+        "usage",
+        "destroy",
+        "stats",
+        "read_output",
+        "has_box",
+        "boxes",
+        "export_box",
+        "read_export",
+        "finish_export",
+        "begin_import",
+        "write_import",
+        "finish_import",
+        "abort_import",
+    )
+
+    def __init__(
+        self,
+        service: BoxedService,
+        socket_path: str = BOXED_HOST_SOCKET,
+        listen: str | None = BOXED_HOST_LISTEN,
+        token: str | None = BOXED_HOST_TOKEN,
+    ):
+        self.service = service
+        self.socket_path = Path(socket_path)
+        self.listen = listen
+        self.token = token
+        self._server: asyncio.AbstractServer | None = None
+        self._tcp_server: asyncio.AbstractServer | None = None
+        self._writers: set[asyncio.StreamWriter] = set()
+        self._inflight: set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        if self.listen and not self.token:
+            # Unix socket 靠文件权限限制访问，TCP 端口对网络开放，必须有令牌
+            raise RuntimeError(
+                "BOXED_HOST_TOKEN is required when BOXED_HOST_LISTEN is set"
+            )
+        self.socket_path.parent.mkdir(parents=True, exist_ok=True)
+        # 上次运行遗留的 socket 文件
+        self.socket_path.unlink(missing_ok=True)
+        self._server = await asyncio.start_unix_server(
+            self._handle, path=str(self.socket_path), limit=RPC_MESSAGE_LIMIT
+        )
+        os.chmod(self.socket_path, 0o660)
+        logger.info("Sandbox host listening on %s", self.socket_path)
+        if self.listen:
+            # 其它机器上的 API 通过 TCP 访问本节点
+            host, _, port = self.listen.rpartition(":")
+            self._tcp_server = await asyncio.start_server(
+                self._handle, host or None, int(port), limit=RPC_MESSAGE_LIMIT
+            )
+            logger.info("Sandbox host listening on tcp://%s", self.listen)
+
+    async def close(self) -> None:
+        if self._tcp_server:
+            self._tcp_server.close()
+        if self._server:
+            self._server.close()
+        for task in list(self._inflight):
+            task.cancel()
+        await asyncio.gather(*self._inflight, return_exceptions=True)
+        for writer in list(self._writers):
+            writer.close()
+        if self._tcp_server:
+            await self._tcp_server.wait_closed()
+            self._tcp_server = None
+        if self._server:
+            await self._server.wait_closed()
+            self._server = None
+        self.socket_path.unlink(missing_ok=True)
+
+    async def _handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        lock = asyncio.Lock()
+        inflight: set[asyncio.Task] = set()
+        self._writers.add(writer)
+        try:
+            while True:
+                message = await read_message(reader)
+                if message is None:
+                    break
+                # 每个请求独立执行，慢请求（安装依赖、检查点）不阻塞同一连接上的其它请求
+                task = asyncio.create_task(self._dispatch(message, writer, lock))
+                inflight.add(task)
+                task.add_done_callback(inflight.discard)
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+        except (ConnectionError, ValueError) as e:
+            logger.warning("Sandbox host connection dropped: %s", e)
+        finally:
+            await asyncio.gather(*inflight, return_exceptions=True)
+            self._writers.discard(writer)
+            writer.close()
+
+    async def _dispatch(
+        self,
+        message: dict[str, Any],
+        writer: asyncio.StreamWriter,
+        lock: asyncio.Lock,
+    ) -> None:
+        request_id = message.get("id")
+        try:
+            if not check_token(message, self.token):
+                raise RuntimeError("Unauthorized")
+            result = await self.call(
+                message.get("method", ""), message.get("params") or {}
+            )
+            response = {"id": request_id, "result": result}
+        except Exception as e:
+            response = {"id": request_id, "error": encode_error(e)}
+        try:
+            await write_message(writer, response, lock)
+        except ConnectionError:
+            logger.warning(
+                "Client went away before response to %s", message.get("method")
+            )
+
+    async def call(self, method: str, params: dict[str, Any]) -> Any:
+        if method not in self.METHODS:
+            raise ValueError(f"Unknown method {method}")
+        if params.get("limits") is not None:
+            params = {**params, "limits": BoxLimits(**params["limits"])}
+        return await getattr(self.service, method)(**params)
+
+
+async def serve(
+    socket_path: str = BOXED_HOST_SOCKET, prewarm_count: int = BOX_PREWARM
+) -> None:
+    service = await BoxedService(prewarm_count=prewarm_count).init()
+    host = BoxedHost(service, socket_path)
+    await host.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    await stop.wait()
+
+    logger.info("Sandbox host shutting down")
+    await host.close()
+    await service.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(serve())
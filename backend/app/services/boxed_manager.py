@@ -1,18 +1,46 @@
 import asyncio
+import heapq
 import logging
 import os
 import re
 import shutil
+import signal
 import subprocess
+import tarfile
+import time
+from dataclasses import asdict, dataclass
 from pathlib import Path
-from typing import Dict
+from typing import Any
 
 from nanoid import generate
 
-from .boxed_process import SANDBOX_ROOT, SANDBOX_PREFIX, BoxedProcess
+from .boxed_cgroup import BoxCgroup, BoxLimits
+from .boxed_gc import BoxedGC
+from .boxed_process import (
+    OUTPUT_STREAMS,
+    SANDBOX_PREFIX,
+    SANDBOX_ROOT,
+    BoxedProcess,
+    dmtcp_checkpoint,
+    dmtcp_quit,
+    output_path,
+)
+from .boxed_reaper import BoxedReaper
+from .boxed_registry import BoxedRegistry, BoxMeta, is_alive, process_start_time
 
 SNAPSHOT_DIR = SANDBOX_ROOT + os.getenv("SNAPSHOT_DIR", "snapshots")
-SANDBOX_STRUCT = ["work", "tmp", "lib", "log"]
+SANDBOX_STRUCT = ["work", "tmp", "lib", "log", "ckpt"]
+# 周期检查点调度器的最大轮询间隔（秒）
+CHECKPOINT_TICK = float(os.getenv("CHECKPOINT_TICK", "30"))
+# 本节点最多运行的沙箱数，0 为不限制（集群放置时参考）
+BOX_MAX_PER_NODE = int(os.getenv("BOX_MAX_PER_NODE", "0"))
+# 迁移时打包、接收沙箱的临时目录，需与沙箱目录在同一文件系统上
+MIGRATE_DIR = SANDBOX_ROOT + os.getenv("MIGRATE_DIR", ".migrate")
+# 关闭时为已分配的沙箱做检查点，下次启动时恢复，而不是直接销毁
+SUSPEND_ON_SHUTDOWN = os.getenv("BOX_SUSPEND_ON_SHUTDOWN", "1") == "1"
+# 沙箱到期后的处理：hibernate 做快照后停止（可用 EXPIRED_SNAPSHOT 恢复），destroy 直接销毁
+EXPIRE_ACTION = os.getenv("BOX_EXPIRE_ACTION", "hibernate")
+EXPIRED_SNAPSHOT = "expired"
 
 logging.basicConfig(
     level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -20,46 +48,459 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+@dataclass
+class RestartPolicy:
+    """沙箱意外退出后的自动重启策略"""
+
+    enabled: bool = os.getenv("BOX_AUTO_RESTART", "1") == "1"
+    max_retries: int = int(os.getenv("BOX_RESTART_RETRIES", "3"))
+    backoff: float = float(os.getenv("BOX_RESTART_BACKOFF", "1"))
+    max_backoff: float = float(os.getenv("BOX_RESTART_MAX_BACKOFF", "30"))
+    # 稳定运行超过该时长（秒）后，重启计数清零
+    reset_after: float = float(os.getenv("BOX_RESTART_RESET", "300"))
+    from_checkpoint: bool = os.getenv("BOX_RESTART_FROM_CHECKPOINT", "1") == "1"
+
+    def delay(self, attempt: int) -> float:
+        return min(self.backoff * 2 ** (attempt - 1), self.max_backoff)
+
+
+@dataclass
+class CheckpointPolicy:
+    """周期检查点策略：每 N 分钟或每 N 次执行，且仅在状态变化后才做"""
+
+    interval: float = float(os.getenv("CHECKPOINT_INTERVAL_MINUTES", "0")) * 60
+    every_execs: int = int(os.getenv("CHECKPOINT_EVERY_EXECS", "0"))
+    keep: int = int(os.getenv("CHECKPOINT_KEEP", "3"))
+    concurrency: int = int(os.getenv("CHECKPOINT_CONCURRENCY", "2"))
+
+    def __post_init__(self) -> None:
+        # 刚做的检查点也要保留，keep 为 0 会把它一起删掉
+        if self.keep < 1:
+            raise ValueError(f"CHECKPOINT_KEEP must be at least 1, got {self.keep}")
+
+    @property
+    def enabled(self) -> bool:
+        return self.interval > 0 or self.every_execs > 0
+
+    def due(self, proc: BoxedProcess) -> bool:
+        if not proc.dirty or not proc.is_running:
+            return False
+        if self.every_execs and proc.execs_since_checkpoint >= self.every_execs:
+            return True
+        since = time.monotonic() - max(proc.checkpointed_at, proc.started_at)
+        return bool(self.interval) and since >= self.interval
+
+
+@dataclass
+class BoxExport:
+    """迁出中的沙箱：进程已停止，工作目录和检查点打包在 archive 中"""
+
+    snapshot_id: str
+    archive: Path
+    limits: BoxLimits | None
+    expires_at: float | None = None
+
+
+def checkpoint_root(box_id: str) -> Path:
+    """沙箱的周期检查点目录，每个子目录是一次检查点"""
+    return Path(f"{SNAPSHOT_DIR}/{box_id}/checkpoints")
+
+
+def latest_checkpoint(box_id: str) -> Path | None:
+    root = checkpoint_root(box_id)
+    if not root.is_dir():
+        return None
+    candidates = [
+        d for d in root.iterdir() if d.is_dir() and any(d.glob("ckpt_*.dmtcp"))
+    ]
+    return max(candidates, key=lambda d: d.name, default=None)
+
+
 class BoxedManager:
-    def __init__(self, prewarm_count: int = 0):
-        self.proc_registry: Dict[str, BoxedProcess] = {}
+    def __init__(
+        self,
+        prewarm_count: int = 0,
+        restart_policy: RestartPolicy | None = None,
+        checkpoint_policy: CheckpointPolicy | None = None,
+    ):
+        self.proc_registry: dict[str, BoxedProcess] = {}
         self._available = asyncio.Queue()
         self._prewarm_count = prewarm_count
+        self._reaper = BoxedReaper()
+        self._restart_policy = restart_policy or RestartPolicy()
+        self._recovering: set[str] = set()
+        self._checkpoint_policy = checkpoint_policy or CheckpointPolicy()
+        self._checkpointing: set[str] = set()
+        self._checkpoint_task: asyncio.Task | None = None
+        # 预热池中尚未分配的沙箱，迁移/均衡时跳过
+        self._idle: set[str] = set()
+        self._exports: dict[str, BoxExport] = {}
+        self._imports: set[str] = set()
+        self._registry = BoxedRegistry()
+        self._metas: dict[str, BoxMeta] = {}
+        self._gc = BoxedGC(self.owns, self._reaper, SNAPSHOT_DIR, MIGRATE_DIR)
+        # 到期时间（time.time()）：最小堆按到期先后排列，改期或取消时旧条目留在堆里，出堆时比对丢弃
+        self._deadlines: dict[str, float] = {}
+        self._expiry_heap: list[tuple[float, str]] = []
+        self._expiry_task: asyncio.Task | None = None
+        self._bind_loop()
+
+    def _bind_loop(self) -> None:
+        """
+        信号量和 Event 绑定在首次等待它们的事件循环上，每次启动（如测试中多次 lifespan）
+        都换新的，否则后台任务在新的事件循环上会报错退出
+        """
+        self._checkpoint_slots = asyncio.Semaphore(
+            max(1, self._checkpoint_policy.concurrency)
+        )
+        self._expiry_wakeup = asyncio.Event()
 
     async def init(self):
-        """在 __init__ 后显式调用，进行预热"""
+        """在 __init__ 后显式调用，接管上次运行留下的沙箱，然后预热"""
+        self._bind_loop()
+        self._reaper.start()
+        self._expiry_task = asyncio.create_task(self._expiry_loop())
+        await self._reconcile()
+        # 接管完成后，元数据里没有的目录才是孤儿
+        self._gc.start()
+        if self._checkpoint_policy.interval > 0:
+            self._checkpoint_task = asyncio.create_task(self._checkpoint_loop())
         for _ in range(self._prewarm_count):
             asyncio.create_task(self._do_prewarm())
         return self
 
+    async def close(self) -> None:
+        """
+        停止所有沙箱，并等待后台拆除完成。
+        已分配的沙箱先做检查点，下次启动时恢复，滚动发布不丢会话状态；
+        检查点失败的和预热的空闲沙箱直接拆除。
+        """
+        if self._checkpoint_task:
+            self._checkpoint_task.cancel()
+        if self._expiry_task:
+            self._expiry_task.cancel()
+        await self._gc.close()
+        await asyncio.gather(*(self._suspend(b) for b in list(self.proc_registry)))
+        await self._reaper.close()
+
+    async def _suspend(self, box_id: str) -> None:
+        proc = self.proc_registry.get(box_id)
+        if (
+            SUSPEND_ON_SHUTDOWN
+            and proc is not None
+            and proc.is_running
+            and box_id not in self._idle
+        ):
+            try:
+                async with self._checkpoint_slots:
+                    dest = checkpoint_root(box_id) / str(time.time_ns())
+                    await proc.checkpoint(dest)
+                self.proc_registry.pop(box_id, None)
+                await proc.stop()
+                self._persist(box_id, checkpoint=dest, status="running")
+                return
+            except Exception as e:
+                logger.warning("Box %s checkpoint on shutdown failed: %s", box_id, e)
+        await self.destroy_box(box_id)
+
+    async def _reconcile(self) -> None:
+        """
+        接管上次运行留下的沙箱。原进程的管道已随上一个宿主进程关闭，无法直接复用：
+        还活着的先通过它的 coordinator 做检查点再结束，然后从检查点恢复；已退出的从最近的检查点恢复。
+        没有可用检查点的、以及预热的空闲沙箱交给 reaper 清理。
+        """
+        loop = asyncio.get_event_loop()
+        if not self._registry.root.exists():
+            # 升级后第一次启动：之前休眠的沙箱只有快照目录，登记下来免得被 GC 当作孤儿
+            for meta in await loop.run_in_executor(None, _legacy_hibernated):
+                self._persist(meta.box_id, Path(meta.checkpoint), "hibernated")
+        metas = await loop.run_in_executor(None, self._registry.load_all)
+        for meta in metas:
+            try:
+                await self._adopt(meta)
+            except Exception as e:
+                logger.error("Box %s could not be recovered", meta.box_id, exc_info=e)
+                await self.destroy_box(meta.box_id)
+        if metas:
+            logger.info(
+                "Reconciled %d boxes from previous run, %d restored",
+                len(metas),
+                len(self.proc_registry),
+            )
+
+    async def _adopt(self, meta: BoxMeta) -> None:
+        box_id = meta.box_id
+        self._metas[box_id] = meta
+        if meta.status == "hibernated":
+            return  # 只剩快照，等待 restore
+        checkpoint = Path(meta.checkpoint) if meta.checkpoint else None
+        if is_alive(meta):
+            if meta.status == "running":
+                dest = checkpoint_root(box_id) / str(time.time_ns())
+                try:
+                    await dmtcp_checkpoint(Path(f"{SANDBOX_PREFIX}{box_id}/ckpt"), dest)
+                    checkpoint = dest
+                except Exception as e:
+                    logger.warning("Box %s orphan checkpoint failed: %s", box_id, e)
+            await _kill_orphan(meta)
+        if checkpoint is None or not checkpoint.is_dir():
+            checkpoint = latest_checkpoint(box_id)
+        if meta.status != "running" or checkpoint is None:
+            if meta.status == "running":
+                logger.warning("Box %s has no checkpoint, state lost", box_id)
+            await self.destroy_box(box_id)
+            return
+        proc = BoxedProcess(
+            box_id,
+            on_exit=self._on_box_exit,
+            limits=BoxLimits(**meta.limits) if meta.limits else None,
+        )
+        self.proc_registry[box_id] = proc
+        await proc.start(restore_from=checkpoint)
+        proc.record_event("restored", f"after host restart from {checkpoint.name}")
+        self._persist(box_id, checkpoint=checkpoint)
+        # 停机期间已到期的，调度任务会立即处理
+        self.set_expiry(box_id, meta.expires_at)
+
+    def _persist(
+        self,
+        box_id: str,
+        checkpoint: Path | None = None,
+        status: str | None = None,
+    ) -> None:
+        """把沙箱当前的进程、检查点和状态写入元数据文件，未给出的字段沿用上一次的值"""
+        proc = self.proc_registry.get(box_id)
+        previous = self._metas.get(box_id)
+        pid = proc.pid if proc else None
+        meta = BoxMeta(
+            box_id=box_id,
+            status=status or ("idle" if box_id in self._idle else "running"),
+            pid=pid,
+            pid_start=process_start_time(pid) if pid else None,
+            checkpoint=str(checkpoint)
+            if checkpoint
+            else (previous and previous.checkpoint),
+            limits=asdict(proc.limits) if proc else (previous and previous.limits),
+            expires_at=self._deadlines.get(box_id),
+        )
+        if previous:
+            meta.started_at = previous.started_at
+        self._metas[box_id] = meta
+        try:
+            self._registry.save(meta)
+        except OSError as e:
+            logger.warning("Box %s meta not saved: %s", box_id, e)
+
+    def _forget(self, box_id: str) -> None:
+        self._metas.pop(box_id, None)
+        try:
+            self._registry.remove(box_id)
+        except OSError as e:
+            logger.warning("Box %s meta not removed: %s", box_id, e)
+
     async def _do_prewarm(self):
         if self._available.qsize() >= self._prewarm_count:
             return  # no more prewarm
         try:
             box_id = await self.start_box()
+            self._idle.add(box_id)
+            self._persist(box_id)
             await self._available.put(box_id)
         except Exception as e:
             logger.error("Prewarm failed", exc_info=e)
 
-    async def acquire_box(self) -> str:
+    async def acquire_box(
+        self, limits: BoxLimits | None = None, expires_at: float | None = None
+    ) -> str:
         try:
             box_id = self._available.get_nowait()
         except asyncio.QueueEmpty:
-            box_id = await self.start_box()
+            box_id = await self.start_box(limits)
+            self.set_expiry(box_id, expires_at)
         else:
+            self._idle.discard(box_id)
+            # 预热沙箱按默认上限启动，分配时改为调用方的上限
+            proc = self.proc_registry.get(box_id)
+            if proc and limits:
+                proc.set_limits(limits)
+            self.set_expiry(box_id, expires_at)
             # 成功从池中取出时，尝试补一个
             if self._prewarm_count > 0:
                 asyncio.create_task(self._do_prewarm())
         return box_id
 
-    async def start_box(self) -> str:
+    async def start_box(self, limits: BoxLimits | None = None) -> str:
         box_id = generate()
         await self._create_box_dirs(box_id)
-        proc = BoxedProcess(box_id)
+        proc = BoxedProcess(box_id, on_exit=self._on_box_exit, limits=limits)
         self.proc_registry[box_id] = proc
         await proc.start()
+        self._persist(box_id)
         return box_id
 
+    def usage(self, box_id: str) -> dict[str, int]:
+        proc = self.proc_registry.get(box_id)
+        if proc is None:
+            raise ValueError(f"Box {box_id} not found")
+        return proc.usage()
+
+    def stats(self) -> dict[str, Any]:
+        """节点容量与占用，供集群放置沙箱时比较"""
+        meminfo = _meminfo()
+        limits = [p.limits for p in self.proc_registry.values()]
+        return {
+            "boxes": len(self.proc_registry),
+            "idle_boxes": self._available.qsize(),
+            "max_boxes": BOX_MAX_PER_NODE,
+            "memory_total": meminfo.get("MemTotal", 0),
+            "memory_available": meminfo.get("MemAvailable", 0),
+            "memory_committed": sum(lim.memory_max or 0 for lim in limits),
+            "cpu_count": os.cpu_count() or 1,
+            "cpu_committed": sum(lim.cpu_max or 0 for lim in limits),
+            "load": os.getloadavg()[0],
+            "gc_reclaimed_entries": self._gc.reclaimed_entries,
+            "gc_reclaimed_bytes": self._gc.reclaimed_bytes,
+        }
+
+    def assigned_boxes(self, include_hibernated: bool = False) -> list[str]:
+        """已分配给会话的沙箱，不含预热池中的空闲沙箱；可选包含已休眠、只剩快照的沙箱"""
+        boxes = [b for b in self.proc_registry if b not in self._idle]
+        if include_hibernated:
+            boxes += [
+                b
+                for b, meta in self._metas.items()
+                if meta.status == "hibernated" and b not in self.proc_registry
+            ]
+        return boxes
+
+    def set_expiry(self, box_id: str, expires_at: float | None) -> None:
+        """设置或取消（None）沙箱的到期时间"""
+        if expires_at is None:
+            self._deadlines.pop(box_id, None)
+        else:
+            self._deadlines[box_id] = expires_at
+            heapq.heappush(self._expiry_heap, (expires_at, box_id))
+            if self._expiry_heap[0] == (expires_at, box_id):
+                self._expiry_wakeup.set()  # 比当前等待的更早，唤醒调度任务
+            if len(self._expiry_heap) > 2 * len(self._deadlines) + 64:
+                # 作废条目过多时重建，堆的大小与沙箱数同阶
+                self._expiry_heap = [(t, b) for b, t in self._deadlines.items()]
+                heapq.heapify(self._expiry_heap)
+        if box_id in self.proc_registry:
+            self._persist(box_id)
+
+    def expires_at(self, box_id: str) -> float | None:
+        return self._deadlines.get(box_id)
+
+    async def _expiry_loop(self) -> None:
+        """单个任务睡到最早的到期时间，不扫描所有沙箱"""
+        while True:
+            now = time.time()
+            while self._expiry_heap and self._expiry_heap[0][0] <= now:
+                at, box_id = heapq.heappop(self._expiry_heap)
+                if self._deadlines.get(box_id) != at:
+                    continue  # 已取消或改期
+                del self._deadlines[box_id]
+                asyncio.create_task(self._expire(box_id))
+            timeout = self._expiry_heap[0][0] - now if self._expiry_heap else None
+            self._expiry_wakeup.clear()
+            try:
+                await asyncio.wait_for(self._expiry_wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _expire(self, box_id: str) -> None:
+        if box_id not in self.proc_registry or box_id in self._exports:
+            return
+        if EXPIRE_ACTION == "hibernate":
+            try:
+                await self.snapshot_box(box_id, EXPIRED_SNAPSHOT)
+                logger.info("Box %s expired, hibernated", box_id)
+                return
+            except Exception as e:
+                logger.warning(
+                    "Box %s expiry snapshot failed, destroying: %s", box_id, e
+                )
+        await self.destroy_box(box_id)
+        logger.info("Box %s expired, destroyed", box_id)
+
+    def owns(self, box_id: str) -> bool:
+        """运行中、休眠中或正在迁入迁出的沙箱，其目录不能被 GC 回收"""
+        return (
+            box_id in self.proc_registry
+            or box_id in self._metas
+            or box_id in self._imports
+            or box_id in self._exports
+        )
+
+    def is_hibernated(self, box_id: str) -> bool:
+        """已休眠、只剩快照的沙箱，恢复和迁移时据此找到它所在的节点"""
+        meta = self._metas.get(box_id)
+        return (
+            meta is not None
+            and meta.status == "hibernated"
+            and box_id not in self.proc_registry
+        )
+
+    def is_recovering(self, box_id: str) -> bool:
+        return box_id in self._recovering
+
+    def _on_box_exit(self, box_id: str, returncode: int | None) -> None:
+        """进程意外退出：记录事件，并按策略在后台重启"""
+        proc = self.proc_registry.get(box_id)
+        if proc is None:
+            return
+        proc.record_event("exited", f"exit code {returncode}")
+        if not self._restart_policy.enabled or box_id in self._recovering:
+            return
+        if proc.uptime >= self._restart_policy.reset_after:
+            proc.restarts = 0
+        self._recovering.add(box_id)
+        asyncio.create_task(self._recover(box_id, proc))
+
+    async def _recover(self, box_id: str, proc: BoxedProcess) -> None:
+        policy = self._restart_policy
+        try:
+            while self.proc_registry.get(box_id) is proc and not proc.is_running:
+                if proc.restarts >= policy.max_retries:
+                    proc.record_event(
+                        "failed", f"gave up after {proc.restarts} restarts"
+                    )
+                    logger.error(
+                        "Box %s gave up after %d restarts", box_id, proc.restarts
+                    )
+                    return
+                proc.restarts += 1
+                await asyncio.sleep(policy.delay(proc.restarts))
+                if self.proc_registry.get(box_id) is not proc:
+                    return  # 等待期间已被销毁或休眠
+
+                checkpoint = (
+                    latest_checkpoint(box_id) if policy.from_checkpoint else None
+                )
+                if checkpoint is not None:
+                    try:
+                        await proc.start(restore_from=checkpoint)
+                        proc.record_event(
+                            "restored", f"from checkpoint {checkpoint.name}"
+                        )
+                        self._persist(box_id)
+                        return
+                    except Exception as e:
+                        logger.warning(
+                            "Box %s restore from %s failed: %s", box_id, checkpoint, e
+                        )
+                try:
+                    await proc.start()
+                    proc.record_event("restarted", "state lost, fresh interpreter")
+                    self._persist(box_id)
+                    return
+                except Exception as e:
+                    logger.error("Box %s restart failed", box_id, exc_info=e)
+                    proc.record_event("restart_failed", str(e))
+        finally:
+            self._recovering.discard(box_id)
+
     async def _create_box_dirs(self, box_id: str) -> None:
         box_path = Path(f"{SANDBOX_PREFIX}{box_id}")
         # 使用线程池非阻塞创建目录和权限，注意chown给sandbox
@@ -100,28 +541,323 @@ class BoxedManager:
         loop = asyncio.get_event_loop()
         await loop.run_in_executor(None, subprocess.check_call, cmd)
 
-    async def snapshot_box(self, box_id: str) -> str:
+    def maybe_checkpoint(self, box_id: str) -> None:
+        """检查点到期时在后台执行，不阻塞请求"""
+        proc = self.proc_registry.get(box_id)
+        if (
+            proc is None
+            or box_id in self._checkpointing
+            or not self._checkpoint_policy.due(proc)
+        ):
+            return
+        self._checkpointing.add(box_id)
+        asyncio.create_task(self._checkpoint(box_id, proc))
+
+    async def _checkpoint_loop(self) -> None:
+        """所有沙箱共用一个调度循环，按时间触发检查点"""
+        tick = min(self._checkpoint_policy.interval, CHECKPOINT_TICK)
+        while True:
+            await asyncio.sleep(tick)
+            for box_id in list(self.proc_registry):
+                self.maybe_checkpoint(box_id)
+
+    async def _checkpoint(self, box_id: str, proc: BoxedProcess) -> None:
+        try:
+            async with self._checkpoint_slots:
+                if self.proc_registry.get(box_id) is not proc:
+                    return
+                dest = checkpoint_root(box_id) / str(time.time_ns())
+                await proc.checkpoint(dest)
+                self._persist(box_id, checkpoint=dest)
+                await self._prune_checkpoints(box_id)
+        except Exception as e:
+            logger.warning("Box %s periodic checkpoint failed: %s", box_id, e)
+        finally:
+            self._checkpointing.discard(box_id)
+
+    async def _prune_checkpoints(self, box_id: str) -> None:
+        """只保留最近 keep 个检查点，旧的交给 reaper 删除"""
+        loop = asyncio.get_event_loop()
+        stale = await loop.run_in_executor(
+            None,
+            _stale_checkpoints,
+            checkpoint_root(box_id),
+            self._checkpoint_policy.keep,
+        )
+        if stale:
+            self._reaper.submit(None, stale)
+
+    async def snapshot_box(self, box_id: str, snapshot_id: str | None = None) -> str:
         proc = self.proc_registry.get(box_id)
         if not proc:
             raise ValueError(f"Box {box_id} not found")
-        snapshot_id = generate()
-        await proc.stop()
+        snapshot_id = snapshot_id or generate()
+        snapshot = Path(f"{SNAPSHOT_DIR}/{box_id}/{snapshot_id}")
+        if snapshot.exists():
+            # 固定 id 的快照（如到期休眠）重复使用同一目录，先清掉旧镜像
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, shutil.rmtree, snapshot)
+        await proc.checkpoint(snapshot)
         self.proc_registry.pop(box_id)
-        # TODO: 拷贝目录到 SNAPSHOT_DIR
+        self._deadlines.pop(box_id, None)
+        await proc.stop()
+        self._persist(box_id, checkpoint=snapshot, status="hibernated")
         return snapshot_id
 
-    async def restore_box(self, box_id: str, snapshot_id: str) -> None:
-        target = Path(f"{SANDBOX_PREFIX}{box_id}")
-        # TODO: 清理 target 并复制快照
-        proc = BoxedProcess(box_id)
+    async def restore_box(
+        self,
+        box_id: str,
+        snapshot_id: str,
+        limits: BoxLimits | None = None,
+        expires_at: float | None = None,
+    ) -> None:
+        if not re.fullmatch(r"[A-Za-z0-9_-]+", snapshot_id):
+            raise ValueError(f"Invalid snapshot id: {snapshot_id}")
+        snapshot = Path(f"{SNAPSHOT_DIR}/{box_id}/{snapshot_id}")
+        if not snapshot.is_dir():
+            raise ValueError(f"Snapshot {snapshot_id} not found")
+        current = self.proc_registry.pop(box_id, None)
+        if current:
+            await current.stop()
+        proc = BoxedProcess(
+            box_id,
+            on_exit=self._on_box_exit,
+            limits=limits or (current.limits if current else None),
+        )
         self.proc_registry[box_id] = proc
-        await proc.start()
+        await proc.start(restore_from=snapshot)
+        self._persist(box_id, checkpoint=snapshot)
+        self.set_expiry(box_id, expires_at)
+
+    async def read_output(
+        self, box_id: str, output_id: str, stream: str, offset: int, size: int
+    ) -> tuple[int, bytes]:
+        """读取溢出输出的一段，返回文件总大小和数据"""
+        if stream not in OUTPUT_STREAMS or not re.fullmatch(
+            r"[A-Za-z0-9_-]+", output_id
+        ):
+            raise ValueError("Invalid output reference")
+        path = output_path(box_id, output_id, stream)
+        loop = asyncio.get_event_loop()
+        try:
+            total = (await loop.run_in_executor(None, path.stat)).st_size
+            data = await loop.run_in_executor(None, _read_chunk, path, offset, size)
+        except FileNotFoundError:
+            raise KeyError(f"Output {output_id} not found")
+        return total, data
+
+    async def export_box(self, box_id: str) -> BoxExport:
+        """
+        迁出第一步：检查点并停止沙箱，把工作目录和快照打包成一个 tar。
+        本机目录保留到 finish_export，迁移失败时可以就地恢复。
+        """
+        if box_id in self._exports:
+            raise RuntimeError(f"Box {box_id} is already being migrated")
+        proc = self.proc_registry.get(box_id)
+        if not proc:
+            raise ValueError(f"Box {box_id} not found")
+        limits = proc.limits
+        expires_at = self._deadlines.get(box_id)
+        snapshot_id = await self.snapshot_box(box_id)
+        archive = Path(f"{MIGRATE_DIR}/{box_id}.out.tar")
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, _pack_box, box_id, archive)
+        except Exception:
+            await self.restore_box(box_id, snapshot_id, limits, expires_at)
+            raise
+        export = BoxExport(snapshot_id, archive, limits, expires_at)
+        self._exports[box_id] = export
+        return export
+
+    async def read_export(self, box_id: str, offset: int, size: int) -> bytes:
+        export = self._exports.get(box_id)
+        if export is None:
+            raise KeyError(box_id)
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None, _read_chunk, export.archive, offset, size
+        )
+
+    async def finish_export(self, box_id: str, moved: bool) -> None:
+        """迁出结束：成功则删除本机副本，失败则从迁移快照就地恢复"""
+        export = self._exports.pop(box_id, None)
+        if export is None:
+            raise KeyError(box_id)
+        export.archive.unlink(missing_ok=True)
+        if moved:
+            await self.destroy_box(box_id)
+        else:
+            await self.restore_box(
+                box_id, export.snapshot_id, export.limits, export.expires_at
+            )
+
+    async def begin_import(self, box_id: str) -> None:
+        if box_id in self.proc_registry or box_id in self._imports:
+            raise ValueError(f"Box {box_id} already exists on this node")
+        # 先占位，等待文件系统期间同一个 box 的重复迁入会被上面的检查拒绝
+        self._imports.add(box_id)
+        loop = asyncio.get_event_loop()
+        try:
+            await loop.run_in_executor(None, _prepare_import, box_id)
+        except BaseException:
+            self._imports.discard(box_id)
+            raise
+
+    async def write_import(self, box_id: str, offset: int, data: bytes) -> int:
+        """写入一段数据，返回写入后的偏移"""
+        if box_id not in self._imports:
+            raise KeyError(box_id)
+        archive = Path(f"{MIGRATE_DIR}/{box_id}.in.tar")
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, _write_chunk, archive, offset, data)
+        return offset + len(data)
+
+    async def finish_import(
+        self,
+        box_id: str,
+        snapshot_id: str,
+        limits: BoxLimits | None = None,
+        expires_at: float | None = None,
+    ) -> None:
+        """解包并从迁移快照恢复，之后沙箱由本机管理"""
+        if box_id not in self._imports:
+            raise KeyError(box_id)
+        archive = Path(f"{MIGRATE_DIR}/{box_id}.in.tar")
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, _unpack_box, box_id, archive)
+        await self.restore_box(box_id, snapshot_id, limits, expires_at)
+        self._imports.discard(box_id)
+        archive.unlink(missing_ok=True)
+
+    async def abort_import(self, box_id: str) -> None:
+        """丢弃接收到一半的沙箱（源节点会就地恢复）"""
+        if box_id not in self._imports:
+            return
+        self._imports.discard(box_id)
+        Path(f"{MIGRATE_DIR}/{box_id}.in.tar").unlink(missing_ok=True)
+        await self.destroy_box(box_id)
 
     async def destroy_box(self, box_id: str) -> None:
+        """从注册表摘除后立即返回，进程停止和目录删除交给后台 reaper"""
+        self._idle.discard(box_id)
+        self._deadlines.pop(box_id, None)
+        self._forget(box_id)
         proc = self.proc_registry.pop(box_id, None)
-        if proc:
-            await proc.stop()
         base = Path(f"{SANDBOX_PREFIX}{box_id}")
-        await asyncio.get_event_loop().run_in_executor(None, shutil.rmtree, base, True)
         snap = Path(f"{SNAPSHOT_DIR}/{box_id}")
-        await asyncio.get_event_loop().run_in_executor(None, shutil.rmtree, snap, True)
+        self._reaper.submit(proc, [base, snap])
+
+
+def _legacy_hibernated() -> list[BoxMeta]:
+    metas = []
+    root = Path(SNAPSHOT_DIR)
+    if not root.is_dir():
+        return metas
+    for box_dir in root.iterdir():
+        snapshots = (
+            [d for d in box_dir.iterdir() if d.is_dir() and d.name != "checkpoints"]
+            if box_dir.is_dir()
+            else []
+        )
+        if snapshots:
+            latest = max(snapshots, key=lambda d: d.stat().st_mtime)
+            metas.append(BoxMeta(box_dir.name, "hibernated", checkpoint=str(latest)))
+    return metas
+
+
+async def _kill_orphan(meta: BoxMeta) -> None:
+    """结束上一个宿主进程遗留的沙箱进程及其 coordinator"""
+    try:
+        await dmtcp_quit(Path(f"{SANDBOX_PREFIX}{meta.box_id}/ckpt"))
+    except Exception as e:
+        logger.debug("Box %s coordinator quit failed: %s", meta.box_id, e)
+    if BoxCgroup.enabled():
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, BoxCgroup(meta.box_id).destroy)
+    if is_alive(meta):
+        try:
+            os.kill(meta.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def _pack_box(box_id: str, archive: Path) -> None:
+    """
+    沙箱目录打包为 box/，快照目录打包为 snapshots/。
+    ckpt 下是 DMTCP 的临时文件，周期检查点比迁移快照旧，都不需要带走。
+    """
+
+    def skip(member: tarfile.TarInfo) -> tarfile.TarInfo | None:
+        if member.name.startswith(("box/ckpt/", "snapshots/checkpoints")):
+            return None
+        return member
+
+    archive.parent.mkdir(parents=True, exist_ok=True)
+    with tarfile.open(archive, "w") as tar:
+        tar.add(f"{SANDBOX_PREFIX}{box_id}", arcname="box", filter=skip)
+        tar.add(f"{SNAPSHOT_DIR}/{box_id}", arcname="snapshots", filter=skip)
+
+
+def _unpack_box(box_id: str, archive: Path) -> None:
+    """解包到临时目录后再改名到位，保留属主和 setgid 等权限位"""
+    staging = Path(f"{MIGRATE_DIR}/{box_id}.in")
+    shutil.rmtree(staging, ignore_errors=True)
+
+    def keep_mode(member: tarfile.TarInfo, path: str) -> tarfile.TarInfo:
+        # tar_filter 拒绝绝对路径和越出目标目录的成员，但会去掉组写和 setgid 位
+        return tarfile.tar_filter(member, path).replace(mode=member.mode, deep=False)
+
+    try:
+        with tarfile.open(archive) as tar:
+            tar.extractall(staging, numeric_owner=True, filter=keep_mode)
+        Path(SNAPSHOT_DIR).mkdir(parents=True, exist_ok=True)
+        os.replace(staging / "box", f"{SANDBOX_PREFIX}{box_id}")
+        os.replace(staging / "snapshots", f"{SNAPSHOT_DIR}/{box_id}")
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def _stale_checkpoints(root: Path, keep: int) -> list[Path]:
+    """按名称（时间戳）排序，除最近 keep 个以外的检查点目录"""
+    if not root.is_dir():
+        return []
+    checkpoints = sorted(
+        (d for d in root.iterdir() if d.is_dir()), key=lambda d: d.name
+    )
+    return checkpoints[: max(0, len(checkpoints) - keep)]
+
+
+def _prepare_import(box_id: str) -> None:
+    if Path(f"{SANDBOX_PREFIX}{box_id}").exists():
+        raise ValueError(f"Box {box_id} already exists on this node")
+    archive = Path(f"{MIGRATE_DIR}/{box_id}.in.tar")
+    archive.parent.mkdir(parents=True, exist_ok=True)
+    archive.write_bytes(b"")
+
+
+def _read_chunk(path: Path, offset: int, size: int) -> bytes:
+    with open(path, "rb") as f:
+        f.seek(offset)
+        return f.read(size)
+
+
+def _write_chunk(path: Path, offset: int, data: bytes) -> None:
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        f.write(data)
+
+
+def _meminfo() -> dict[str, int]:
+    """/proc/meminfo 中的字段，单位换算为字节"""
+    info: dict[str, int] = {}
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                parts = value.split()
+                if parts and parts[0].isdigit():
+                    info[key] = int(parts[0]) * (1024 if parts[1:] == ["kB"] else 1)
+    except OSError:
+        pass
+    return info
@@ -1,14 +1,23 @@
 import asyncio
-import errno
-import fcntl
+import codecs
 import logging
 import os
 import re
+import shutil
 import time
-from typing import Optional
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import AbstractAsyncContextManager, nullcontext
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO
 
 from nanoid import generate
 
+from .boxed_cgroup import BoxCgroup, BoxLimits
+from .boxed_supervisor import exit_code, supervisor
+
 log_level = os.getenv("LOG_LEVEL", "INFO").upper()
 logging.basicConfig(
     level=logging._nameToLevel.get(log_level),
@@ -22,17 +31,73 @@ logger.info("\t\tSandbox root: %s", SANDBOX_ROOT)
 
 SANDBOX_PREFIX = SANDBOX_ROOT + os.getenv("SANDBOX_PREFIX", "sandbox_")
 SHARED_LIBS_PATH = SANDBOX_ROOT + os.getenv("SHARED_LIBS_PATH", "shared_libs")
+CHECKPOINT_TIMEOUT = float(os.getenv("CHECKPOINT_TIMEOUT", "60"))
+# 每次执行 stdout/stderr 各自内联返回的最大字节数，超出部分写入沙箱 log 目录
+MAX_INLINE_OUTPUT = int(os.getenv("MAX_INLINE_OUTPUT", str(1024 * 1024)))
+# 每个沙箱保留的最近几次溢出输出
+OUTPUT_SPILL_KEEP = int(os.getenv("OUTPUT_SPILL_KEEP", "5"))
+OUTPUT_STREAMS = ("stdout", "stderr")
+# 每次从管道读取的最大字节数（StreamReader 缓冲上限为 2 * 64 KiB）
+OUTPUT_READ_SIZE = 64 * 1024
+# 找到 marker 后留给 stderr 读完管道中已有数据的时间
+OUTPUT_SETTLE = 0.01
+# 溢出文件积压在写线程中超过这么多字节时，读取方等它写完再继续（背压）
+OUTPUT_SPILL_BACKLOG = 8 * 1024 * 1024
+_CLK_TCK = os.sysconf("SC_CLK_TCK")
+
+
+@dataclass
+class BoxEvent:
+    """沙箱生命周期事件，如意外退出、自动重启"""
+
+    kind: str
+    detail: str = ""
+    at: float = field(default_factory=time.time)
+
+
+@dataclass
+class ExecResult:
+    """一次执行的输出与资源消耗"""
+
+    stdout: str
+    stderr: str
+    wall_seconds: float = 0.0
+    cpu_user_seconds: float = 0.0
+    cpu_system_seconds: float = 0.0
+    # 沙箱内存峰值（自启动以来的高水位）
+    peak_rss_bytes: int = 0
+    output_bytes: int = 0
+    # 在节点执行队列中等待的时间，不计入 wall_seconds
+    queued_seconds: float = 0.0
+    # 输出超过 MAX_INLINE_OUTPUT 时 stdout/stderr 只是开头部分，
+    # 完整输出按 output_id 从沙箱 log 目录下载
+    truncated: bool = False
+    output_id: str | None = None
 
 
 class BoxedProcess:
-    def __init__(self, box_id: str):
+    def __init__(
+        self,
+        box_id: str,
+        on_exit: Callable[[str, int | None], None] | None = None,
+        limits: BoxLimits | None = None,
+    ):
         self.box_id = box_id
-        # TODO: put a sub-process lock file in the sandbox. in case sub-process crash, we
-        self.process: Optional[asyncio.subprocess.Process] = None
+        self.process: asyncio.subprocess.Process | None = None
         self._lock = asyncio.Lock()
         self._timeout = 5
-        self._monitor_task = None
-        self._health_check_interval = 10  # 每10秒检查一次进程健康状态
+        # 意外退出时通知 manager，由其决定是否重启
+        self._exit_callback = on_exit
+        self.events: deque[BoxEvent] = deque(maxlen=20)
+        self.limits = limits or BoxLimits.from_env()
+        self._cgroup = BoxCgroup(box_id) if BoxCgroup.enabled() else None
+        self.restarts = 0
+        self.started_at = 0.0
+        self.exited_at = 0.0
+        # 自上次检查点以来是否执行过代码
+        self.dirty = False
+        self.execs_since_checkpoint = 0
+        self.checkpointed_at = 0.0
 
     async def __aenter__(self):
         """支持异步上下文管理器协议"""
@@ -60,8 +125,12 @@ class BoxedProcess:
             finally:
                 self._clear()
 
-    async def start(self) -> None:
-        """启动沙箱进程并设置监控"""
+    async def start(self, restore_from: Path | None = None) -> None:
+        """
+        启动沙箱进程并设置监控
+        Args:
+            restore_from (Path): DMTCP 检查点目录，给出时用 dmtcp_restart 从检查点恢复。
+        """
         async with self._lock:
             if self.is_running:
                 return
@@ -76,30 +145,58 @@ class BoxedProcess:
                 "PATH": "/usr/local/bin:/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin",
             }
 
+            if self._cgroup:
+                self._cgroup.apply(self.limits)
+            cgroup = self._cgroup
+
             # 限制资源在子进程启动前同步设置
             def _preexec():
-                pass
+                # exec 之前进入 cgroup，沙箱代码运行时已受限
+                if cgroup:
+                    cgroup.attach_self()
                 # resource.setrlimit(resource.RLIMIT_AS, (200*1024*1024, 200*1024*1024))  # 内存限制
                 # resource.setrlimit(resource.RLIMIT_NOFILE, (32, 32))  # 文件描述符限制
                 # resource.setrlimit(resource.RLIMIT_CPU, (60, 60))  # CPU 时间限制60秒
                 # resource.setrlimit(resource.RLIMIT_CORE, (0, 0))  # 禁止核心转储
                 # resource.setrlimit(resource.RLIMIT_FSIZE, (10*1024*1024, 10*1024*1024))  # 文件大小限制
 
-            # gosu sandboxed dmtcp_launch -j --ckpt-signal 10 --allow-file-overwrite --no-gzip python -i -s -q -u
+            # 每个沙箱使用独立的 coordinator，检查点只冻结本沙箱
+            ckpt_dir = f"{sandbox_path}/ckpt"
+            coordinator = [
+                "--new-coordinator",
+                "--coord-port",
+                "0",
+                "--port-file",
+                f"{ckpt_dir}/coord.port",
+                "--ckptdir",
+                ckpt_dir,
+            ]
+            if restore_from is None:
+                # gosu sandboxed dmtcp_launch --new-coordinator ... --ckpt-signal 10 --allow-file-overwrite --no-gzip python -i -s -q -u
+                cmd = [
+                    "gosu",
+                    "sandboxed",
+                    "dmtcp_launch",
+                    *coordinator,
+                    "--ckpt-signal",
+                    "10",
+                    "--allow-file-overwrite",
+                    "--no-gzip",
+                    "python",
+                    "-i",
+                    "-q",
+                    "-s",
+                    "-u",
+                ]
+            else:
+                images = await asyncio.get_event_loop().run_in_executor(
+                    None, _stage_images, restore_from, Path(ckpt_dir) / "restore"
+                )
+                # gosu sandboxed dmtcp_restart --new-coordinator ... ckpt_*.dmtcp
+                cmd = ["gosu", "sandboxed", "dmtcp_restart", *coordinator, *images]
+
             self.process = await asyncio.create_subprocess_exec(
-                "gosu",
-                "sandboxed",
-                "dmtcp_launch",
-                "-j",
-                "--ckpt-signal",
-                "10",
-                "--allow-file-overwrite",
-                "--no-gzip",
-                "python",
-                "-i",
-                "-q",
-                "-s",
-                "-u",
+                *cmd,
                 cwd=f"{sandbox_path}/work",
                 env=env,
                 preexec_fn=_preexec,
@@ -107,26 +204,39 @@ class BoxedProcess:
                 stdout=asyncio.subprocess.PIPE,
                 stderr=asyncio.subprocess.PIPE,
             )
-            logger.info("Box %s started with PID %s", self.box_id, self.process.pid)
+            self.started_at = time.monotonic()
+            logger.info(
+                "Box %s %s with PID %s",
+                self.box_id,
+                "started" if restore_from is None else f"restored from {restore_from}",
+                self.process.pid,
+            )
 
-            # 启动监控任务
-            if self._monitor_task is None:
-                self._monitor_task = asyncio.create_task(self._monitor_process())
+            # 交给节点级监管者，进程退出时立即回调
+            supervisor.watch(self.process.pid, self._on_exit)
 
-    async def execute(self, code: str, timeout: float = 200.0) -> tuple[str, str]:
+    async def execute(
+        self,
+        code: str,
+        timeout: float = 200.0,
+        admit: AbstractAsyncContextManager[float] | None = None,
+    ) -> ExecResult:
         """
         在沙箱中执行代码，自动处理进程状态
         Args:
             code (str): 要执行的代码。
             timeout (float): 执行的最大等待时间（秒）。
+            admit: 节点级执行准入（FairScheduler.slot），拿到本沙箱的锁之后才进入，
+                排在同一沙箱后面的代码块不会占着执行位空等。
         Returns:
-            tuple: (stdout_output, stderr_output)，分别为标准输出和错误输出的字符串。
+            ExecResult: 标准输出、错误输出，以及本次执行的耗时、CPU、内存峰值和输出字节数。
         """
-        async with self._lock:
+        async with self._lock, admit or nullcontext(0.0) as queued:
             if not self.process or not self.is_running or self.process.stdin is None:
                 raise RuntimeError("Box process not running")
 
-            marker = f"__COMPLETE_{generate()}__"
+            exec_id = generate()
+            marker = f"__COMPLETE_{exec_id}__"
             # 限制localhost/127.0.0.1访问
             sanitized = re.sub(
                 r"(localhost|127\.0\.0\.1|0\.0\.0\.0)", "blocked_address", code
@@ -152,14 +262,42 @@ class BoxedProcess:
                 except asyncio.TimeoutError:
                     logger.debug("Box %s clear stream timeout", self.box_id)
 
+                cpu_before = self._cpu_times()
+                started = time.monotonic()
                 self.process.stdin.write(sanitized.encode())
                 await self.process.stdin.drain()
+                self.dirty = True
+                self.execs_since_checkpoint += 1
 
                 # 读取输出和错误
-                stdout, stderr = await asyncio.wait_for(
-                    self._read_process_output(marker), timeout=10.0
+                out = _OutputCapture(output_path(self.box_id, exec_id, "stdout"))
+                err = _OutputCapture(output_path(self.box_id, exec_id, "stderr"))
+                try:
+                    await asyncio.wait_for(
+                        self._read_process_output(marker, out, err), timeout=10.0
+                    )
+                finally:
+                    await out.aclose()
+                    await err.aclose()
+                wall = time.monotonic() - started
+                cpu_after = self._cpu_times()
+                truncated = out.spilled or err.spilled
+                if truncated:
+                    await asyncio.get_event_loop().run_in_executor(
+                        None, _prune_outputs, self.box_id
+                    )
+                return ExecResult(
+                    stdout=out.text(),
+                    stderr=err.text(),
+                    wall_seconds=wall,
+                    cpu_user_seconds=max(0.0, cpu_after[0] - cpu_before[0]),
+                    cpu_system_seconds=max(0.0, cpu_after[1] - cpu_before[1]),
+                    peak_rss_bytes=self._peak_rss(),
+                    output_bytes=out.total + err.total,
+                    truncated=truncated,
+                    output_id=exec_id if truncated else None,
+                    queued_seconds=queued,
                 )
-                return stdout, stderr
             except asyncio.TimeoutError:
                 logger.warning("Box %s execution timed out", self.box_id)
                 raise RuntimeError("执行超时")
@@ -168,16 +306,20 @@ class BoxedProcess:
                 logger.error("Box %s pipe error: %s", self.box_id, str(e))
                 raise RuntimeError(f"进程通信错误: {str(e)}，已尝试重启")
 
-    async def _read_process_output(self, marker: str, timeout=10.0):
+    async def _read_process_output(
+        self,
+        marker: str,
+        stdout_buffer: "_OutputCapture",
+        stderr_buffer: "_OutputCapture",
+        timeout=10.0,
+    ) -> None:
         """
         安全读取子进程的 stdout 和 stderr，直到检测到 marker 或超时。
 
         Args:
             marker (str): 用于标识输出结束的标记。
+            stdout_buffer, stderr_buffer: 接收输出，超过内联上限的部分写入溢出文件。
             timeout (float): 读取的最大等待时间（秒）。
-
-        Returns:
-            tuple: (stdout_output, stderr_output)，分别为标准输出和错误输出的字符串。
         """
         # 检查进程是否还活着
         if (
@@ -186,72 +328,65 @@ class BoxedProcess:
             or self.process.stdin is None
             or self.process.stdin.is_closing()
         ):
-            return "", ""
+            return
 
-        stdout_buffer = []
-        stderr_buffer = []
+        process = self.process
+        marker_bytes = marker.encode()
+        # stdout 出现 marker、流结束或进程退出时触发，不再轮询
+        done = asyncio.Event()
 
-        async def read_stream(stream, buffer):
+        async def read_stream(stream, buffer, watch: bool):
             """异步读取流并将数据添加到缓冲区。"""
-            while True:
-                try:
-                    data = await stream.read(1024)  # 每次读取 1024 字节
+            try:
+                while True:
+                    data = await stream.read(OUTPUT_READ_SIZE)
                     if not data:  # 流结束
                         break
-                    buffer.append(data.decode("utf-8", errors="replace"))
-                except asyncio.CancelledError:
-                    break
-                except Exception as e:
-                    buffer.append(f"[Stream read error: {e}]\n")
-                    break
+                    buffer.write(data)
+                    try:
+                        await buffer.drain()
+                    except OSError:
+                        break  # 溢出文件写入失败，提示由 aclose 附加，这里不再重复
+                    # 假定 marker 一定在末尾，只在末尾窗口里查找
+                    if watch and marker_bytes in buffer.tail:
+                        break
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                buffer.note(f"[Stream read error: {e}]\n")
+            finally:
+                if watch:
+                    done.set()
+
+        async def wait_exit():
+            await process.wait()
+            done.set()
 
         try:
             # 并发读取 stdout 和 stderr
             tasks = [
-                asyncio.create_task(read_stream(self.process.stdout, stdout_buffer)),
-                asyncio.create_task(read_stream(self.process.stderr, stderr_buffer)),
+                asyncio.create_task(read_stream(process.stdout, stdout_buffer, True)),
+                asyncio.create_task(read_stream(process.stderr, stderr_buffer, False)),
+                asyncio.create_task(wait_exit()),
             ]
 
-            # 等待 marker 出现或超时
-            async def wait_for_marker():
-                while True:
-                    # 检查 stdout 是否包含 marker，假定marker一定在末尾
-                    # 只检查最后一部分，避免每次都拼接全部内容
-                    if stdout_buffer:
-                        last_chunk = stdout_buffer[-1]
-                        if marker in last_chunk:
-                            break
-
-                    # 检查子进程是否已终止
-                    if self.process is None or self.process.returncode is not None:
-                        break
-
-                    # 等待一小段时间，避免忙等待
-                    await asyncio.sleep(0.3)
-
-            # 使用 timeout 限制等待时间
-            await asyncio.wait_for(wait_for_marker(), timeout)
-
-            # 取消未完成的任务
-            for task in tasks:
-                task.cancel()
-            await asyncio.gather(*tasks, return_exceptions=True)
+            # 等待 marker 出现、进程退出或超时
+            try:
+                await asyncio.wait_for(done.wait(), timeout)
+                await asyncio.sleep(OUTPUT_SETTLE)
+            finally:
+                # 取消未完成的任务
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
 
         except asyncio.TimeoutError:
-            stderr_buffer.append("[Error: Reading output timed out]\n")
+            stderr_buffer.note("[Error: Reading output timed out]\n")
         except Exception as e:
-            stderr_buffer.append(f"[Error: {e}]\n")
+            stderr_buffer.note(f"[Error: {e}]\n")
 
-        # 合并缓冲区内容
-        stdout_output = "".join(stdout_buffer)
-        stderr_output = "".join(stderr_buffer)
-
-        # 分离 marker 之前的内容
-        idx = stdout_output.find(marker)
-        if idx >= 0:
-            stdout_output = stdout_output[:idx].rstrip()
-
-        return stdout_output, stderr_output
+        # 去掉 marker 及其之后的内容
+        stdout_buffer.cut(marker_bytes)
 
     async def _quick_execute(self, code: str, timeout: float = 3.0) -> bool:
         """轻量级执行方法，仅用于内部指令"""
@@ -297,22 +432,18 @@ class BoxedProcess:
                     break
         except asyncio.TimeoutError:
             pass  # 超时表示没有更多数据可读
-        except Exception as e:
+        except Exception:
             pass  # 忽略其他错误，确保清空过程不中断
 
     async def stop(self) -> None:
         """停止进程，确保资源完全释放"""
         async with self._lock:
             if not self.process:
+                await self._release_cgroup()
                 return
 
-            # 取消监控任务
-            if self._monitor_task and not self._monitor_task.done():
-                self._monitor_task.cancel()
-                try:
-                    await self._monitor_task
-                except asyncio.CancelledError:
-                    pass
+            # 主动停止，不再视为意外退出
+            supervisor.unwatch(self.process.pid)
 
             # 尝试优雅终止进程
             try:
@@ -341,90 +472,362 @@ class BoxedProcess:
                 if hasattr(self.process, "kill"):
                     try:
                         self.process.kill()
-                    except:
+                    except Exception:
                         pass
             finally:
                 logger.info("Box %s stopped", self.box_id)
                 self._clear()
+                await self._release_cgroup()
+
+    async def _release_cgroup(self) -> None:
+        if self._cgroup:
+            await asyncio.get_event_loop().run_in_executor(None, self._cgroup.destroy)
+
+    def set_limits(self, limits: BoxLimits) -> None:
+        """调整资源上限，运行中的沙箱立即生效"""
+        self.limits = limits
+        if self._cgroup and self.is_running:
+            self._cgroup.apply(limits)
+
+    def usage(self) -> dict[str, int]:
+        """当前资源用量（cgroup 统计），未启用 cgroup 时为空"""
+        return self._cgroup.usage() if self._cgroup else {}
+
+    def _cpu_times(self) -> tuple[float, float]:
+        """沙箱累计 CPU (user, system) 秒数，优先取 cgroup，否则读 /proc"""
+        usage = self.usage()
+        if "cpu_user_usec" in usage:
+            return usage["cpu_user_usec"] / 1e6, usage["cpu_system_usec"] / 1e6
+        if self.process is None:
+            return 0.0, 0.0
+        try:
+            with open(f"/proc/{self.process.pid}/stat") as f:
+                fields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            return 0.0, 0.0
+        # utime, stime, cutime, cstime（从 state 字段起算的第 11-14 个）
+        utime, stime, cutime, cstime = (int(v) for v in fields[11:15])
+        return (utime + cutime) / _CLK_TCK, (stime + cstime) / _CLK_TCK
+
+    def _peak_rss(self) -> int:
+        """沙箱内存峰值字节数，优先取 cgroup memory.peak，否则读 VmHWM"""
+        usage = self.usage()
+        if "memory_peak" in usage:
+            return usage["memory_peak"]
+        if self.process is None:
+            return 0
+        try:
+            with open(f"/proc/{self.process.pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    @property
+    def pid(self) -> int | None:
+        return self.process.pid if self.process else None
 
     @property
     def is_running(self) -> bool:
         """检查进程是否在运行"""
         return self.process is not None and self.process.returncode is None
 
-    async def _monitor_process(self):
-        """check process lock_file"""
+    def _on_exit(self, pid: int) -> None:
+        """监管者回调：进程意外退出"""
+        process = self.process
+        if process is None or process.pid != pid:
+            return
+        returncode = process.returncode
+        if returncode is None:
+            returncode = exit_code(pid)
+        if returncode is None:
+            # asyncio 的 child watcher 已回收进程但还没回写 returncode，等它完成
+            asyncio.get_running_loop().create_task(self._wait_exit(process))
+            return
+        self._exited(process, returncode)
+
+    async def _wait_exit(self, process: asyncio.subprocess.Process) -> None:
         try:
-            await asyncio.sleep(5)
-            while self.is_running and self.process:
-                try:
-                    locked = self._is_process_file_locked()
-                    logger.debug(
-                        "Box %s process lock file check: %s",
-                        self.box_id,
-                        "locked" if locked else "unlocked",
-                    )
-                    if not locked:  # process terminated
-                        logger.warning(
-                            "Box %s process terminated unexpectedly with code %s",
-                            self.box_id,
-                            self.process.returncode,
-                        )
-                        self._clear()
-                        break
-                except Exception as e:
-                    logger.error(
-                        "Box %s error checking process lock file: %s",
-                        self.box_id,
-                        str(e),
-                    )
-                await asyncio.sleep(self._health_check_interval)
-
-        except Exception as e:
-            logger.error("Box %s monitor error: %s", self.box_id, str(e), exc_info=True)
-        finally:
-            self._monitor_task = None
+            returncode: int | None = await asyncio.wait_for(process.wait(), 5.0)
+        except asyncio.TimeoutError:
+            returncode = None
+        self._exited(process, returncode)
+
+    def _exited(
+        self, process: asyncio.subprocess.Process, returncode: int | None
+    ) -> None:
+        if self.process is not process:
+            return  # 期间已被主动停止或重启
+        logger.warning(
+            "Box %s process %s terminated unexpectedly with code %s",
+            self.box_id,
+            process.pid,
+            returncode,
+        )
+        self.exited_at = time.monotonic()
+        self._clear()
+        if self._exit_callback:
+            self._exit_callback(self.box_id, returncode)
 
-    def _is_process_file_locked(self):
+    async def checkpoint(self, dest: Path) -> Path:
         """
-        check process lock file: $TMPDIR/_l0ckfi1e
+        对沙箱做阻塞式 DMTCP 检查点，并把镜像移动到 dest 目录。
+        持有执行锁，保证检查点落在两次执行之间。
         """
-        lockfile_path = os.path.join(
-            f"{SANDBOX_PREFIX}{self.box_id}", "tmp", "_l0ckfi1e"
-        )
-        if not os.path.exists(lockfile_path):
-            logger.warning(
-                "Lockfile %s does not exist, process may have terminated",
-                lockfile_path,
-            )
-            return False
+        async with self._lock:
+            if not self.is_running:
+                raise RuntimeError("Box process not running")
+            await dmtcp_checkpoint(Path(f"{SANDBOX_PREFIX}{self.box_id}/ckpt"), dest)
+            self.dirty = False
+            self.execs_since_checkpoint = 0
+            self.checkpointed_at = time.monotonic()
+            logger.info("Box %s checkpointed to %s", self.box_id, dest)
+            return dest
+
+    @property
+    def uptime(self) -> float:
+        """最近一次运行的时长（秒）"""
+        end = time.monotonic() if self.is_running else self.exited_at
+        return max(0.0, end - self.started_at)
+
+    def record_event(self, kind: str, detail: str = "") -> None:
+        self.events.append(BoxEvent(kind=kind, detail=detail))
 
-        try:
-            with open(lockfile_path, "r") as f:
-                # non-blocking lock check
-                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
-                # successfully acquired the lock
-                logger.info(
-                    "Lockfile %s is not locked, process is running", lockfile_path
-                )
-                return False
-        except OSError as e:
-            if e.errno == errno.EAGAIN:
-                # file is already locked by another process
-                return True
-            else:
-                raise
-            
     def _clear(self):
         self.process = None
-        self._monitor_task = None
-
-    # async def _restart_process(self):
-    #     """尝试重启进程"""
-    #     try:
-    #         if self.process:
-    #             await self.stop()
-    #         await self.start()
-    #     except Exception as e:
-    #         logger.error("Failed to restart box %s: %s",
-    #                      self.box_id, str(e), exc_info=True)
+
+
+def output_path(box_id: str, output_id: str, stream: str) -> Path:
+    """溢出输出文件，位于沙箱 log 目录，随沙箱一起迁移和删除"""
+    return Path(f"{SANDBOX_PREFIX}{box_id}/log/output-{output_id}.{stream}")
+
+
+# 溢出文件的打开、写入、截断和关闭都在这个线程里按提交顺序执行，不阻塞事件循环
+_spill_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="output-spill")
+
+
+class _OutputCapture:
+    """
+    一路输出的缓冲：前 limit 字节留在内存作为内联结果；超出后把已缓存部分连同后续输出
+    全部写入溢出文件，内存中只保留开头的预览，避免大输出撑爆宿主进程。
+    数据直接追加到 bytearray，结束时一次性解码；marker 只在末尾窗口中查找。
+    文件操作交给写线程，在事件循环上用 drain/aclose 等待，循环之外用 close。
+    """
+
+    # 保留的末尾字节数，用于查找结束 marker
+    TAIL = 4096
+
+    def __init__(self, spill_path: Path, limit: int = MAX_INLINE_OUTPUT):
+        self.spill_path = spill_path
+        self.limit = limit
+        self.total = 0
+        self.tail = bytearray()
+        self.spilled = False
+        self._inline = bytearray()
+        # 只在写线程中访问
+        self._file: BinaryIO | None = None
+        # 写线程记录的第一个错误
+        self._error: OSError | None = None
+        self._notes: list[str] = []
+        self._pending: Future | None = None
+        self._backlog = 0
+
+    def write(self, data: bytes) -> None:
+        size = len(data)
+        view = memoryview(data)
+        self.total += size
+        if size >= self.TAIL:
+            self.tail[:] = view[-self.TAIL :]
+        else:
+            self.tail += view
+            del self.tail[: -self.TAIL]
+        if not self.spilled:
+            room = self.limit - len(self._inline)
+            if size <= room:
+                self._inline += view
+                return
+            self._submit(self._open, bytes(self._inline))
+            self._inline += view[:room]
+            self.spilled = True
+        self._submit(self._append, data)
+        self._backlog += size
+
+    async def drain(self) -> None:
+        """写线程积压过多时等它追上；写入失败在这里抛出"""
+        if self._pending is not None and self._backlog > OUTPUT_SPILL_BACKLOG:
+            await asyncio.wrap_future(self._pending)
+            self._backlog = 0
+        if self._error is not None:
+            raise self._error
+
+    def note(self, text: str) -> None:
+        """附加在内联结果末尾的提示（读取错误、超时），不写入溢出文件"""
+        self._notes.append(text)
+
+    def cut(self, marker: bytes) -> None:
+        """marker 在输出末尾，去掉它及之后的内容"""
+        idx = self.tail.find(marker)
+        if idx < 0:
+            return
+        self.total -= len(self.tail) - idx
+        del self.tail[idx:]
+        if self.spilled and self.total <= self.limit:
+            # 去掉 marker 后并未超出上限
+            self._submit(self._discard)
+            self.spilled = False
+        if self.spilled:
+            self._submit(self._truncate, self.total)
+        else:
+            # 原地去掉末尾空白，不复制整个缓冲区
+            end = self.total
+            while end and self._inline[end - 1] in b" \t\r\n\x0b\x0c":
+                end -= 1
+            del self._inline[end:]
+
+    async def aclose(self) -> None:
+        """等写线程处理完并关闭溢出文件"""
+        if self._pending is not None:
+            self._pending = None
+            await asyncio.wrap_future(_spill_writer.submit(self._close))
+            self._closed()
+
+    def close(self) -> None:
+        """同 aclose，但阻塞当前线程，只在事件循环之外使用"""
+        if self._pending is not None:
+            self._pending = None
+            _spill_writer.submit(self._close).result()
+            self._closed()
+
+    def _closed(self) -> None:
+        if self._error is not None:
+            self.note(f"[Output spill error: {self._error}]\n")
+
+    def _submit(self, fn: Callable[..., None], *args: object) -> None:
+        self._pending = _spill_writer.submit(self._guard, fn, *args)
+
+    # 以下在写线程中执行；出错后不再写入，错误由 drain/aclose 报告
+
+    def _guard(self, fn: Callable[..., None], *args: object) -> None:
+        if self._error is not None:
+            return
+        try:
+            fn(*args)
+        except OSError as e:
+            self._error = e
+
+    def _open(self, head: bytes) -> None:
+        self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.spill_path, "wb")
+        self._file.write(head)
+
+    def _append(self, data: bytes) -> None:
+        if self._file is not None:
+            self._file.write(data)
+
+    def _truncate(self, size: int) -> None:
+        if self._file is not None:
+            self._file.flush()
+            self._file.truncate(size)
+
+    def _discard(self) -> None:
+        self._close()
+        self.spill_path.unlink(missing_ok=True)
+
+    def _close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def text(self) -> str:
+        if self.spilled:
+            # 截断的预览可能停在多字节字符中间，丢弃不完整的末尾而不是显示为替换字符
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            data = decoder.decode(self._inline, final=False)
+        else:
+            data = self._inline.decode("utf-8", errors="replace")
+        return data + "".join(self._notes)
+
+
+def _prune_outputs(box_id: str, keep: int = OUTPUT_SPILL_KEEP) -> None:
+    """只保留最近 keep 次执行的溢出输出"""
+    log_dir = output_path(box_id, "x", "stdout").parent
+    files = sorted(
+        log_dir.glob("output-*"), key=lambda f: f.stat().st_mtime, reverse=True
+    )
+    ids: list[str] = []
+    for f in files:
+        output_id = f.name[len("output-") :].rsplit(".", 1)[0]
+        if output_id not in ids:
+            ids.append(output_id)
+        if len(ids) > keep and output_id not in ids[:keep]:
+            f.unlink(missing_ok=True)
+
+
+async def dmtcp_checkpoint(ckpt_dir: Path, dest: Path) -> None:
+    """
+    通过沙箱自己的 coordinator 做阻塞式检查点，并把镜像移动到 dest。
+    只依赖 ckpt 目录中的端口文件，也可用于上一个宿主进程遗留的沙箱。
+    """
+    await _dmtcp_command(ckpt_dir, "--bcheckpoint", "Checkpoint")
+    await asyncio.get_event_loop().run_in_executor(
+        None, _collect_images, ckpt_dir, dest
+    )
+
+
+async def dmtcp_quit(ckpt_dir: Path) -> None:
+    """结束 coordinator 及其下所有沙箱进程"""
+    await _dmtcp_command(ckpt_dir, "--quit", "Quit")
+
+
+async def _dmtcp_command(ckpt_dir: Path, action: str, what: str) -> None:
+    port = (ckpt_dir / "coord.port").read_text().strip()
+    cmd = await asyncio.create_subprocess_exec(
+        "dmtcp_command",
+        "--coord-port",
+        port,
+        action,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        _, err = await asyncio.wait_for(cmd.communicate(), timeout=CHECKPOINT_TIMEOUT)
+    except asyncio.TimeoutError:
+        cmd.kill()
+        raise RuntimeError(f"{what} timed out")
+    if cmd.returncode != 0:
+        raise RuntimeError(f"{what} failed: {err.decode(errors='replace').strip()}")
+
+
+def _collect_images(ckpt_dir: Path, dest: Path) -> None:
+    """把 DMTCP 写出的镜像移入 dest（同一卷上只是改名）"""
+    dest.mkdir(parents=True, exist_ok=True)
+    images = list(ckpt_dir.glob("ckpt_*.dmtcp"))
+    if not images:
+        raise RuntimeError(f"No checkpoint image written to {ckpt_dir}")
+    for image in images:
+        os.replace(image, dest / image.name)
+
+
+def _stage_images(source: Path, staging: Path) -> list[str]:
+    """
+    检查点保存在仅 root 可访问的 SNAPSHOT_DIR 中，恢复前先把镜像硬链接到沙箱内，
+    让 sandboxed 用户可以读取；跨文件系统时退化为复制。
+    """
+    images = sorted(source.glob("ckpt_*.dmtcp"))
+    if not images:
+        raise RuntimeError(f"No checkpoint image in {source}")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+    staged = []
+    for image in images:
+        target = staging / image.name
+        try:
+            os.link(image, target)
+        except OSError:
+            shutil.copy2(image, target)
+        shutil.chown(target, user="sandboxed", group="sandboxed")
+        staged.append(str(target))
+    shutil.chown(staging, user="sandboxed", group="sandboxed")
+    return staged
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+
+from .boxed_process import SANDBOX_ROOT, BoxedProcess
+
+TRASH_DIR = SANDBOX_ROOT + os.getenv("TRASH_DIR", ".trash")
+TEARDOWN_WORKERS = int(os.getenv("TEARDOWN_WORKERS", "2"))
+# 每个 worker 处理完一个任务后的间隔（秒），避免 rmtree 的 I/O 挤占活跃会话
+TEARDOWN_INTERVAL = float(os.getenv("TEARDOWN_INTERVAL", "0.2"))
+# 删除失败（如文件仍被占用）时的重试次数
+TEARDOWN_RETRIES = int(os.getenv("TEARDOWN_RETRIES", "3"))
+
+logger = logging.getLogger(__name__)
+
+
+class BoxedReaper:
+    """
+    后台拆除管道：停止沙箱进程，把目录改名移入回收站，再由有限个 worker 慢慢删除。
+    调用方只需 submit，不会等待任何进程退出或磁盘 I/O。
+    """
+
+    def __init__(
+        self, workers: int = TEARDOWN_WORKERS, interval: float = TEARDOWN_INTERVAL
+    ):
+        self._queue: asyncio.Queue[tuple[BoxedProcess | None, list[Path]]] = (
+            asyncio.Queue()
+        )
+        self._workers = max(1, workers)
+        self._interval = interval
+        self._tasks: list[asyncio.Task] = []
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        # 队列内部的 Event 绑定在首次等待它的事件循环上，重新启动（如测试中多次 lifespan）
+        # 时换一个新队列，未处理的任务一并转过去
+        pending = []
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        self._queue = asyncio.Queue()
+        for item in pending:
+            self._queue.put_nowait(item)
+        trash = Path(TRASH_DIR)
+        trash.mkdir(parents=True, exist_ok=True)
+        # 上次运行遗留在回收站里的目录，一并交给 worker 删除
+        leftovers = list(trash.iterdir())
+        if leftovers:
+            logger.info("Reaper found %d leftover trash entries", len(leftovers))
+            self._queue.put_nowait((None, leftovers))
+        for _ in range(self._workers):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    def submit(self, proc: BoxedProcess | None, paths: list[Path]) -> None:
+        """登记一个拆除任务，立即返回"""
+        self._queue.put_nowait((proc, paths))
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    async def close(self, timeout: float = 10.0) -> None:
+        """尽量处理完队列中的任务，然后停止 worker"""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Reaper closing with %d pending teardowns", self._queue.qsize()
+            )
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _worker(self) -> None:
+        while True:
+            proc, paths = await self._queue.get()
+            try:
+                await self._teardown(proc, paths)
+            except Exception as e:
+                logger.error("Teardown failed for %s", paths, exc_info=e)
+            finally:
+                self._queue.task_done()
+            if self._interval > 0:
+                await asyncio.sleep(self._interval)
+
+    async def _teardown(self, proc: BoxedProcess | None, paths: list[Path]) -> None:
+        if proc:
+            await proc.stop()
+        loop = asyncio.get_event_loop()
+        for path in paths:
+            trashed = await loop.run_in_executor(None, _move_to_trash, path)
+            if trashed is None:
+                continue
+            for attempt in range(TEARDOWN_RETRIES + 1):
+                await loop.run_in_executor(None, _remove, trashed)
+                if not trashed.exists() and not trashed.is_symlink():
+                    break
+                if attempt < TEARDOWN_RETRIES:
+                    await asyncio.sleep(self._interval * 2**attempt)
+            else:
+                # 留在回收站里，下次启动时再删
+                logger.warning("Cannot remove %s, leaving it in trash", trashed)
+
+
+def _remove(path: Path) -> None:
+    """删除目录树或单个文件（如迁移遗留的 tar 包）"""
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path, ignore_errors=True)
+    else:
+        path.unlink(missing_ok=True)
+
+
+def _move_to_trash(path: Path) -> Path | None:
+    """改名进回收站（同一文件系统下是原子的），失败时返回原路径直接删除"""
+    if not path.exists():
+        return None
+    trash = Path(TRASH_DIR)
+    if path.parent == trash:
+        return path
+    target = trash / f"{path.name}.{time.time_ns()}"
+    try:
+        os.rename(path, target)
+        return target
+    except OSError as e:
+        logger.warning("Cannot move %s to trash (%s), removing in place", path, e)
+        return path
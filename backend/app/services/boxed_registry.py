@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+from .boxed_process import SANDBOX_ROOT
+
+REGISTRY_DIR = SANDBOX_ROOT + os.getenv("REGISTRY_DIR", ".registry")
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class BoxMeta:
+    """落盘的沙箱元数据，宿主进程重启后据此接管或清理上次留下的沙箱"""
+
+    box_id: str
+    # idle：预热未分配；running：已分配给会话；hibernated：已休眠，只剩快照
+    status: str
+    pid: int | None = None
+    # /proc/<pid>/stat 中的进程启动时间，避免 pid 被复用后误认进程
+    pid_start: int | None = None
+    started_at: float = field(default_factory=time.time)
+    # 最近一次检查点或快照目录
+    checkpoint: str | None = None
+    limits: dict[str, Any] | None = None
+    # 到期时间（time.time()），None 为不过期
+    expires_at: float | None = None
+
+
+class BoxedRegistry:
+    """每个沙箱一个 JSON 文件，先写临时文件再改名，进程崩溃时不会留下半个文件"""
+
+    def __init__(self, root: str = REGISTRY_DIR):
+        self.root = Path(root)
+
+    def save(self, meta: BoxMeta) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        path = self.root / f"{meta.box_id}.json"
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(asdict(meta)))
+        os.replace(tmp, path)
+
+    def remove(self, box_id: str) -> None:
+        (self.root / f"{box_id}.json").unlink(missing_ok=True)
+
+    def load_all(self) -> list[BoxMeta]:
+        if not self.root.is_dir():
+            return []
+        metas = []
+        for path in self.root.glob("*.json"):
+            try:
+                metas.append(BoxMeta(**json.loads(path.read_text())))
+            except (OSError, ValueError, TypeError) as e:
+                logger.warning("Ignoring unreadable box meta %s: %s", path, e)
+        return metas
+
+
+def process_start_time(pid: int) -> int | None:
+    """进程启动时间（开机以来的时钟滴答数），进程不存在时为 None"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # starttime 是第 22 个字段，从 state（第 3 个）起算为第 19 个
+    return int(fields[19])
+
+
+def is_alive(meta: BoxMeta) -> bool:
+    if meta.pid is None:
+        return False
+    start = process_start_time(meta.pid)
+    return start is not None and (meta.pid_start is None or start == meta.pid_start)
@@ -0,0 +1,82 @@
+import asyncio
+import hmac
+import json
+import os
+from dataclasses import asdict, is_dataclass
+from typing import Any
+
+# 沙箱宿主进程与 API worker 之间的协议：Unix socket 上每行一个 JSON 消息
+#   请求 {"id": 1, "method": "exec_code", "params": {...}}
+#   响应 {"id": 1, "result": ...} 或 {"id": 1, "error": {"type": "KeyError", "message": "..."}}
+# 同一连接上可以有多个未完成的请求，响应按 id 对应，不保证顺序
+
+BOXED_HOST_SOCKET = os.getenv("BOXED_HOST_SOCKET", "/run/steprun/boxed.sock")
+# 跨机器时宿主进程另外监听的 TCP 地址（host:port），以及双方共享的访问令牌
+BOXED_HOST_LISTEN = os.getenv("BOXED_HOST_LISTEN") or None
+BOXED_HOST_TOKEN = os.getenv("BOXED_HOST_TOKEN") or None
+# 单条消息的最大长度，需要容纳完整的执行输出
+RPC_MESSAGE_LIMIT = int(os.getenv("BOXED_RPC_MESSAGE_LIMIT", str(64 * 1024 * 1024)))
+
+# 可以跨进程原样重新抛出的异常类型，路由层依赖它们区分 404/409 等
+_ERRORS: dict[str, type[Exception]] = {
+    "KeyError": KeyError,
+    "ValueError": ValueError,
+    "RuntimeError": RuntimeError,
+    "TimeoutError": TimeoutError,
+}
+
+
+class RpcConnectionError(ConnectionError):
+    """宿主进程不可用或连接断开，API 层返回 503"""
+
+
+async def open_connection(
+    address: str,
+) -> tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+    """address 为 socket 路径（可带 unix: 前缀）或 tcp://host:port"""
+    if address.startswith("tcp://"):
+        host, _, port = address.removeprefix("tcp://").rpartition(":")
+        return await asyncio.open_connection(host, int(port), limit=RPC_MESSAGE_LIMIT)
+    return await asyncio.open_unix_connection(
+        address.removeprefix("unix:"), limit=RPC_MESSAGE_LIMIT
+    )
+
+
+def check_token(message: dict[str, Any], token: str | None) -> bool:
+    """token 为 None 只出现在仅监听 Unix socket 时（BoxedHost 拒绝无令牌的 TCP 监听）"""
+    if token is None:
+        return True
+    return hmac.compare_digest(str(message.get("token", "")), token)
+
+
+async def read_message(reader: asyncio.StreamReader) -> dict[str, Any] | None:
+    """读取一条消息，连接关闭时返回 None"""
+    line = await reader.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+async def write_message(
+    writer: asyncio.StreamWriter, message: dict[str, Any], lock: asyncio.Lock
+) -> None:
+    data = json.dumps(message, default=_default).encode() + b"\n"
+    async with lock:
+        writer.write(data)
+        await writer.drain()
+
+
+def encode_error(e: BaseException) -> dict[str, str]:
+    kind = type(e).__name__ if type(e).__name__ in _ERRORS else "RuntimeError"
+    message = e.args[0] if isinstance(e, KeyError) and e.args else str(e)
+    return {"type": kind, "message": str(message)}
+
+
+def decode_error(error: dict[str, str]) -> Exception:
+    return _ERRORS.get(error.get("type", ""), RuntimeError)(error.get("message", ""))
+
+
+def _default(value: Any) -> Any:
+    if is_dataclass(value) and not isinstance(value, type):
+        return asdict(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
@@ -0,0 +1,98 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+
+# 同时执行的代码块数，0 为 CPU 核数
+EXEC_SLOTS = int(os.getenv("EXEC_SLOTS", "0")) or os.cpu_count() or 1
+# 还不知道某个用户执行耗时时的估计值（秒）
+EXEC_COST_DEFAULT = float(os.getenv("EXEC_COST_DEFAULT", "0.5"))
+# 执行耗时估计的平滑系数
+EXEC_COST_ALPHA = 0.2
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Tenant:
+    # 该用户最后一个排队任务的虚拟完成时间
+    finish: float = 0.0
+    # 执行耗时的滑动平均，作为下一个任务的代价估计
+    cost: float = EXEC_COST_DEFAULT
+    active: int = 0
+
+
+class FairScheduler:
+    """
+    节点级执行准入：最多 slots 个代码块同时执行，其余排队。
+    排队顺序按加权公平排队（WFQ）：每个任务的虚拟完成时间 = max(系统虚拟时间, 该用户上一个任务的完成时间)
+    + 估计耗时 / 权重，取完成时间最小的先执行。提交很多、耗时很长的用户排在后面，
+    偶尔提交短任务的交互用户几乎不用等待；权重按套餐给出。
+    """
+
+    def __init__(self, slots: int = EXEC_SLOTS):
+        self.slots = max(1, slots)
+        self.running = 0
+        self._vtime = 0.0
+        self._tenants: dict[str, _Tenant] = {}
+        # (虚拟完成时间, 序号, 虚拟开始时间, future)
+        self._queue: list[tuple[float, int, float, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for *_, f in self._queue if not f.done())
+
+    @asynccontextmanager
+    async def slot(self, tenant: str, weight: float = 1.0) -> AsyncIterator[float]:
+        """占用一个执行位，返回排队等待的秒数"""
+        state = self._tenants.setdefault(tenant, _Tenant())
+        start = max(self._vtime, state.finish)
+        state.finish = start + state.cost / max(weight, 1e-3)
+        state.active += 1
+        queued_at = time.monotonic()
+        try:
+            # 有空闲执行位时队列里不会有未放行的任务（_release 总是先放行排队的）
+            if self.running < self.slots:
+                self.running += 1
+                self._vtime = max(self._vtime, start)
+            else:
+                future = asyncio.get_running_loop().create_future()
+                heapq.heappush(
+                    self._queue, (state.finish, next(self._seq), start, future)
+                )
+                try:
+                    await future
+                except asyncio.CancelledError:
+                    if future.done() and not future.cancelled():
+                        self._release()  # 刚被放行就取消了，把执行位让给下一个
+                    else:
+                        future.cancel()
+                    raise
+            started = time.monotonic()
+            try:
+                yield started - queued_at
+            finally:
+                elapsed = time.monotonic() - started
+                state.cost += EXEC_COST_ALPHA * (elapsed - state.cost)
+                self._release()
+        finally:
+            state.active -= 1
+            if state.active == 0 and state.finish <= self._vtime:
+                # 没有排队任务且已被系统虚拟时间追上，状态不再影响排序
+                self._tenants.pop(tenant, None)
+
+    def _release(self) -> None:
+        self.running -= 1
+        while self._queue and self.running < self.slots:
+            _, _, start, future = heapq.heappop(self._queue)
+            if future.done():
+                continue  # 排队时被取消
+            self.running += 1
+            self._vtime = max(self._vtime, start)
+            future.set_result(None)
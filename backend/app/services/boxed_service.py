@@ -1,4 +1,11 @@
+import base64
+import time
+from typing import Any
+
+from .boxed_cgroup import BoxLimits
 from .boxed_manager import BoxedManager
+from .boxed_process import BoxEvent, ExecResult
+from .boxed_scheduler import FairScheduler
 
 
 class BoxedService:
@@ -6,19 +13,51 @@ class BoxedService:
 
     def __init__(self, prewarm_count: int = 5):
         self.manager = BoxedManager(prewarm_count=prewarm_count)
+        self.scheduler = FairScheduler()
 
     async def init(self):
         await self.manager.init()
         return self
 
-    async def create_session(self) -> str:
-        return await self.manager.acquire_box()
+    async def close(self) -> None:
+        await self.manager.close()
+
+    async def create_session(
+        self, limits: BoxLimits | None = None, ttl: float | None = None
+    ) -> str:
+        """ttl: seconds until the box is hibernated or destroyed, None for no expiry."""
+        return await self.manager.acquire_box(limits, _deadline(ttl))
 
-    async def exec_code(self, box_id: str, code: str) -> tuple[str, str]:
+    async def exec_code(
+        self,
+        box_id: str,
+        code: str,
+        tenant: str | None = None,
+        weight: float = 1.0,
+    ) -> ExecResult:
+        """
+        tenant/weight: who the cell runs for and their plan weight. When the node is
+        saturated, queued cells are admitted by weighted fair queuing across tenants.
+        """
         proc = self.manager.proc_registry.get(box_id)
         if not proc:
-            raise RuntimeError(f"No process found for box {box_id}")
-        return await proc.execute(code)
+            raise KeyError(box_id)
+        if not proc.is_running and self.manager.is_recovering(box_id):
+            raise RuntimeError(f"Box {box_id} is restarting, please retry shortly")
+        try:
+            # 先排本沙箱的锁再申请执行位，同一沙箱里排队的代码块不占执行位
+            return await proc.execute(
+                code, admit=self.scheduler.slot(tenant or box_id, weight)
+            )
+        finally:
+            self.manager.maybe_checkpoint(box_id)
+
+    async def events(self, box_id: str) -> list[BoxEvent]:
+        """Returns lifecycle events (crashes, restarts) of the box, oldest first."""
+        proc = self.manager.proc_registry.get(box_id)
+        if not proc:
+            raise KeyError(box_id)
+        return list(proc.events)
 
     async def install_packages(self, box_id: str, packages: list[str]) -> None:
         await self.manager.install_packages(box_id, packages)
@@ -29,8 +68,90 @@ class BoxedService:
         """
         return await self.manager.snapshot_box(box_id)
 
-    async def restore(self, box_id: str, snapshot_id: str) -> None:
-        return await self.manager.restore_box(box_id, snapshot_id)
+    async def restore(
+        self,
+        box_id: str,
+        snapshot_id: str,
+        limits: BoxLimits | None = None,
+        ttl: float | None = None,
+    ) -> None:
+        return await self.manager.restore_box(
+            box_id, snapshot_id, limits, _deadline(ttl)
+        )
+
+    async def usage(self, box_id: str) -> dict[str, int]:
+        """Returns current resource usage of the box read from its cgroup."""
+        return self.manager.usage(box_id)
 
     async def destroy(self, box_id: str) -> None:
         await self.manager.destroy_box(box_id)
+
+    async def stats(self) -> dict[str, Any]:
+        """Returns capacity and load of this node, used for placement across nodes."""
+        return {
+            **self.manager.stats(),
+            "exec_slots": self.scheduler.slots,
+            "exec_running": self.scheduler.running,
+            "exec_queued": self.scheduler.queued,
+        }
+
+    async def read_output(
+        self, box_id: str, output_id: str, stream: str, offset: int, size: int
+    ) -> dict[str, Any]:
+        """Reads part of a spilled exec output; data is base64 encoded."""
+        total, data = await self.manager.read_output(
+            box_id, output_id, stream, offset, size
+        )
+        return {"size": total, "data": base64.b64encode(data).decode()}
+
+    async def has_box(self, box_id: str) -> bool:
+        """Whether the box lives on this node, running or hibernated."""
+        return box_id in self.manager.proc_registry or self.manager.is_hibernated(
+            box_id
+        )
+
+    async def boxes(self, include_hibernated: bool = False) -> list[str]:
+        """Returns IDs of boxes assigned to sessions on this node."""
+        return self.manager.assigned_boxes(include_hibernated)
+
+    # 迁移：源节点 export_box -> read_export ... -> finish_export，
+    # 目标节点 begin_import -> write_import ... -> finish_import；数据块以 base64 传输
+
+    async def export_box(self, box_id: str) -> dict[str, Any]:
+        """Checkpoints and stops the box, returns the snapshot ID and archive size."""
+        export = await self.manager.export_box(box_id)
+        return {
+            "snapshot_id": export.snapshot_id,
+            "size": export.archive.stat().st_size,
+            "limits": export.limits,
+            "expires_at": export.expires_at,
+        }
+
+    async def read_export(self, box_id: str, offset: int, size: int) -> str:
+        data = await self.manager.read_export(box_id, offset, size)
+        return base64.b64encode(data).decode()
+
+    async def finish_export(self, box_id: str, moved: bool) -> None:
+        await self.manager.finish_export(box_id, moved)
+
+    async def begin_import(self, box_id: str) -> None:
+        await self.manager.begin_import(box_id)
+
+    async def write_import(self, box_id: str, offset: int, data: str) -> int:
+        return await self.manager.write_import(box_id, offset, base64.b64decode(data))
+
+    async def finish_import(
+        self,
+        box_id: str,
+        snapshot_id: str,
+        limits: BoxLimits | None = None,
+        expires_at: float | None = None,
+    ) -> None:
+        await self.manager.finish_import(box_id, snapshot_id, limits, expires_at)
+
+    async def abort_import(self, box_id: str) -> None:
+        await self.manager.abort_import(box_id)
+
+
+def _deadline(ttl: float | None) -> float | None:
+    return time.time() + ttl if ttl else None
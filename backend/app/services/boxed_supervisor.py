@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import os
+from collections.abc import Callable
+
+# 不支持 pidfd 的内核上，退化为单个轮询任务的间隔（秒）
+SUPERVISOR_POLL_INTERVAL = float(os.getenv("SUPERVISOR_POLL_INTERVAL", "2"))
+
+logger = logging.getLogger(__name__)
+
+ExitCallback = Callable[[int], None]
+
+
+class ProcessSupervisor:
+    """
+    节点级进程监管：所有沙箱进程共用一个监管者。
+    通过 pidfd 把进程退出事件挂到事件循环上，进程退出时立即回调，没有进程退出时不消耗任何资源。
+    内核不支持 pidfd 时，退化为一个全局轮询任务。
+    """
+
+    def __init__(self, poll_interval: float = SUPERVISOR_POLL_INTERVAL):
+        self._watches: dict[int, tuple[int | None, ExitCallback]] = {}
+        self._poll_interval = poll_interval
+        self._poll_task: asyncio.Task | None = None
+
+    def watch(self, pid: int, callback: ExitCallback) -> None:
+        """登记进程，进程退出时以 pid 调用 callback（在事件循环线程中）"""
+        self.unwatch(pid)
+        loop = asyncio.get_running_loop()
+        try:
+            fd: int | None = os.pidfd_open(pid)
+        except (AttributeError, OSError):
+            fd = None
+        self._watches[pid] = (fd, callback)
+        if fd is not None:
+            loop.add_reader(fd, self._on_exit, pid)
+        elif self._poll_task is None or self._poll_task.done():
+            self._poll_task = asyncio.create_task(self._poll())
+
+    def unwatch(self, pid: int) -> None:
+        """取消登记，主动停止进程前调用，避免被当作意外退出"""
+        entry = self._watches.pop(pid, None)
+        if entry is None:
+            return
+        fd = entry[0]
+        if fd is not None:
+            try:
+                asyncio.get_running_loop().remove_reader(fd)
+            except RuntimeError:
+                pass
+            os.close(fd)
+
+    @property
+    def watched(self) -> int:
+        return len(self._watches)
+
+    def _on_exit(self, pid: int) -> None:
+        entry = self._watches.get(pid)
+        if entry is None:
+            return
+        callback = entry[1]
+        self.unwatch(pid)
+        try:
+            callback(pid)
+        except Exception as e:
+            logger.error("Exit callback for PID %s failed", pid, exc_info=e)
+
+    async def _poll(self) -> None:
+        while any(fd is None for fd, _ in self._watches.values()):
+            await asyncio.sleep(self._poll_interval)
+            for pid, (fd, _) in list(self._watches.items()):
+                if fd is None and not _pid_alive(pid):
+                    self._on_exit(pid)
+
+
+def exit_code(pid: int) -> int | None:
+    """
+    已退出子进程的退出码（被信号终止时为负的信号值），不回收进程。
+    pidfd 可读时 asyncio 的 child watcher 可能还没回收进程、returncode 仍为 None，
+    用 WNOWAIT 先读出状态，回收仍交给 asyncio；不是本进程的子进程或已被回收时返回 None。
+    """
+    try:
+        info = os.waitid(os.P_PID, pid, os.WEXITED | os.WNOHANG | os.WNOWAIT)
+    except ChildProcessError:
+        return None
+    if info is None:
+        return None
+    if info.si_code == os.CLD_EXITED:
+        return info.si_status
+    return -info.si_status
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+supervisor = ProcessSupervisor()
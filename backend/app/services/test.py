@@ -1,6 +1,8 @@
-from boxed_service import SandboxService
 import asyncio
 
+from boxed_service import SandboxService
+
+
 async def main():
     service = SandboxService(0)
     async with service.session_scope() as session_id:
@@ -14,5 +16,6 @@ async def main():
         print(e)
         assert session_id in str(e)
 
+
 if __name__ == "__main__":
     asyncio.run(main())
@@ -116,3 +116,31 @@ def test_reset_password_invalid_token(
     assert "detail" in response
     assert r.status_code == 400
     assert response["detail"] == "Invalid token"
+
+
+def test_principal_token_is_revoked_on_user_update(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    email = random_email()
+    password = random_lower_string()
+    user = create_user(
+        session=db, user_create=UserCreate(email=email, password=password)
+    )
+    headers = user_authentication_headers(client=client, email=email, password=password)
+
+    r = client.post(f"{settings.API_V1_STR}/login/principal-token", headers=headers)
+    assert r.status_code == 200
+    principal_headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    r = client.get(f"{settings.API_V1_STR}/usages", headers=principal_headers)
+    assert r.status_code == 200
+
+    r = client.patch(
+        f"{settings.API_V1_STR}/users/{user.id}",
+        headers=superuser_token_headers,
+        json={"is_active": False},
+    )
+    assert r.status_code == 200
+
+    r = client.get(f"{settings.API_V1_STR}/usages", headers=principal_headers)
+    assert r.status_code == 403
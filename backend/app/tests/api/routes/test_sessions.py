@@ -0,0 +1,361 @@
+import asyncio
+import uuid
+from collections.abc import Generator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from sqlmodel import Session, delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud
+from app.api.routes import sessions
+from app.core.config import settings
+from app.core.db import async_engine
+from app.core.plans import get_plan
+from app.core.rate_limit import UsageCounter
+from app.crud_user_session import create_user_session
+from app.models import (
+    SandboxUsage,
+    SandboxUsageDaily,
+    SandboxUsageHourly,
+    SessionStatus,
+    User,
+    UserPrincipal,
+    UserSession,
+    UserSessionCreate,
+)
+from app.services.boxed_cluster import BoxedCluster
+from app.services.boxed_process import ExecResult
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import random_lower_string
+from app.usage_buffer import UsageBuffer
+
+
+class FakeBoxedService:
+    """Stands in for the sandbox backend; records the calls the routes make."""
+
+    def __init__(self) -> None:
+        self.running: set[str] = set()
+        self.calls: list[tuple[str, str]] = []
+
+    async def events(self, box_id: str) -> list[Any]:
+        if box_id not in self.running:
+            raise KeyError(box_id)
+        return []
+
+    async def destroy(self, box_id: str) -> None:
+        self.calls.append(("destroy", box_id))
+        self.running.discard(box_id)
+
+    async def snapshot(self, box_id: str) -> str:
+        self.calls.append(("snapshot", box_id))
+        if box_id not in self.running:
+            raise KeyError(box_id)
+        self.running.discard(box_id)
+        return "snap"
+
+    async def restore(self, box_id: str, snapshot_id: str, **_: Any) -> None:
+        self.calls.append(("restore", box_id))
+        self.running.add(box_id)
+
+    async def has_box(self, box_id: str) -> bool:
+        return box_id in self.running
+
+    async def exec_code(self, box_id: str, code: str, **_: Any) -> ExecResult:
+        self.calls.append(("exec", box_id))
+        if box_id not in self.running:
+            raise KeyError(box_id)
+        if code == "restarting":
+            raise RuntimeError(f"Box {box_id} is restarting, please retry shortly")
+        return ExecResult(
+            stdout=code,
+            stderr="",
+            wall_seconds=0.25,
+            cpu_user_seconds=0.125,
+            cpu_system_seconds=0.0625,
+            peak_rss_bytes=64 * 1024 * 1024,
+            output_bytes=len(code),
+        )
+
+
+@pytest.fixture
+def service(monkeypatch: pytest.MonkeyPatch) -> Generator[FakeBoxedService, None, None]:
+    fake = FakeBoxedService()
+    monkeypatch.setattr(sessions, "boxed_service", fake)
+    sessions.session_owners.clear()
+    sessions.active_boxes.clear()
+    sessions.rate_limiter.clear()
+    yield fake
+    sessions.session_owners.clear()
+    sessions.active_boxes.clear()
+
+
+@pytest.fixture
+def user(db: Session) -> Generator[User, None, None]:
+    user = crud.get_user_by_email(session=db, email=settings.EMAIL_TEST_USER)
+    assert user
+    yield user
+    db.exec(delete(UserSession).where(UserSession.user_id == user.id))  # type: ignore[call-overload]
+    db.commit()
+
+
+def _add_session(
+    db: Session,
+    user: User,
+    status: SessionStatus = SessionStatus.STARTED,
+    node: str | None = None,
+) -> str:
+    session_id = random_lower_string()
+    db.add(
+        UserSession(session_id=session_id, user_id=user.id, status=status, node=node)
+    )
+    db.commit()
+    return session_id
+
+
+def _url(session_id: str, action: str = "") -> str:
+    return f"{settings.API_V1_STR}/sessions/{session_id}{action}"
+
+
+def test_owner_cache_hit_for_other_user_is_404(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    service: FakeBoxedService,
+    user: User,
+) -> None:
+    session_id = _add_session(db, user)
+    service.running.add(session_id)
+    sessions.session_owners.set(session_id, uuid.uuid4())
+    r = client.get(_url(session_id, "/events"), headers=normal_user_token_headers)
+    # the cached owner is trusted, the DB row is not consulted
+    assert r.status_code == 404
+
+
+def test_owner_db_miss_falls_back_and_caches(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    service: FakeBoxedService,
+    user: User,
+) -> None:
+    session_id = _add_session(db, user)
+    service.running.add(session_id)
+    r = client.get(_url(session_id, "/events"), headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert sessions.session_owners.get(session_id) == user.id
+
+    missing = random_lower_string()
+    r = client.get(_url(missing, "/events"), headers=normal_user_token_headers)
+    assert r.status_code == 404
+    assert sessions.session_owners.get(missing) is None
+
+
+def test_owner_cache_invalidated_on_destroy(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    service: FakeBoxedService,
+    user: User,
+) -> None:
+    session_id = _add_session(db, user)
+    service.running.add(session_id)
+    r = client.get(_url(session_id, "/events"), headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert sessions.session_owners.get(session_id) == user.id
+
+    r = client.delete(_url(session_id), headers=normal_user_token_headers)
+    assert r.status_code == 204
+    assert sessions.session_owners.get(session_id) is None
+    assert service.calls == [("destroy", session_id)]
+
+
+def test_owner_db_fallback_routes_to_recorded_node(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    user: User,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    cluster = BoxedCluster(
+        {"a": "unix:/nonexistent/a.sock", "b": "unix:/nonexistent/b.sock"}
+    )
+    monkeypatch.setattr(sessions, "boxed_service", cluster)
+    sessions.session_owners.clear()
+    session_id = _add_session(db, user, node="b")
+    client.get(_url(session_id, "/events"), headers=normal_user_token_headers)
+    assert cluster.node_of(session_id) == "b"
+    sessions.session_owners.clear()
+
+
+def test_repeated_destroy_releases_box_once(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    service: FakeBoxedService,
+    user: User,
+) -> None:
+    session_id = _add_session(db, user)
+    service.running.add(session_id)
+    sessions.active_boxes.set(user.id, 2)
+    for _ in range(3):
+        r = client.delete(_url(session_id), headers=normal_user_token_headers)
+        assert r.status_code == 204
+    assert sessions.active_boxes.get(user.id) == 1
+
+    # a hibernated box does not hold a slot, destroying it frees nothing
+    hibernated = _add_session(db, user, SessionStatus.HIBERNATED)
+    r = client.delete(_url(hibernated), headers=normal_user_token_headers)
+    assert r.status_code == 204
+    assert sessions.active_boxes.get(user.id) == 1
+    db.expire_all()
+    row = db.exec(select(UserSession).where(UserSession.session_id == hibernated)).one()
+    assert row.status == SessionStatus.DESTROYED
+
+
+def test_repeated_hibernate_releases_box_once(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    service: FakeBoxedService,
+    user: User,
+) -> None:
+    session_id = _add_session(db, user)
+    service.running.add(session_id)
+    sessions.active_boxes.set(user.id, 1)
+    r = client.post(_url(session_id, "/hibernate"), headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert sessions.active_boxes.get(user.id) == 0
+    # the box is gone now, a second hibernate fails without touching the count
+    r = client.post(_url(session_id, "/hibernate"), headers=normal_user_token_headers)
+    assert r.status_code == 404
+    assert sessions.active_boxes.get(user.id) == 0
+
+
+def test_repeated_restore_reserves_box_once(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    service: FakeBoxedService,
+    user: User,
+) -> None:
+    session_id = _add_session(db, user, SessionStatus.HIBERNATED)
+    sessions.active_boxes.set(user.id, 0)
+    for _ in range(3):
+        r = client.post(
+            _url(session_id, "/restore"),
+            headers=normal_user_token_headers,
+            json={"snapshot_id": "snap"},
+        )
+        assert r.status_code == 204
+    assert sessions.active_boxes.get(user.id) == 1
+    assert service.calls == [("restore", session_id)] * 3
+
+
+def test_exec_records_usage(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    service: FakeBoxedService,
+    user: User,
+    tmp_path: Path,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    buffer = UsageBuffer(str(tmp_path), flush_size=10**6, flush_interval=3600)
+    monkeypatch.setattr(sessions, "usage_buffer", buffer)
+    session_id = _add_session(db, user)
+    service.running.add(session_id)
+    try:
+        r = client.post(
+            _url(session_id, "/exec"),
+            headers=normal_user_token_headers,
+            json={"code": "print(1)"},
+        )
+        assert r.status_code == 200
+        assert r.json()["stdout"] == "print(1)"
+        assert asyncio.run(buffer.flush()) == 1
+
+        db.expire_all()
+        row = db.exec(
+            select(SandboxUsage).where(SandboxUsage.session_id == session_id)
+        ).one()
+        assert row.user_id == user.id
+        assert row.duration_seconds == 0.25
+        assert row.cpu_user_seconds == 0.125
+        assert row.cpu_system_seconds == 0.0625
+        assert row.peak_rss_bytes == 64 * 1024 * 1024
+        assert row.output_bytes == len("print(1)")
+    finally:
+        for model in (SandboxUsage, SandboxUsageHourly, SandboxUsageDaily):
+            db.execute(delete(model).where(model.user_id == user.id))
+        db.commit()
+
+
+def test_concurrent_reservations_do_not_exceed_the_quota(
+    db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    # every reservation reads the database, as if each came from another worker
+    monkeypatch.setattr(sessions, "active_boxes", UsageCounter[uuid.UUID](resync=0))
+    user = create_random_user(db)
+    plan = get_plan("free")
+    for _ in range(plan.max_boxes - 1):
+        _add_session(db, user)
+    principal = UserPrincipal(id=user.id)
+
+    async def run() -> None:
+        try:
+            async with (
+                AsyncSession(async_engine, expire_on_commit=False) as first,
+                AsyncSession(async_engine, expire_on_commit=False) as second,
+            ):
+                await sessions._reserve_box(first, principal, plan)
+                waiting = asyncio.create_task(
+                    sessions._reserve_box(second, principal, plan)
+                )
+                await asyncio.sleep(0.2)
+                # blocked until the first reservation's session row is committed
+                assert not waiting.done()
+                await create_user_session(
+                    session=first,
+                    session_create=UserSessionCreate(
+                        session_id=random_lower_string(), user_id=user.id
+                    ),
+                )
+                with pytest.raises(HTTPException) as e:
+                    await waiting
+                assert e.value.status_code == 429
+        finally:
+            await async_engine.dispose()
+
+    try:
+        asyncio.run(run())
+    finally:
+        db.exec(delete(UserSession).where(UserSession.user_id == user.id))  # type: ignore[call-overload]
+        db.commit()
+
+
+def test_exec_maps_missing_box_to_404_and_failures_to_503(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    service: FakeBoxedService,
+    user: User,
+) -> None:
+    session_id = _add_session(db, user)
+    r = client.post(
+        _url(session_id, "/exec"), headers=normal_user_token_headers, json={"code": "x"}
+    )
+    assert r.status_code == 404
+    assert r.json()["detail"] == "Session not found"
+
+    service.running.add(session_id)
+    r = client.post(
+        _url(session_id, "/exec"),
+        headers=normal_user_token_headers,
+        json={"code": "restarting"},
+    )
+    assert r.status_code == 503
+    assert "restarting" in r.json()["detail"]
@@ -1,14 +1,20 @@
 import uuid
+from typing import Any
 from unittest.mock import patch
 
+import pytest
+from fastapi import HTTPException
 from fastapi.testclient import TestClient
-from sqlmodel import Session, select
+from sqlmodel import Session, delete, select
 
 from app import crud
+from app.api import deps
+from app.core.cache import TTLCache
 from app.core.config import settings
 from app.core.security import verify_password
-from app.models import User, UserCreate
+from app.models import TokenRevocation, User, UserCreate
 from app.tests.utils.utils import random_email, random_lower_string
+from app.token_revocation import RevocationList
 
 
 def test_get_users_superuser_me(
@@ -33,6 +39,75 @@ def test_get_users_normal_user_me(
     assert current_user["email"] == settings.EMAIL_TEST_USER
 
 
+def test_api_key_stored_hashed(
+    client: TestClient, normal_user_token_headers: dict[str, str], db: Session
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/users/me/api-key", headers=normal_user_token_headers
+    )
+    assert r.status_code == 200
+    created = r.json()
+    api_key = created["api_key"]
+    assert api_key.startswith(created["prefix"])
+
+    user = db.exec(select(User).where(User.email == settings.EMAIL_TEST_USER)).one()
+    db.refresh(user)
+    assert user.api_key_hash != api_key
+    assert user.api_key_prefix == created["prefix"]
+
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers={"x-api-key": api_key})
+    assert r.json()["email"] == settings.EMAIL_TEST_USER
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/me/api-key", headers=normal_user_token_headers
+    )
+    assert api_key not in r.json()["api_key"]
+
+    client.delete(
+        f"{settings.API_V1_STR}/users/me/api-key", headers=normal_user_token_headers
+    )
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers={"x-api-key": api_key})
+    assert r.status_code == 403
+
+
+def test_api_key_rotation_reaches_other_workers(
+    client: TestClient,
+    normal_user_token_headers: dict[str, str],
+    db: Session,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    # two API workers, each with its own key cache and revocation list
+    workers = [(TTLCache[str, Any](), RevocationList()) for _ in range(2)]
+
+    def on(worker: int) -> None:
+        cache, revocations = workers[worker]
+        monkeypatch.setattr(deps, "api_key_cache", cache)
+        monkeypatch.setattr(deps, "revocation_list", revocations)
+
+    url = f"{settings.API_V1_STR}/users/me/api-key"
+    on(0)
+    old_key = client.post(url, headers=normal_user_token_headers).json()["api_key"]
+    on(1)
+    principal = deps.get_current_principal(db, api_key=old_key)
+    assert deps.get_current_principal(db, api_key=old_key) == principal
+    assert len(workers[1][0]) == 1
+
+    on(0)
+    new_key = client.post(url, headers=normal_user_token_headers).json()["api_key"]
+    on(1)
+    try:
+        # the other worker learns about the rotation on its next refresh
+        workers[1][1].refresh()
+        with pytest.raises(HTTPException) as e:
+            deps.get_current_principal(db, api_key=old_key)
+        assert e.value.status_code == 403
+        assert deps.get_current_principal(db, api_key=new_key) == principal
+    finally:
+        client.delete(url, headers=normal_user_token_headers)
+        db.exec(delete(TokenRevocation).where(TokenRevocation.user_id == principal.id))  # type: ignore[call-overload]
+        db.commit()
+
+
 def test_create_user_new_email(
     client: TestClient, superuser_token_headers: dict[str, str], db: Session
 ) -> None:
@@ -168,6 +243,41 @@ def test_retrieve_users(
         assert "email" in item
 
 
+def test_retrieve_users_cursor_pagination(
+    client: TestClient, superuser_token_headers: dict[str, str], db: Session
+) -> None:
+    for _ in range(3):
+        user_in = UserCreate(email=random_email(), password=random_lower_string())
+        crud.create_user(session=db, user_create=user_in)
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"limit": 2, "count": "none"},
+    )
+    first = r.json()
+    assert len(first["data"]) == 2
+    assert first["count"] is None
+    assert first["next_cursor"]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"limit": 2, "cursor": first["next_cursor"]},
+    )
+    second = r.json()
+    assert second["data"]
+    first_ids = {u["id"] for u in first["data"]}
+    assert not first_ids & {u["id"] for u in second["data"]}
+
+    r = client.get(
+        f"{settings.API_V1_STR}/users/",
+        headers=superuser_token_headers,
+        params={"cursor": "not-a-cursor"},
+    )
+    assert r.status_code == 400
+
+
 def test_update_user_me(
     client: TestClient, normal_user_token_headers: dict[str, str], db: Session
 ) -> None:
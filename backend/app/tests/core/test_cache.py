@@ -0,0 +1,32 @@
+import time
+
+from app.core.cache import TTLCache
+
+
+def test_lru_eviction() -> None:
+    cache: TTLCache[str, int] = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_expiry() -> None:
+    cache: TTLCache[str, int] = TTLCache(ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_invalidation() -> None:
+    cache: TTLCache[str, int] = TTLCache()
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.set("c", 2)
+    assert cache.pop("a") == 1
+    assert cache.discard_where(lambda v: v == 2) == 2
+    assert len(cache) == 0
@@ -0,0 +1,35 @@
+import time
+
+from app.core.rate_limit import TokenBucketLimiter, UsageCounter
+
+
+def test_token_bucket_burst_then_rate() -> None:
+    limiter: TokenBucketLimiter[str] = TokenBucketLimiter()
+    assert [limiter.acquire("a", rate=10, burst=3) for _ in range(3)] == [0, 0, 0]
+    wait = limiter.acquire("a", rate=10, burst=3)
+    assert 0 < wait <= 0.1
+    # other keys have their own bucket
+    assert limiter.acquire("b", rate=10, burst=3) == 0
+    time.sleep(wait + 0.01)
+    assert limiter.acquire("a", rate=10, burst=3) == 0
+
+
+def test_token_bucket_eviction_starts_full() -> None:
+    limiter: TokenBucketLimiter[str] = TokenBucketLimiter(maxsize=1)
+    assert limiter.acquire("a", rate=0.001, burst=1) == 0
+    assert limiter.acquire("a", rate=0.001, burst=1) > 0
+    limiter.acquire("b", rate=0.001, burst=1)
+    assert limiter.acquire("a", rate=0.001, burst=1) == 0
+
+
+def test_usage_counter_resync() -> None:
+    counter: UsageCounter[str] = UsageCounter(resync=0.05)
+    assert counter.get("a") is None
+    counter.add("a", 1)  # unknown keys are ignored until loaded
+    assert counter.get("a") is None
+    counter.set("a", 2)
+    counter.add("a", 1)
+    counter.add("a", -5)
+    assert counter.get("a") == 0
+    time.sleep(0.06)
+    assert counter.get("a") is None
@@ -0,0 +1,94 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlmodel import Session, delete
+
+from app import crud_sandbox_usage
+from app.models import (
+    SandboxUsage,
+    SandboxUsageCreate,
+    SandboxUsageDaily,
+    SandboxUsageHourly,
+)
+from app.tests.utils.user import create_random_user
+
+
+def test_split_range_within_an_hour() -> None:
+    start = datetime(2025, 1, 1, 10, 5)
+    end = datetime(2025, 1, 1, 10, 50)
+    raw, hourly, daily = crud_sandbox_usage.split_range(start, end)
+    assert raw == [(start, end)]
+    assert hourly == []
+    assert daily == []
+
+
+def test_split_range_over_days() -> None:
+    start = datetime(2025, 1, 1, 22, 30)
+    end = datetime(2025, 1, 4, 2, 15)
+    raw, hourly, daily = crud_sandbox_usage.split_range(start, end)
+    assert raw == [
+        (start, datetime(2025, 1, 1, 23)),
+        (datetime(2025, 1, 4, 2), end),
+    ]
+    assert hourly == [
+        (datetime(2025, 1, 1, 23), datetime(2025, 1, 2)),
+        (datetime(2025, 1, 4), datetime(2025, 1, 4, 2)),
+    ]
+    assert daily == [(datetime(2025, 1, 2), datetime(2025, 1, 4))]
+
+
+def test_partition_names_round_trip() -> None:
+    month = datetime(2025, 12, 1)
+    name = crud_sandbox_usage._partition_name(month)
+    assert name == "sandboxusage_y2025m12"
+    assert crud_sandbox_usage._partition_month(name) == month
+    assert crud_sandbox_usage._next_month(month) == datetime(2026, 1, 1)
+    assert (
+        crud_sandbox_usage._partition_month(crud_sandbox_usage.DEFAULT_PARTITION)
+        is None
+    )
+
+
+def test_create_many_maintains_rollups(db: Session) -> None:
+    user = create_random_user(db)
+    executed = [
+        datetime(2025, 1, 1, 9, 15),
+        datetime(2025, 1, 1, 9, 45),
+        datetime(2025, 1, 2, 12, 0),
+    ]
+    rows = [
+        SandboxUsage.model_validate(
+            SandboxUsageCreate(user_id=user.id, duration_seconds=2.0),
+            update={"cost_units": 0.02, "executed_at": at, "id": uuid.uuid4()},
+        ).model_dump()
+        for at in executed
+    ]
+    try:
+        assert crud_sandbox_usage.create_many(db, rows=rows) == 3
+        # replaying the same rows must not double count
+        assert crud_sandbox_usage.create_many(db, rows=rows) == 0
+
+        stats = crud_sandbox_usage.get_usage_stats(db, user.id)
+        assert stats.usage_count == 3
+        assert stats.total_duration == 6.0
+
+        stats = crud_sandbox_usage.get_usage_stats(
+            db, user.id, (datetime(2025, 1, 1, 9, 30), datetime(2025, 1, 2, 23, 0))
+        )
+        assert stats.usage_count == 2
+
+        # aware bounds are compared in UTC against the naive UTC column
+        cst = timezone(timedelta(hours=8))
+        found = crud_sandbox_usage.get_by_user(
+            db,
+            user.id,
+            time_range=(
+                datetime(2025, 1, 1, 17, 30, tzinfo=cst),
+                datetime(2025, 1, 2, 23, 0, tzinfo=timezone.utc),
+            ),
+        )
+        assert [r.executed_at for r in found] == executed[:0:-1]
+    finally:
+        for model in (SandboxUsage, SandboxUsageHourly, SandboxUsageDaily):
+            db.execute(delete(model).where(model.user_id == user.id))
+        db.commit()
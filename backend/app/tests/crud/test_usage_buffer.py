@@ -0,0 +1,235 @@
+import asyncio
+import fcntl
+import os
+import subprocess
+import sys
+import threading
+from collections.abc import Generator
+from pathlib import Path
+from typing import Any
+
+import pytest
+from sqlmodel import Session, delete, func, select
+
+from app import usage_buffer
+from app.models import (
+    SandboxUsage,
+    SandboxUsageCreate,
+    SandboxUsageDaily,
+    SandboxUsageHourly,
+    User,
+)
+from app.tests.utils.user import create_random_user
+from app.usage_buffer import UsageBuffer
+
+# records usage in a separate process that is SIGKILLed inside the flush,
+# before or after the rows are committed
+CRASHING_WORKER = """
+import asyncio, os, signal, sys, uuid
+from app import usage_buffer
+from app.models import SandboxUsageCreate
+
+spill_dir, user_id, stage, count = sys.argv[1:]
+write_rows = usage_buffer._write_rows
+
+def crash(rows):
+    if stage == "after_commit":
+        write_rows(rows)
+    os.kill(os.getpid(), signal.SIGKILL)
+
+usage_buffer._write_rows = crash
+
+async def main():
+    buffer = usage_buffer.UsageBuffer(spill_dir, flush_size=10**6, flush_interval=3600)
+    await buffer.start()
+    for _ in range(int(count)):
+        buffer.add(SandboxUsageCreate(user_id=uuid.UUID(user_id), duration_seconds=1.0))
+    await buffer.flush()
+
+asyncio.run(main())
+"""
+
+
+@pytest.fixture
+def user(db: Session) -> Generator[User, None, None]:
+    user = create_random_user(db)
+    yield user
+    for model in (SandboxUsage, SandboxUsageHourly, SandboxUsageDaily):
+        db.execute(delete(model).where(model.user_id == user.id))
+    db.commit()
+
+
+def _buffer(spill_dir: Path) -> UsageBuffer:
+    return UsageBuffer(str(spill_dir), flush_size=10**6, flush_interval=3600)
+
+
+async def _recover(spill_dir: Path) -> int:
+    """Starts a fresh buffer over spill_dir and flushes what it adopted."""
+    buffer = _buffer(spill_dir)
+    await buffer.start()
+    written = await buffer.flush()
+    await buffer.close()
+    return written
+
+
+def _usage(user: User) -> SandboxUsageCreate:
+    return SandboxUsageCreate(user_id=user.id, duration_seconds=1.0)
+
+
+def _spilled(spill_dir: Path) -> int:
+    return sum(
+        1
+        for path in spill_dir.glob("usage-*.jsonl")
+        for line in path.read_text().splitlines()
+        if line.strip()
+    )
+
+
+def _counts(db: Session, user: User) -> tuple[int, int]:
+    """Raw rows and the hourly rollup count for the user."""
+    db.expire_all()
+    raw = db.exec(select(func.count()).where(SandboxUsage.user_id == user.id)).one()
+    hourly = db.exec(
+        select(func.coalesce(func.sum(SandboxUsageHourly.usage_count), 0)).where(
+            SandboxUsageHourly.user_id == user.id
+        )
+    ).one()
+    return raw, hourly
+
+
+def test_failed_flush_keeps_rows_and_retries(
+    db: Session, user: User, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    write_rows = usage_buffer._write_rows
+    attempts: list[int] = []
+
+    def flaky(rows: list[dict[str, Any]]) -> int:
+        attempts.append(len(rows))
+        if len(attempts) == 1:
+            raise ConnectionError("database went away")
+        return write_rows(rows)
+
+    monkeypatch.setattr(usage_buffer, "_write_rows", flaky)
+
+    async def run() -> list[int]:
+        buffer = _buffer(tmp_path)
+        await buffer.start()
+        for _ in range(3):
+            buffer.add(_usage(user))
+        written = [await buffer.flush(), _spilled(tmp_path)]
+        written += [await buffer.flush(), _spilled(tmp_path)]
+        await buffer.close()
+        return written
+
+    # the failed batch stays in the spill file and is written on the next flush
+    assert asyncio.run(run()) == [0, 3, 3, 0]
+    assert attempts == [3, 3]
+    assert _counts(db, user) == (3, 3)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_orphan_spill_adopted_only_when_unlocked(
+    db: Session, user: User, tmp_path: Path
+) -> None:
+    async def record(count: int) -> None:
+        # leave the spill file behind as if the process had died
+        buffer = _buffer(tmp_path)
+        await buffer.start()
+        for _ in range(count):
+            buffer.add(_usage(user))
+        await buffer._on_writer(buffer._sync)
+        assert buffer._spill
+        buffer._spill.close()
+
+    asyncio.run(record(2))
+    orphan = next(tmp_path.glob("usage-*.jsonl"))
+    held = orphan.with_name("usage-1.jsonl")
+    orphan.rename(held)
+
+    with open(held) as f:
+        # a live process still holds the file
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        assert asyncio.run(_recover(tmp_path)) == 0
+        assert held.exists()
+    assert asyncio.run(_recover(tmp_path)) == 2
+    assert not held.exists()
+    assert _counts(db, user) == (2, 2)
+
+
+@pytest.mark.parametrize("stage", ["before_commit", "after_commit"])
+def test_killed_mid_flush_is_neither_lost_nor_double_counted(
+    db: Session, user: User, tmp_path: Path, stage: str
+) -> None:
+    worker = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            CRASHING_WORKER,
+            str(tmp_path),
+            str(user.id),
+            stage,
+            "5",
+        ],
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        capture_output=True,
+    )
+    assert worker.returncode == -9, worker.stderr.decode()
+    assert _spilled(tmp_path) == 5
+    assert _counts(db, user) == ((5, 5) if stage == "after_commit" else (0, 0))
+
+    # rows committed before the crash are skipped by ON CONFLICT (id, executed_at)
+    assert asyncio.run(_recover(tmp_path)) == (0 if stage == "after_commit" else 5)
+    assert _counts(db, user) == (5, 5)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_restart_on_a_new_event_loop_keeps_flushing(
+    db: Session, user: User, tmp_path: Path
+) -> None:
+    buffer = UsageBuffer(str(tmp_path), flush_size=2, flush_interval=3600)
+
+    async def run() -> None:
+        await buffer.start()
+        await asyncio.sleep(0.01)  # let the flush loop block on its wakeup event
+        # the flush loop is woken by the size threshold, not the interval
+        buffer.add(_usage(user))
+        buffer.add(_usage(user))
+        for _ in range(100):
+            if not buffer._pending and not _spilled(tmp_path):
+                break
+            await asyncio.sleep(0.02)
+        assert _spilled(tmp_path) == 0
+        await buffer.close()
+
+    asyncio.run(run())
+    asyncio.run(run())
+    assert _counts(db, user) == (4, 4)
+
+
+def test_spill_io_runs_off_the_event_loop(
+    db: Session, user: User, tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    fsync = os.fsync
+    threads: list[str] = []
+
+    def record_fsync(fd: int) -> None:
+        threads.append(threading.current_thread().name)
+        fsync(fd)
+
+    monkeypatch.setattr(usage_buffer.os, "fsync", record_fsync)
+
+    async def run() -> int:
+        buffer = UsageBuffer(
+            str(tmp_path), flush_size=10**6, flush_interval=3600, spill_fsync_interval=0
+        )
+        await buffer.start()
+        buffer.add(_usage(user))
+        await buffer._on_writer(lambda: None)
+        spilled = _spilled(tmp_path)
+        await buffer.close()
+        return spilled
+
+    # add() returns before the row is on disk, the writer thread spills and syncs it
+    assert asyncio.run(run()) == 1
+    assert threads and all(name.startswith("usage-spill") for name in threads)
+    assert _counts(db, user) == (1, 1)
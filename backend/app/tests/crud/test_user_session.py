@@ -0,0 +1,175 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Generator
+from datetime import datetime, timedelta, timezone
+from typing import TypeVar
+
+import pytest
+from sqlmodel import Session, delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app import crud_user_session
+from app.core.db import async_engine
+from app.models import SessionStatus, User, UserSession, UserSessionCreate
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import random_lower_string
+
+T = TypeVar("T")
+
+
+@pytest.fixture
+def user(db: Session) -> Generator[User, None, None]:
+    user = create_random_user(db)
+    yield user
+    db.exec(delete(UserSession).where(UserSession.user_id == user.id))  # type: ignore[call-overload]
+    db.commit()
+
+
+def _run(fn: Callable[[AsyncSession], Awaitable[T]]) -> T:
+    async def main() -> T:
+        try:
+            async with AsyncSession(async_engine, expire_on_commit=False) as session:
+                return await fn(session)
+        finally:
+            # pooled connections belong to this event loop
+            await async_engine.dispose()
+
+    return asyncio.run(main())
+
+
+async def _create(session: AsyncSession, user: User, **fields: object) -> UserSession:
+    return await crud_user_session.create_user_session(
+        session=session,
+        session_create=UserSessionCreate.model_validate(
+            {"session_id": random_lower_string(), "user_id": user.id, **fields}
+        ),
+    )
+
+
+def test_session_lifecycle(user: User) -> None:
+    async def run(session: AsyncSession) -> None:
+        created = await _create(session, user)
+        session_id = created.session_id
+        found = await crud_user_session.get_user_session(
+            session=session, session_id=session_id, user_id=user.id
+        )
+        assert found and found.id == created.id
+        assert (
+            await crud_user_session.count_active_sessions(
+                session=session, user_id=user.id
+            )
+            == 1
+        )
+
+        # only the first change away from STARTED reports a running box
+        moved = [
+            await crud_user_session.deactivate_user_session(
+                session=session,
+                session_id=session_id,
+                user_id=user.id,
+                status=status,
+            )
+            for status in (SessionStatus.HIBERNATED, SessionStatus.DESTROYED)
+        ]
+        assert moved == [True, False]
+        await session.refresh(created)
+        assert created.status == SessionStatus.DESTROYED
+        assert (
+            await crud_user_session.count_active_sessions(
+                session=session, user_id=user.id
+            )
+            == 0
+        )
+
+        expires_at = datetime.now(timezone.utc) + timedelta(hours=1)
+        await crud_user_session.renew_user_session(
+            session=session, session_id=session_id, expires_at=expires_at
+        )
+        await crud_user_session.set_user_session_node(
+            session=session, session_id=session_id, node="b"
+        )
+        await session.refresh(created)
+        assert created.status == SessionStatus.STARTED
+        assert created.expires_at == expires_at.replace(tzinfo=None)
+        assert created.node == "b"
+
+    _run(run)
+
+
+def test_deactivate_other_users_session_is_a_no_op(user: User, db: Session) -> None:
+    other = create_random_user(db)
+
+    async def run(session: AsyncSession) -> bool:
+        created = await _create(session, user)
+        moved = await crud_user_session.deactivate_user_session(
+            session=session, session_id=created.session_id, user_id=other.id
+        )
+        await session.refresh(created)
+        assert created.status == SessionStatus.STARTED
+        return moved
+
+    assert _run(run) is False
+
+
+def test_stop_expired_and_orphaned_sessions(user: User) -> None:
+    now = datetime.now(timezone.utc)
+
+    async def run(session: AsyncSession) -> list[SessionStatus]:
+        rows = [
+            await _create(session, user, expires_at=now - timedelta(minutes=1)),
+            await _create(session, user, expires_at=now + timedelta(hours=1)),
+            await _create(session, user),
+            await _create(session, user),
+        ]
+        # like the background jobs, run the updates without objects in the session
+        session.expunge_all()
+        assert (
+            await crud_user_session.stop_expired_sessions(session=session, now=now) == 1
+        )
+        # rows[3] is still alive on a node, rows[1] and rows[2] are gone
+        stopped = await crud_user_session.stop_orphaned_sessions(
+            session=session,
+            live={rows[3].session_id},
+            created_before=now + timedelta(minutes=1),
+            batch=1,
+        )
+        assert stopped == 2
+        statuses = []
+        for row in rows:
+            found = await crud_user_session.get_user_session(
+                session=session, session_id=row.session_id, user_id=user.id
+            )
+            assert found
+            statuses.append(found.status)
+        return statuses
+
+    assert _run(run) == [
+        SessionStatus.STOPPED,
+        SessionStatus.STOPPED,
+        SessionStatus.STOPPED,
+        SessionStatus.STARTED,
+    ]
+
+
+def test_get_user_sessions_keyset_pages(user: User) -> None:
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    async def run(session: AsyncSession) -> list[list[str]]:
+        for minute in range(5):
+            await _create(
+                session,
+                user,
+                session_id=f"page-{minute}-{random_lower_string()}",
+                created_at=start + timedelta(minutes=minute),
+            )
+        pages: list[list[str]] = []
+        after = None
+        while True:
+            page = await crud_user_session.get_user_sessions(
+                session=session, user_id=user.id, limit=2, after=after
+            )
+            if not page:
+                return pages
+            pages.append([s.session_id.split("-")[1] for s in page])
+            after = (page[-1].created_at, page[-1].id)
+
+    assert _run(run) == [["4", "3"], ["2", "1"], ["0"]]
@@ -0,0 +1,51 @@
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from app.services.boxed_manager import CheckpointPolicy, _stale_checkpoints
+
+
+def _proc(**kwargs: object) -> SimpleNamespace:
+    state = {
+        "dirty": True,
+        "is_running": True,
+        "execs_since_checkpoint": 0,
+        "checkpointed_at": 0.0,
+        "started_at": time.monotonic(),
+    }
+    return SimpleNamespace(**{**state, **kwargs})
+
+
+def test_checkpoint_due_by_execs_or_interval() -> None:
+    policy = CheckpointPolicy(interval=60, every_execs=5)
+    assert policy.enabled
+    assert not policy.due(_proc())  # type: ignore[arg-type]
+    assert policy.due(_proc(execs_since_checkpoint=5))  # type: ignore[arg-type]
+    assert policy.due(_proc(started_at=time.monotonic() - 61))  # type: ignore[arg-type]
+    recent = _proc(started_at=0.0, checkpointed_at=time.monotonic())
+    assert not policy.due(recent)  # type: ignore[arg-type]
+
+
+def test_checkpoint_not_due_when_clean_or_stopped() -> None:
+    policy = CheckpointPolicy(interval=0, every_execs=1)
+    assert not policy.due(_proc(dirty=False, execs_since_checkpoint=3))  # type: ignore[arg-type]
+    assert not policy.due(_proc(is_running=False, execs_since_checkpoint=3))  # type: ignore[arg-type]
+    assert not CheckpointPolicy(interval=0, every_execs=0).enabled
+
+
+def test_checkpoint_keep_must_be_positive() -> None:
+    with pytest.raises(ValueError):
+        CheckpointPolicy(keep=0)
+
+
+def test_stale_checkpoints_keeps_newest(tmp_path: Path) -> None:
+    names = [str(time.time_ns() + i) for i in range(4)]
+    for name in names:
+        (tmp_path / name).mkdir()
+    (tmp_path / "stray.txt").write_text("")
+    assert _stale_checkpoints(tmp_path, 3) == [tmp_path / names[0]]
+    assert _stale_checkpoints(tmp_path, 1) == [tmp_path / n for n in names[:3]]
+    assert _stale_checkpoints(tmp_path, 5) == []
+    assert _stale_checkpoints(tmp_path / "missing", 1) == []
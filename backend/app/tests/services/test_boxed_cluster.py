@@ -0,0 +1,235 @@
+import asyncio
+import base64
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from app.services import boxed_cluster, boxed_manager
+from app.services.boxed_cgroup import BoxLimits
+from app.services.boxed_cluster import BoxedCluster, parse_nodes
+from app.services.boxed_host import BoxedHost
+from app.services.boxed_manager import BoxedManager
+from app.services.boxed_process import ExecResult
+
+GB = 1024 * 1024 * 1024
+
+
+class FakeNode:
+    def __init__(self, name: str, memory_available: int) -> None:
+        self.name = name
+        self.memory_available = memory_available
+        self.running: set[str] = set()
+        self.outgoing: dict[str, bytes] = {}
+        self.incoming: dict[str, bytearray] = {}
+        self.fail_import = False
+
+    async def create_session(
+        self, limits: BoxLimits | None = None, ttl: float | None = None
+    ) -> str:
+        box_id = f"{self.name}-{len(self.running)}"
+        self.running.add(box_id)
+        return box_id
+
+    async def exec_code(
+        self,
+        box_id: str,
+        code: str,
+        tenant: str | None = None,
+        weight: float = 1.0,
+    ) -> ExecResult:
+        if box_id not in self.running:
+            raise KeyError(box_id)
+        return ExecResult(stdout=self.name, stderr="")
+
+    async def destroy(self, box_id: str) -> None:
+        self.running.discard(box_id)
+
+    async def stats(self) -> dict[str, Any]:
+        return {
+            "boxes": len(self.running),
+            "max_boxes": 0,
+            "memory_available": self.memory_available,
+            "cpu_count": 4,
+            "cpu_committed": 0.0,
+            "load": 0.0,
+        }
+
+    async def has_box(self, box_id: str) -> bool:
+        return box_id in self.running
+
+    async def boxes(self, include_hibernated: bool = False) -> list[str]:
+        return sorted(self.running)
+
+    async def export_box(self, box_id: str) -> dict[str, Any]:
+        self.running.remove(box_id)
+        self.outgoing[box_id] = box_id.encode() * 100
+        return {
+            "snapshot_id": "snap",
+            "size": len(self.outgoing[box_id]),
+            "limits": None,
+        }
+
+    async def read_export(self, box_id: str, offset: int, size: int) -> str:
+        return base64.b64encode(self.outgoing[box_id][offset : offset + size]).decode()
+
+    async def finish_export(self, box_id: str, moved: bool) -> None:
+        self.outgoing.pop(box_id)
+        if not moved:
+            self.running.add(box_id)
+
+    async def begin_import(self, box_id: str) -> None:
+        self.incoming[box_id] = bytearray()
+
+    async def write_import(self, box_id: str, offset: int, data: str) -> int:
+        assert offset == len(self.incoming[box_id])
+        self.incoming[box_id] += base64.b64decode(data)
+        return len(self.incoming[box_id])
+
+    async def finish_import(
+        self,
+        box_id: str,
+        snapshot_id: str,
+        limits: BoxLimits | None = None,
+        expires_at: float | None = None,
+    ) -> None:
+        if self.fail_import:
+            raise RuntimeError("restore failed")
+        assert bytes(self.incoming.pop(box_id)) == box_id.encode() * 100
+        self.running.add(box_id)
+
+    async def abort_import(self, box_id: str) -> None:
+        self.incoming.pop(box_id, None)
+
+
+def test_parse_nodes() -> None:
+    assert parse_nodes("a=unix:/run/a.sock, b=tcp://10.0.0.2:7700") == {
+        "a": "unix:/run/a.sock",
+        "b": "tcp://10.0.0.2:7700",
+    }
+    with pytest.raises(ValueError):
+        parse_nodes("a")
+
+
+def test_cluster_places_by_capacity_and_routes(tmp_path: Path) -> None:
+    async def run() -> None:
+        fakes = {"small": FakeNode("small", 1 * GB), "big": FakeNode("big", 3 * GB)}
+        hosts = []
+        for name, fake in fakes.items():
+            host = BoxedHost(fake, str(tmp_path / f"{name}.sock"))  # type: ignore[arg-type]
+            await host.start()
+            hosts.append(host)
+        cluster = await BoxedCluster(
+            {name: f"unix:{tmp_path / name}.sock" for name in fakes},
+            refresh_interval=60,
+        ).init()
+        try:
+            limits = BoxLimits(memory_max=1 * GB)
+            placed = [await cluster.create_session(limits) for _ in range(4)]
+            # big has room for three, small for one
+            assert sorted(cluster.node_of(b) for b in placed) == [
+                "big",
+                "big",
+                "big",
+                "small",
+            ]
+            with pytest.raises(RuntimeError):
+                await cluster.create_session(limits)
+
+            box_id = placed[-1]
+            node = cluster.node_of(box_id)
+            assert (await cluster.exec_code(box_id, "x")).stdout == node
+
+            # a fresh cluster without the routing table finds the box by asking
+            other = await BoxedCluster(
+                {name: f"unix:{tmp_path / name}.sock" for name in fakes},
+                refresh_interval=60,
+            ).init()
+            try:
+                assert (await other.exec_code(box_id, "x")).stdout == node
+                assert other.node_of(box_id) == node
+                with pytest.raises(KeyError):
+                    await other.exec_code("missing", "x")
+            finally:
+                await other.close()
+
+            await cluster.destroy(box_id)
+            assert cluster.node_of(box_id) is None
+        finally:
+            await cluster.close()
+            for host in hosts:
+                await host.close()
+
+    asyncio.run(run())
+
+
+def test_cluster_migrates_box(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(boxed_cluster, "MIGRATE_CHUNK", 64)
+
+    async def run() -> None:
+        fakes = {"a": FakeNode("a", 3 * GB), "b": FakeNode("b", 1 * GB)}
+        hosts = []
+        for name, fake in fakes.items():
+            host = BoxedHost(fake, str(tmp_path / f"{name}.sock"))  # type: ignore[arg-type]
+            await host.start()
+            hosts.append(host)
+        nodes = {name: f"unix:{tmp_path / name}.sock" for name in fakes}
+        cluster = await BoxedCluster(nodes, refresh_interval=60).init()
+        other = await BoxedCluster(nodes, refresh_interval=60).init()
+        try:
+            box_id = await cluster.create_session()
+            assert cluster.node_of(box_id) == "a"
+            assert (await other.exec_code(box_id, "x")).stdout == "a"
+
+            moved = await cluster.migrate_box(box_id)
+            assert moved["source"] == "a" and moved["target"] == "b"
+            assert moved["bytes"] == len(box_id) * 100
+            assert moved["pause_seconds"] >= 0
+            assert cluster.node_of(box_id) == "b"
+            assert box_id in fakes["b"].running and box_id not in fakes["a"].running
+            # a worker with a stale routing table finds the box on its new node
+            assert (await other.exec_code(box_id, "x")).stdout == "b"
+
+            with pytest.raises(ValueError):
+                await cluster.migrate_box(box_id, "b")
+
+            # a failed import leaves the box running where it was
+            fakes["a"].fail_import = True
+            with pytest.raises(RuntimeError):
+                await cluster.migrate_box(box_id, "a")
+            assert cluster.node_of(box_id) == "b"
+            assert box_id in fakes["b"].running
+            assert not fakes["a"].incoming
+        finally:
+            await other.close()
+            await cluster.close()
+            for host in hosts:
+                await host.close()
+
+    asyncio.run(run())
+
+
+def test_begin_import_reserves_the_box_before_touching_disk(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(boxed_manager, "SANDBOX_PREFIX", f"{tmp_path}/sandbox_")
+    monkeypatch.setattr(boxed_manager, "MIGRATE_DIR", str(tmp_path / "migrate"))
+    (tmp_path / "sandbox_taken").mkdir()
+
+    async def run() -> None:
+        manager = BoxedManager()
+        # the second call is rejected while the first is still in the executor
+        results = await asyncio.gather(
+            manager.begin_import("new"),
+            manager.begin_import("new"),
+            return_exceptions=True,
+        )
+        assert results[0] is None and isinstance(results[1], ValueError)
+        assert (tmp_path / "migrate" / "new.in.tar").read_bytes() == b""
+
+        # a box already on disk is refused and does not stay reserved
+        with pytest.raises(ValueError):
+            await manager.begin_import("taken")
+        assert "taken" not in manager._imports
+
+    asyncio.run(run())
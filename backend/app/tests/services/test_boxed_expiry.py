@@ -0,0 +1,60 @@
+import asyncio
+import time
+
+from app.services.boxed_manager import BoxedManager
+
+
+def test_expiry_fires_in_deadline_order_and_honours_changes() -> None:
+    async def run() -> None:
+        manager = BoxedManager()
+        expired: list[str] = []
+
+        async def expire(box_id: str) -> None:
+            expired.append(box_id)
+
+        manager._expire = expire  # type: ignore[method-assign]
+        manager._expiry_task = asyncio.create_task(manager._expiry_loop())
+        try:
+            now = time.time()
+            manager.set_expiry("late", now + 0.15)
+            manager.set_expiry("early", now + 0.05)
+            manager.set_expiry("cancelled", now + 0.02)
+            manager.set_expiry("cancelled", None)
+            manager.set_expiry("extended", now + 0.03)
+            manager.set_expiry("extended", now + 0.1)
+            await asyncio.sleep(0.3)
+        finally:
+            manager._expiry_task.cancel()
+
+        assert expired == ["early", "extended", "late"]
+        assert manager.expires_at("late") is None
+
+    asyncio.run(run())
+
+
+def test_expiry_loop_survives_a_second_event_loop() -> None:
+    manager = BoxedManager()
+    expired: list[str] = []
+
+    async def expire(box_id: str) -> None:
+        expired.append(box_id)
+
+    manager._expire = expire  # type: ignore[method-assign]
+
+    async def run(box_id: str) -> None:
+        # what init() does on every start, e.g. a second lifespan in tests
+        manager._bind_loop()
+        manager._expiry_task = asyncio.create_task(manager._expiry_loop())
+        try:
+            await asyncio.sleep(0.01)  # the loop is now waiting on the wakeup event
+            manager.set_expiry(box_id, time.time() + 0.02)
+            await asyncio.sleep(0.1)
+            assert not manager._expiry_task.done()
+            async with manager._checkpoint_slots:
+                pass
+        finally:
+            manager._expiry_task.cancel()
+
+    asyncio.run(run("first"))
+    asyncio.run(run("second"))
+    assert expired == ["first", "second"]
@@ -0,0 +1,111 @@
+import asyncio
+import os
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from app.services import boxed_gc
+from app.services.boxed_gc import BoxedGC
+from app.services.boxed_manager import BoxedManager
+from app.services.boxed_registry import BoxedRegistry, BoxMeta
+
+
+class RecordingReaper:
+    """Moves submitted paths out of the way, like the real reaper's trash step."""
+
+    def __init__(self, trash: Path) -> None:
+        self.trash = trash
+        self.submitted: list[Path] = []
+
+    def submit(self, proc: Any, paths: list[Path]) -> None:
+        for path in paths:
+            path.rename(self.trash / f"{len(self.submitted)}")
+            self.submitted.append(path)
+
+
+def _old(path: Path) -> Path:
+    os.utime(path, (0, 0))
+    return path
+
+
+def test_gc_reclaims_only_old_unknown_entries(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(boxed_gc, "SANDBOX_PREFIX", f"{tmp_path}/sandbox_")
+    snapshots, migrate = tmp_path / "snapshots", tmp_path / ".migrate"
+    for d in ("sandbox_known", "sandbox_orphan", "sandbox_fresh", "shared_libs"):
+        (tmp_path / d / "work").mkdir(parents=True)
+    (tmp_path / "sandbox_orphan" / "work" / "data").write_bytes(b"x" * 8192)
+    (snapshots / "gone" / "snap").mkdir(parents=True)
+    migrate.mkdir()
+    (migrate / "gone.out.tar").write_bytes(b"x" * 4096)
+    for path in (
+        tmp_path / "sandbox_known",
+        tmp_path / "sandbox_orphan",
+        tmp_path / "shared_libs",
+        snapshots / "gone",
+        migrate / "gone.out.tar",
+    ):
+        _old(path)
+
+    trash = tmp_path.parent / f"{tmp_path.name}-trash"
+    trash.mkdir()
+    reaper = RecordingReaper(trash)
+    gc = BoxedGC(
+        lambda box_id: box_id == "known",
+        reaper,  # type: ignore[arg-type]
+        str(snapshots),
+        str(migrate),
+        batch=2,
+    )
+
+    async def run() -> None:
+        # small batches: a full pass over the root takes several cycles
+        for _ in range(6):
+            await gc.collect()
+
+    asyncio.run(run())
+    assert sorted(p.relative_to(tmp_path) for p in reaper.submitted) == [
+        Path(".migrate/gone.out.tar"),
+        Path("sandbox_orphan"),
+        Path("snapshots/gone"),
+    ]
+    assert gc.reclaimed_entries == 3
+    assert gc.reclaimed_bytes >= 8192 + 4096
+
+
+def test_gc_keeps_boxes_known_only_from_registry(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(boxed_gc, "SANDBOX_PREFIX", f"{tmp_path}/sandbox_")
+    snapshots, migrate = tmp_path / "snapshots", tmp_path / ".migrate"
+    migrate.mkdir()
+    for path in (tmp_path / "sandbox_hib", snapshots / "hib" / "snap"):
+        path.mkdir(parents=True)
+    for path in (tmp_path / "sandbox_hib", snapshots / "hib"):
+        _old(path)
+    trash = tmp_path.parent / f"{tmp_path.name}-trash"
+    trash.mkdir()
+    reaper = RecordingReaper(trash)
+
+    async def run() -> list[Path]:
+        # a hibernated box has no process, only its registry entry after a restart
+        manager = BoxedManager()
+        manager._registry = BoxedRegistry(str(tmp_path / ".registry"))
+        manager._registry.save(
+            BoxMeta("hib", "hibernated", checkpoint=str(snapshots / "hib" / "snap"))
+        )
+        await manager._reconcile()
+        gc = BoxedGC(manager.owns, reaper, str(snapshots), str(migrate))  # type: ignore[arg-type]
+        await gc.collect()
+        kept = list(reaper.submitted)
+        manager._forget("hib")
+        await gc.collect()
+        return kept
+
+    assert asyncio.run(run()) == []
+    assert sorted(p.relative_to(tmp_path) for p in reaper.submitted) == [
+        Path("sandbox_hib"),
+        Path("snapshots/hib"),
+    ]
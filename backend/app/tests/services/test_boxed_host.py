@@ -0,0 +1,109 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from app.services.boxed_cgroup import BoxLimits
+from app.services.boxed_client import BoxedClient
+from app.services.boxed_host import BoxedHost
+from app.services.boxed_process import ExecResult
+from app.services.boxed_rpc import RpcConnectionError
+
+
+class FakeService:
+    def __init__(self) -> None:
+        self.limits: BoxLimits | None = None
+        self.ttl: float | None = None
+
+    async def create_session(
+        self, limits: BoxLimits | None = None, ttl: float | None = None
+    ) -> str:
+        self.limits = limits
+        self.ttl = ttl
+        return "box1"
+
+    async def exec_code(
+        self,
+        box_id: str,
+        code: str,
+        tenant: str | None = None,
+        weight: float = 1.0,
+    ) -> ExecResult:
+        if box_id != "box1":
+            raise KeyError(box_id)
+        await asyncio.sleep(0.05 if code == "slow" else 0)
+        return ExecResult(stdout=code, stderr="", wall_seconds=0.1)
+
+    async def destroy(self, box_id: str) -> None:
+        raise RuntimeError("busy")
+
+
+def test_client_calls_host_over_socket(tmp_path: Path) -> None:
+    async def run() -> None:
+        service = FakeService()
+        host = BoxedHost(service, str(tmp_path / "boxed.sock"))  # type: ignore[arg-type]
+        await host.start()
+        client = await BoxedClient(str(tmp_path / "boxed.sock")).init()
+        try:
+            limits = BoxLimits(memory_max=1024, cpu_max=0.5)
+            assert await client.create_session(limits, ttl=60) == "box1"
+            assert service.limits == limits
+            assert service.ttl == 60
+
+            # concurrent requests share one connection, responses matched by id
+            slow, fast = await asyncio.gather(
+                client.exec_code("box1", "slow"), client.exec_code("box1", "fast")
+            )
+            assert (slow.stdout, fast.stdout) == ("slow", "fast")
+            assert isinstance(fast, ExecResult)
+
+            with pytest.raises(KeyError):
+                await client.exec_code("nope", "x")
+            with pytest.raises(RuntimeError, match="busy"):
+                await client.destroy("box1")
+        finally:
+            await client.close()
+            await host.close()
+
+        with pytest.raises(RpcConnectionError):
+            await client.exec_code("box1", "x")
+
+    asyncio.run(run())
+
+
+def test_tcp_listener_requires_token(tmp_path: Path) -> None:
+    async def run() -> None:
+        service = FakeService()
+        host = BoxedHost(
+            service,  # type: ignore[arg-type]
+            str(tmp_path / "boxed.sock"),
+            listen="127.0.0.1:0",
+            token=None,
+        )
+        with pytest.raises(RuntimeError, match="BOXED_HOST_TOKEN"):
+            await host.start()
+        assert host._tcp_server is None
+        assert not (tmp_path / "boxed.sock").exists()
+
+        host = BoxedHost(
+            service,  # type: ignore[arg-type]
+            str(tmp_path / "boxed.sock"),
+            listen="127.0.0.1:0",
+            token="secret",
+        )
+        await host.start()
+        assert host._tcp_server
+        port = host._tcp_server.sockets[0].getsockname()[1]
+        address = f"tcp://127.0.0.1:{port}"
+        client = await BoxedClient(address, token="secret").init()
+        intruder = await BoxedClient(address, token="wrong").init()
+        try:
+            assert await client.create_session() == "box1"
+            with pytest.raises(RuntimeError, match="Unauthorized"):
+                await intruder.create_session()
+        finally:
+            await client.close()
+            await intruder.close()
+            await host.close()
+
+    asyncio.run(run())
@@ -0,0 +1,107 @@
+import asyncio
+import threading
+from pathlib import Path
+
+import pytest
+
+from app.services import boxed_process
+from app.services.boxed_process import _OutputCapture
+
+MARKER = b"__COMPLETE_abc__"
+
+
+def test_small_output_stays_inline(tmp_path: Path) -> None:
+    out = _OutputCapture(tmp_path / "out", limit=64)
+    out.write(b"hello\n")
+    out.write(MARKER + b"\n")
+    out.cut(MARKER)
+    out.close()
+    assert out.text() == "hello"
+    assert not out.spilled
+    assert not (tmp_path / "out").exists()
+
+
+def test_large_output_spills_with_preview(tmp_path: Path) -> None:
+    path = tmp_path / "out"
+    out = _OutputCapture(path, limit=10)
+    payload = b"".join(b"line %03d\n" % i for i in range(100))
+    for i in range(0, len(payload), 7):
+        out.write(payload[i : i + 7])
+    out.write(b"\n" + MARKER + b"\n")
+    out.cut(MARKER)
+    out.close()
+    assert out.spilled
+    assert out.text() == payload[:10].decode()
+    assert path.read_bytes() == payload + b"\n"
+    assert out.total == len(payload) + 1
+
+
+def test_marker_brings_output_back_under_limit(tmp_path: Path) -> None:
+    path = tmp_path / "out"
+    out = _OutputCapture(path, limit=8)
+    out.write(b"abc\n" + MARKER + b"\n")
+    out.cut(MARKER)
+    out.close()
+    assert not out.spilled
+    assert out.text() == "abc"
+    assert not path.exists()
+
+
+def test_marker_split_across_reads_and_multibyte_preview(tmp_path: Path) -> None:
+    out = _OutputCapture(tmp_path / "out", limit=5)
+    out.write("abcd€".encode())  # the euro sign straddles the preview limit
+    out.write(b"x" * 10000 + b"\n" + MARKER[:6])
+    out.write(MARKER[6:] + b"\n")
+    out.cut(MARKER)
+    out.close()
+    assert out.spilled
+    assert out.text() == "abcd"
+    assert (tmp_path / "out").read_bytes() == "abcd€".encode() + b"x" * 10000 + b"\n"
+
+
+def test_spill_file_io_runs_off_the_loop(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    threads: set[int] = set()
+    append = _OutputCapture._append
+
+    def record(self: _OutputCapture, data: bytes) -> None:
+        threads.add(threading.get_ident())
+        append(self, data)
+
+    monkeypatch.setattr(_OutputCapture, "_append", record)
+    monkeypatch.setattr(boxed_process, "OUTPUT_SPILL_BACKLOG", 16)
+    path = tmp_path / "out"
+
+    async def run() -> _OutputCapture:
+        out = _OutputCapture(path, limit=10)
+        for i in range(100):
+            out.write(b"line %03d\n" % i)
+            await out.drain()
+        out.write(MARKER + b"\n")
+        out.cut(MARKER)
+        await out.aclose()
+        return out
+
+    out = asyncio.run(run())
+    assert threads and threading.get_ident() not in threads
+    assert path.read_bytes() == b"".join(b"line %03d\n" % i for i in range(100))
+    assert out.spilled and out.text() == "line 000\nl"
+
+
+def test_spill_write_error_becomes_a_note(tmp_path: Path) -> None:
+    (tmp_path / "file").write_text("")
+
+    async def run() -> _OutputCapture:
+        # the spill directory cannot be created under a regular file
+        out = _OutputCapture(tmp_path / "file" / "out", limit=4)
+        out.write(b"too much output\n")
+        out._backlog = boxed_process.OUTPUT_SPILL_BACKLOG + 1
+        with pytest.raises(OSError):
+            await out.drain()
+        await out.aclose()
+        return out
+
+    out = asyncio.run(run())
+    assert out.text().startswith("too ")
+    assert "[Output spill error:" in out.text()
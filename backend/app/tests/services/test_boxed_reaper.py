@@ -0,0 +1,87 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+
+from app.services import boxed_reaper
+from app.services.boxed_reaper import BoxedReaper
+
+
+@pytest.fixture
+def trash(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    trash = tmp_path / ".trash"
+    monkeypatch.setattr(boxed_reaper, "TRASH_DIR", str(trash))
+    return trash
+
+
+def _box(root: Path, name: str) -> Path:
+    box = root / name
+    (box / "work").mkdir(parents=True)
+    (box / "work" / "data.txt").write_text("x")
+    return box
+
+
+def test_reaper_moves_to_trash_and_removes(tmp_path: Path, trash: Path) -> None:
+    async def run() -> None:
+        reaper = BoxedReaper(workers=1, interval=0)
+        trash.mkdir()
+        (trash / "leftover").mkdir()
+        reaper.start()
+        box = _box(tmp_path, "box1")
+        archive = tmp_path / "box1.tar"
+        archive.write_bytes(b"tar")
+        reaper.submit(None, [box, archive, tmp_path / "missing"])
+        await reaper.close()
+        assert not box.exists() and not archive.exists()
+        assert list(trash.iterdir()) == []
+
+    asyncio.run(run())
+
+
+@pytest.mark.usefixtures("trash")
+def test_reaper_bounds_concurrent_teardowns(tmp_path: Path) -> None:
+    running = 0
+    peak = 0
+
+    class SlowProcess:
+        async def stop(self) -> None:
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+
+    async def run() -> None:
+        reaper = BoxedReaper(workers=2, interval=0)
+        reaper.start()
+        for i in range(6):
+            reaper.submit(SlowProcess(), [_box(tmp_path, f"box{i}")])  # type: ignore[arg-type]
+        await reaper.close()
+
+    asyncio.run(run())
+    assert peak == 2
+    assert not any(tmp_path.glob("box*"))
+
+
+def test_reaper_retries_failed_remove(
+    tmp_path: Path, trash: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    calls: list[Path] = []
+    remove = boxed_reaper._remove
+
+    def flaky_remove(path: Path) -> None:
+        calls.append(path)
+        if len(calls) > 1:
+            remove(path)
+
+    monkeypatch.setattr(boxed_reaper, "_remove", flaky_remove)
+
+    async def run() -> None:
+        reaper = BoxedReaper(workers=1, interval=0.001)
+        reaper.start()
+        reaper.submit(None, [_box(tmp_path, "box")])
+        await reaper.close()
+
+    asyncio.run(run())
+    assert len(calls) == 2
+    assert list(trash.iterdir()) == []
@@ -0,0 +1,56 @@
+import asyncio
+import os
+from pathlib import Path
+
+from app.services.boxed_manager import BoxedManager
+from app.services.boxed_registry import (
+    BoxedRegistry,
+    BoxMeta,
+    is_alive,
+    process_start_time,
+)
+
+
+def test_registry_roundtrip(tmp_path: Path) -> None:
+    registry = BoxedRegistry(str(tmp_path))
+    registry.save(
+        BoxMeta("a", "running", pid=1, checkpoint="/x", limits={"cpu_max": 1})
+    )
+    registry.save(BoxMeta("b", "hibernated"))
+    (tmp_path / "broken.json").write_text("{not json")
+
+    metas = {m.box_id: m for m in registry.load_all()}
+    assert set(metas) == {"a", "b"}
+    assert metas["a"].limits == {"cpu_max": 1}
+
+    registry.remove("a")
+    assert [m.box_id for m in registry.load_all()] == ["b"]
+
+
+def test_is_alive_checks_process_start_time() -> None:
+    pid = os.getpid()
+    start = process_start_time(pid)
+    assert start is not None
+    assert is_alive(BoxMeta("a", "running", pid=pid, pid_start=start))
+    # same pid, different process
+    assert not is_alive(BoxMeta("a", "running", pid=pid, pid_start=start + 1))
+    assert not is_alive(BoxMeta("a", "running"))
+
+
+def test_reconcile_reaps_unrecoverable_boxes(tmp_path: Path) -> None:
+    async def run() -> None:
+        manager = BoxedManager()
+        manager._registry = BoxedRegistry(str(tmp_path))
+        manager._registry.save(BoxMeta("idle", "idle"))
+        manager._registry.save(BoxMeta("lost", "running"))
+        manager._registry.save(BoxMeta("asleep", "hibernated", checkpoint="/snap"))
+
+        await manager._reconcile()
+
+        # nothing to restore from: both are torn down and forgotten
+        assert manager._reaper.pending == 2
+        assert [m.box_id for m in manager._registry.load_all()] == ["asleep"]
+        assert manager.assigned_boxes() == []
+        assert manager.assigned_boxes(include_hibernated=True) == ["asleep"]
+
+    asyncio.run(run())
@@ -0,0 +1,92 @@
+import asyncio
+from pathlib import Path
+
+from app.services.boxed_cgroup import BoxLimits
+from app.services.boxed_manager import BoxedManager, RestartPolicy
+from app.services.boxed_registry import BoxedRegistry
+
+
+class FakeProcess:
+    """Stands in for BoxedProcess: start() fails a given number of times."""
+
+    def __init__(self, failures: int, uptime: float = 0.0):
+        self.failures = failures
+        self.uptime = uptime
+        self.restarts = 0
+        self.running = False
+        self.pid = None
+        self.limits = BoxLimits()
+        self.events: list[tuple[str, str]] = []
+
+    @property
+    def is_running(self) -> bool:
+        return self.running
+
+    def record_event(self, kind: str, detail: str = "") -> None:
+        self.events.append((kind, detail))
+
+    async def start(self, restore_from: Path | None = None) -> None:
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("boom")
+        self.running = True
+
+
+def _crash(
+    proc: FakeProcess, policy: RestartPolicy, tmp_path: Path
+) -> tuple[FakeProcess, bool]:
+    async def run() -> bool:
+        manager = BoxedManager(restart_policy=policy)
+        manager._registry = BoxedRegistry(str(tmp_path))
+        manager.proc_registry["box"] = proc  # type: ignore[assignment]
+        manager._on_box_exit("box", 3)
+        recovering = manager.is_recovering("box")
+        for _ in range(100):
+            if not manager.is_recovering("box"):
+                break
+            await asyncio.sleep(0.01)
+        return recovering
+
+    return proc, asyncio.run(run())
+
+
+def _policy(**kwargs: float) -> RestartPolicy:
+    options = {"enabled": True, "backoff": 0.001, "from_checkpoint": False}
+    return RestartPolicy(**{**options, **kwargs})  # type: ignore[arg-type]
+
+
+def test_restart_backoff_is_exponential_and_capped() -> None:
+    policy = RestartPolicy(backoff=1, max_backoff=5)
+    assert [policy.delay(n) for n in range(1, 6)] == [1, 2, 4, 5, 5]
+
+
+def test_restart_retries_until_started(tmp_path: Path) -> None:
+    proc, recovering = _crash(FakeProcess(failures=2), _policy(max_retries=3), tmp_path)
+    assert recovering
+    assert proc.is_running and proc.restarts == 3
+    assert [kind for kind, _ in proc.events] == [
+        "exited",
+        "restart_failed",
+        "restart_failed",
+        "restarted",
+    ]
+    assert proc.events[0] == ("exited", "exit code 3")
+
+
+def test_restart_gives_up_after_max_retries(tmp_path: Path) -> None:
+    proc, _ = _crash(FakeProcess(failures=10), _policy(max_retries=2), tmp_path)
+    assert not proc.is_running and proc.restarts == 2
+    assert proc.events[-1] == ("failed", "gave up after 2 restarts")
+
+
+def test_restart_count_resets_after_stable_uptime(tmp_path: Path) -> None:
+    proc = FakeProcess(failures=0, uptime=600)
+    proc.restarts = 3
+    proc, _ = _crash(proc, _policy(max_retries=3, reset_after=300), tmp_path)
+    assert proc.is_running and proc.restarts == 1
+
+
+def test_restart_disabled_only_records_exit(tmp_path: Path) -> None:
+    proc, recovering = _crash(FakeProcess(failures=0), _policy(enabled=False), tmp_path)
+    assert not recovering and not proc.is_running
+    assert proc.events == [("exited", "exit code 3")]
@@ -0,0 +1,76 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+from app.services.boxed_process import BoxedProcess, ExecResult
+from app.services.boxed_registry import BoxedRegistry, BoxMeta
+from app.services.boxed_scheduler import FairScheduler
+from app.services.boxed_service import BoxedService
+
+# runs each line it is sent, the way the sandbox interpreter does for one-line cells
+CHILD = "import sys\nfor line in sys.stdin:\n    exec(line)\n"
+
+
+async def _box(service: BoxedService, box_id: str) -> BoxedProcess:
+    proc = BoxedProcess(box_id)
+    proc.process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-u",
+        "-c",
+        CHILD,
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    service.manager.proc_registry[box_id] = proc
+    return proc
+
+
+def test_flooded_box_does_not_hold_exec_slots(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    async def run() -> tuple[ExecResult, list[ExecResult], int]:
+        service = BoxedService(prewarm_count=0)
+        service.scheduler = FairScheduler(slots=2)
+        monkeypatch.setattr(service.manager, "maybe_checkpoint", lambda _: None)
+        boxes = [await _box(service, "flood"), await _box(service, "quiet")]
+        try:
+            cell = "import time; time.sleep(0.3)"
+            flood = [
+                asyncio.create_task(service.exec_code("flood", cell, tenant="batch"))
+                for _ in range(4)
+            ]
+            await asyncio.sleep(0.05)
+            # cells waiting for the flooded box must not occupy the second slot
+            peak = service.scheduler.running
+            quiet = await service.exec_code("quiet", "print(1)", tenant="user")
+            return quiet, await asyncio.gather(*flood), peak
+        finally:
+            for proc in boxes:
+                assert proc.process
+                proc.process.kill()
+                await proc.process.wait()
+                proc.process = None
+
+    quiet, flood, peak = asyncio.run(run())
+    assert peak == 1
+    assert quiet.stdout == "1"
+    assert quiet.queued_seconds < 0.1
+    assert all(r.wall_seconds >= 0.3 for r in flood)
+
+
+def test_has_box_sees_hibernated_boxes(tmp_path: Path) -> None:
+    async def run() -> list[bool]:
+        service = BoxedService(prewarm_count=0)
+        manager = service.manager
+        manager._registry = BoxedRegistry(str(tmp_path))
+        # after a host restart a hibernated box is known only from the registry
+        manager._registry.save(BoxMeta("hib", "hibernated", checkpoint=str(tmp_path)))
+        await manager._reconcile()
+        found = [await service.has_box("hib"), await service.has_box("other")]
+        manager._forget("hib")
+        return [*found, await service.has_box("hib")]
+
+    assert asyncio.run(run()) == [True, False, False]
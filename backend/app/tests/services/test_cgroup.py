@@ -0,0 +1,43 @@
+from pathlib import Path
+
+from app.services.boxed_cgroup import BoxCgroup, BoxLimits
+
+
+def _cgroup(tmp_path: Path) -> BoxCgroup:
+    cgroup = BoxCgroup("test")
+    cgroup.path = tmp_path / "box_test"
+    return cgroup
+
+
+def test_apply_writes_limits(tmp_path: Path) -> None:
+    cgroup = _cgroup(tmp_path)
+    cgroup.apply(BoxLimits(memory_max=256 * 1024 * 1024, cpu_max=0.5, pids_max=32))
+    assert (cgroup.path / "memory.max").read_text() == str(256 * 1024 * 1024)
+    assert (cgroup.path / "cpu.max").read_text() == "50000 100000"
+    assert (cgroup.path / "pids.max").read_text() == "32"
+
+    cgroup.apply(BoxLimits())
+    assert (cgroup.path / "memory.max").read_text() == "max"
+    assert (cgroup.path / "cpu.max").read_text() == "max 100000"
+
+
+def test_usage_parses_stat_files(tmp_path: Path) -> None:
+    cgroup = _cgroup(tmp_path)
+    cgroup.path.mkdir()
+    (cgroup.path / "memory.current").write_text("1024\n")
+    (cgroup.path / "memory.peak").write_text("4096\n")
+    (cgroup.path / "cpu.stat").write_text(
+        "usage_usec 1500\nuser_usec 1000\nsystem_usec 500\nnr_periods 0\n"
+    )
+    (cgroup.path / "io.stat").write_text(
+        "8:0 rbytes=100 wbytes=200 rios=1 wios=2\n8:16 rbytes=1 wbytes=2\n"
+    )
+    usage = cgroup.usage()
+    assert usage["memory_current"] == 1024
+    assert usage["memory_peak"] == 4096
+    assert usage["cpu_usage_usec"] == 1500
+    assert usage["cpu_user_usec"] == 1000
+    assert usage["cpu_system_usec"] == 500
+    assert usage["io_read_bytes"] == 101
+    assert usage["io_write_bytes"] == 202
+    assert "pids_current" not in usage
@@ -2,6 +2,7 @@ import uuid
 from unittest.mock import patch
 
 import pytest
+
 from app.services.boxed_service import BoxedService
 
 
@@ -0,0 +1,53 @@
+import asyncio
+
+from app.services.boxed_process import BoxedProcess
+from app.services.boxed_supervisor import ProcessSupervisor
+
+
+def test_supervisor_notifies_on_exit() -> None:
+    async def run() -> list[int]:
+        supervisor = ProcessSupervisor(poll_interval=0.05)
+        exited: list[int] = []
+        proc = await asyncio.create_subprocess_exec("sleep", "0.1")
+        supervisor.watch(proc.pid, exited.append)
+        await proc.wait()
+        for _ in range(50):
+            if exited:
+                break
+            await asyncio.sleep(0.05)
+        assert supervisor.watched == 0
+        return exited + [proc.pid]
+
+    exited = asyncio.run(run())
+    assert exited[0] == exited[-1]
+
+
+def test_supervisor_unwatch_suppresses_callback() -> None:
+    async def run() -> list[int]:
+        supervisor = ProcessSupervisor(poll_interval=0.05)
+        exited: list[int] = []
+        proc = await asyncio.create_subprocess_exec("sleep", "0.1")
+        supervisor.watch(proc.pid, exited.append)
+        supervisor.unwatch(proc.pid)
+        await proc.wait()
+        await asyncio.sleep(0.2)
+        return exited
+
+    assert asyncio.run(run()) == []
+
+
+def test_exit_code_reported_before_reap() -> None:
+    async def run() -> list[int | None]:
+        supervisor = ProcessSupervisor(poll_interval=0.05)
+        codes: list[int | None] = []
+        for script in ("exit 3", "kill -9 $$") * 5:
+            box = BoxedProcess("exit-test", on_exit=lambda _, code: codes.append(code))
+            box.process = await asyncio.create_subprocess_exec("sh", "-c", script)
+            supervisor.watch(box.process.pid, box._on_exit)
+            for _ in range(50):
+                if box.process is None:
+                    break
+                await asyncio.sleep(0.01)
+        return codes
+
+    assert asyncio.run(run()) == [3, -9] * 5
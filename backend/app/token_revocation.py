@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import Session, col, delete, select
+
+from app.core.config import settings
+from app.core.db import engine
+from app.models import TokenRevocation
+
+logger = logging.getLogger(__name__)
+
+
+class RevocationList:
+    """
+    携带身份声明的短期 token 在认证时不查库，用户被停用、改权限或删除后，
+    靠这份内存中的吊销表拒绝在此之前签发的 token。
+    吊销记录写入数据库，各进程定期拉取；超过 token 有效期的记录不再需要。
+    """
+
+    def __init__(
+        self,
+        ttl: float = settings.PRINCIPAL_TOKEN_EXPIRE_MINUTES * 60,
+        refresh_interval: float = settings.TOKEN_REVOCATION_REFRESH_SECONDS,
+    ):
+        self._ttl = ttl
+        self._refresh_interval = refresh_interval
+        self._revoked: dict[uuid.UUID, float] = {}
+        self._lock = threading.Lock()
+        self._task: asyncio.Task | None = None
+
+    def is_revoked(self, user_id: uuid.UUID, issued_at: float | None) -> bool:
+        revoked_at = self._revoked.get(user_id)
+        if revoked_at is None:
+            return False
+        return issued_at is None or issued_at <= revoked_at
+
+    def revoke(self, session: Session, user_id: uuid.UUID) -> None:
+        """吊销该用户此刻之前签发的 token，本进程立即生效，其它进程在下次刷新时生效"""
+        now = time.time()
+        with self._lock:
+            self._revoked[user_id] = now
+        # 列不带时区，统一存 UTC
+        revoked_at = datetime.fromtimestamp(now, timezone.utc).replace(tzinfo=None)
+        statement = insert(TokenRevocation).values(
+            user_id=user_id, revoked_at=revoked_at
+        )
+        session.execute(
+            statement.on_conflict_do_update(
+                index_elements=["user_id"], set_={"revoked_at": revoked_at}
+            )
+        )
+        session.commit()
+
+    def refresh(self) -> None:
+        cutoff = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(
+            seconds=self._ttl
+        )
+        with Session(engine) as session:
+            session.exec(
+                delete(TokenRevocation).where(col(TokenRevocation.revoked_at) < cutoff)
+            )
+            session.commit()
+            rows = session.exec(select(TokenRevocation)).all()
+        revoked = {r.user_id: _timestamp(r.revoked_at) for r in rows}
+        horizon = time.time() - self._ttl
+        with self._lock:
+            # 保留本进程刚吊销、可能还没被读到的记录
+            for user_id, at in self._revoked.items():
+                if at > horizon and at > revoked.get(user_id, 0):
+                    revoked[user_id] = at
+            self._revoked = revoked
+
+    async def start(self) -> None:
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.refresh)
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self._refresh_interval)
+            try:
+                await loop.run_in_executor(None, self.refresh)
+            except Exception as e:
+                logger.error("Token revocation refresh failed", exc_info=e)
+
+
+def _timestamp(dt: datetime) -> float:
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+revocation_list = RevocationList()
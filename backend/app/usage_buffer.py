@@ -0,0 +1,227 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Any, TextIO
+
+from sqlmodel import Session
+
+from app import crud_sandbox_usage
+from app.core.config import settings
+from app.core.db import engine
+from app.models import SandboxUsage, SandboxUsageCreate
+
+logger = logging.getLogger(__name__)
+
+
+class UsageBuffer:
+    """
+    用量记录的进程内缓冲，避免在执行请求中同步写库。
+    记录先追加到本进程的 spill 文件（崩溃后可恢复），再按数量或时间阈值批量写入数据库。
+    每条记录自带 id，重放时重复的行会被忽略。
+
+    spill 文件只由一个写线程读写，add() 不做文件 I/O，也不等待落盘。保证的范围：
+    - 写库前先等写线程把这批记录写进文件，写库失败或进程在写库中途被杀都能重放；
+    - 进程被杀时，只丢失刚 add()、还在写线程队列中的记录（通常不到 1 毫秒）；
+    - 写线程至多每 spill_fsync_interval 秒 fsync 一次，后台循环每轮也会 fsync，
+      机器掉电时最多丢失最近 max(spill_fsync_interval, flush_interval) 秒内的记录。
+    """
+
+    def __init__(
+        self,
+        spill_dir: str = settings.USAGE_SPILL_DIR,
+        flush_size: int = settings.USAGE_FLUSH_SIZE,
+        flush_interval: float = settings.USAGE_FLUSH_INTERVAL,
+        spill_fsync_interval: float = settings.USAGE_SPILL_FSYNC_INTERVAL,
+    ):
+        self._spill_dir = Path(spill_dir)
+        self._flush_size = flush_size
+        self._flush_interval = flush_interval
+        self._fsync_interval = spill_fsync_interval
+        self._pending: list[dict[str, Any]] = []
+        self._lock = threading.Lock()
+        # 以下三项只在写线程中访问
+        self._spill: TextIO | None = None
+        self._synced_at = 0.0
+        self._dirty = False
+        self._spill_path: Path | None = None
+        self._writer: ThreadPoolExecutor | None = None
+        self._wake = asyncio.Event()
+        self._flushing = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        # Event 和 Lock 绑定在首次等待它们的事件循环上，再次启动（如测试中多次 lifespan）时换新的
+        self._wake = asyncio.Event()
+        self._flushing = asyncio.Lock()
+        self._spill_path = self._spill_dir / f"usage-{os.getpid()}.jsonl"
+        self._writer = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="usage-spill"
+        )
+        await self._on_writer(self._open_spill)
+        self._task = asyncio.create_task(self._run())
+        if self._pending:
+            self._wake.set()
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+        if self._writer:
+            with self._lock:
+                empty = not self._pending
+            await self._on_writer(self._close_spill, empty)
+            self._writer.shutdown()
+            self._writer = None
+
+    def add(self, usage: SandboxUsageCreate) -> None:
+        """登记一条用量记录，交给写线程追加到 spill 文件，不访问数据库"""
+        row = SandboxUsage.model_validate(
+            usage, update={"cost_units": crud_sandbox_usage.cost_of(usage)}
+        ).model_dump()
+        with self._lock:
+            self._pending.append(row)
+            # 在锁内提交，写线程中的顺序与 _pending 一致
+            if self._writer:
+                self._writer.submit(self._append, row)
+            full = len(self._pending) >= self._flush_size
+        if full:
+            self._wake.set()
+
+    async def flush(self) -> int:
+        """把当前缓冲写入数据库，失败时保留在缓冲中等待下次重试"""
+        async with self._flushing:
+            if self._writer:
+                # 这批记录先落到 spill 文件，写库中途崩溃也能重放
+                await self._on_writer(self._sync)
+            with self._lock:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return 0
+            loop = asyncio.get_event_loop()
+            try:
+                written = await loop.run_in_executor(None, _write_rows, rows)
+            except Exception as e:
+                logger.error("Usage flush of %d rows failed", len(rows), exc_info=e)
+                with self._lock:
+                    self._pending[:0] = rows
+                return 0
+            if self._writer:
+                with self._lock:
+                    # 快照与提交都在锁内，之后 add 的记录排在重写之后追加
+                    rewrite = self._writer.submit(
+                        self._rewrite_spill, list(self._pending)
+                    )
+                await asyncio.wrap_future(rewrite)
+            return written
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def _on_writer(self, fn: Callable[..., None], *args: Any) -> None:
+        assert self._writer is not None
+        await asyncio.wrap_future(self._writer.submit(fn, *args))
+
+    # 以下在写线程中执行
+
+    def _open_spill(self) -> None:
+        assert self._spill_path is not None
+        self._spill_dir.mkdir(parents=True, exist_ok=True)
+        self._spill = open(self._spill_path, "a+")
+        # 持有锁表示文件属于存活进程，其它进程不会接管
+        fcntl.flock(self._spill.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        self._adopt_orphans()
+
+    def _close_spill(self, unlink: bool) -> None:
+        if not self._spill:
+            return
+        self._spill.close()
+        self._spill = None
+        if unlink and self._spill_path:
+            self._spill_path.unlink(missing_ok=True)
+
+    def _append(self, row: dict[str, Any]) -> None:
+        if not self._spill:
+            return
+        self._spill.write(_dumps(row) + "\n")
+        self._spill.flush()
+        self._dirty = True
+        if time.monotonic() - self._synced_at >= self._fsync_interval:
+            self._sync()
+
+    def _sync(self) -> None:
+        if self._spill and self._dirty:
+            os.fsync(self._spill.fileno())
+            self._dirty = False
+            self._synced_at = time.monotonic()
+
+    def _rewrite_spill(self, rows: list[dict[str, Any]]) -> None:
+        """只保留尚未写库的记录"""
+        if not self._spill:
+            return
+        self._spill.seek(0)
+        self._spill.truncate()
+        for row in rows:
+            self._spill.write(_dumps(row) + "\n")
+        self._spill.flush()
+        self._dirty = True
+        self._sync()
+
+    def _adopt_orphans(self) -> None:
+        """接管已退出进程留下的 spill 文件（包括本进程上次崩溃前的）"""
+        assert self._spill is not None
+        for path in self._spill_dir.glob("usage-*.jsonl"):
+            if path == self._spill_path:
+                self._spill.seek(0)
+                rows = [_loads(line) for line in self._spill if line.strip()]
+                self._pending.extend(rows)
+                continue
+            with open(path) as f:
+                try:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    continue  # 仍被其它进程持有
+                rows = [_loads(line) for line in f if line.strip()]
+            self._pending.extend(rows)
+            for row in rows:
+                self._spill.write(_dumps(row) + "\n")
+            self._spill.flush()
+            os.fsync(self._spill.fileno())
+            path.unlink()
+            logger.info("Recovered %d usage records from %s", len(rows), path)
+
+
+def _write_rows(rows: list[dict[str, Any]]) -> int:
+    with Session(engine) as session:
+        return crud_sandbox_usage.create_many(session, rows=rows)
+
+
+def _dumps(row: dict[str, Any]) -> str:
+    return json.dumps(row, default=str)
+
+
+def _loads(line: str) -> dict[str, Any]:
+    row = json.loads(line)
+    row["id"] = uuid.UUID(row["id"])
+    row["user_id"] = uuid.UUID(row["user_id"])
+    row["executed_at"] = datetime.fromisoformat(row["executed_at"])
+    return row
+
+
+usage_buffer = UsageBuffer()
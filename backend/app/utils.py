@@ -1,4 +1,7 @@
+import base64
+import json
 import logging
+import uuid
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
@@ -121,3 +124,19 @@ def verify_password_reset_token(token: str) -> str | None:
         return str(decoded_token["sub"])
     except InvalidTokenError:
         return None
+
+
+def encode_cursor(at: datetime, id: uuid.UUID) -> str:
+    """把排序键 (时间, id) 编码成不透明的分页游标"""
+    raw = json.dumps([at.isoformat(), str(id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    """解析 encode_cursor 生成的游标，格式不对时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        at, id = json.loads(raw)
+        return datetime.fromisoformat(at), uuid.UUID(id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("Invalid cursor") from e
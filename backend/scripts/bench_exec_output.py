@@ -0,0 +1,98 @@
+"""
+Microbenchmark of the exec output read path (BoxedProcess._read_process_output).
+
+A plain python child prints N bytes followed by the end marker, the way a cell
+does inside a sandbox; we measure the API-side CPU and wall time spent reading
+it, against the previous 1 KiB decode-and-join loop.
+
+    python scripts/bench_exec_output.py            # 1 MB and 100 MB
+    python scripts/bench_exec_output.py 10 500     # sizes in MB
+"""
+
+import asyncio
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# 直接以脚本运行时 sys.path[0] 是 scripts/，把 backend 根目录加进去才能导入 app
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.services.boxed_process import BoxedProcess, _OutputCapture
+
+MARKER = "__COMPLETE_bench__"
+# 每行 100 字节，含多字节字符
+LINE = ("数据" * 8 + "x" * 75 + "\n").encode()
+
+
+def _child(size: int) -> str:
+    return (
+        "import sys\n"
+        f"line = {LINE!r}\n"
+        f"for _ in range({size // len(LINE)}):\n"
+        "    sys.stdout.buffer.write(line)\n"
+        f"sys.stdout.buffer.write(b'{MARKER}\\n')\n"
+        "sys.stdout.flush()\n"
+        "sys.stdin.read()\n"
+    )
+
+
+async def _legacy(process: asyncio.subprocess.Process) -> int:
+    """改动前的读取方式：每 1 KiB 解码一次，拼接后查找 marker"""
+    buffer: list[str] = []
+    while True:
+        data = await process.stdout.read(1024)
+        if not data:
+            break
+        buffer.append(data.decode("utf-8", errors="replace"))
+        if MARKER in buffer[-1]:
+            break
+    output = "".join(buffer)
+    return len(output[: output.find(MARKER)].rstrip())
+
+
+async def _current(process: asyncio.subprocess.Process, limit: int, tmp: Path) -> int:
+    box = BoxedProcess("bench")
+    box.process = process
+    out = _OutputCapture(tmp / "stdout", limit=limit)
+    err = _OutputCapture(tmp / "stderr", limit=limit)
+    try:
+        await box._read_process_output(MARKER, out, err, timeout=600)
+    finally:
+        await out.aclose()
+        await err.aclose()
+        box.process = None
+    return len(out.text())
+
+
+async def _run(size: int, mode: str, tmp: Path) -> tuple[float, float]:
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-c",
+        _child(size),
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    cpu, wall = time.process_time(), time.perf_counter()
+    if mode == "legacy":
+        await _legacy(process)
+    else:
+        await _current(process, size * 2 if mode == "inline" else 1024 * 1024, tmp)
+    cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    process.stdin.close()
+    await process.wait()
+    return cpu, wall
+
+
+async def main(sizes_mb: list[int]) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{'size':>8} {'mode':>8} {'cpu s':>8} {'wall s':>8}")
+        for mb in sizes_mb:
+            for mode in ("legacy", "inline", "spill"):
+                cpu, wall = await _run(mb * 1000 * 1000, mode, Path(tmp))
+                print(f"{mb:>6}MB {mode:>8} {cpu:>8.3f} {wall:>8.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main([int(a) for a in sys.argv[1:]] or [1, 100]))
@@ -0,0 +1,34 @@
+#! /usr/bin/env bash
+
+set -e
+
+# The sandbox host owns every box; API workers reach it over a Unix socket
+export BOXED_HOST_SOCKET="${BOXED_HOST_SOCKET:-/run/steprun/boxed.sock}"
+
+python -m app.services.boxed_host &
+host_pid=$!
+
+for _ in $(seq 1 100); do
+    [ -S "$BOXED_HOST_SOCKET" ] && break
+    kill -0 $host_pid || exit 1
+    sleep 0.1
+done
+
+fastapi run --workers "${WEB_WORKERS:-4}" app/main.py &
+api_pid=$!
+
+# stop the API before the host so in-flight requests can finish
+shutdown() {
+    kill -TERM $api_pid 2>/dev/null || true
+    wait $api_pid || true
+    kill -TERM $host_pid 2>/dev/null || true
+    wait $host_pid || true
+}
+trap 'shutdown; exit 0' TERM INT
+
+# if either process dies, take the other one down too
+set +e
+wait -n $api_pid $host_pid
+status=$?
+shutdown
+exit $status